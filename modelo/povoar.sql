@@ -27,6 +27,9 @@ CREATE TABLE IF NOT EXISTS `autor` (
   PRIMARY KEY (`cpf`))
 ENGINE = InnoDB;
 
+SHOW WARNINGS;
+CREATE FULLTEXT INDEX `ft_autor_nome` ON `autor` (`nome`);
+
 SHOW WARNINGS;
 
 -- -----------------------------------------------------
@@ -49,6 +52,9 @@ ENGINE = InnoDB;
 SHOW WARNINGS;
 CREATE UNIQUE INDEX `nickname_UNIQUE` ON `usuario` (`nickname` ASC) VISIBLE;
 
+SHOW WARNINGS;
+CREATE FULLTEXT INDEX `ft_usuario_nome` ON `usuario` (`nome`);
+
 SHOW WARNINGS;
 
 -- -----------------------------------------------------
@@ -208,6 +214,12 @@ PACK_KEYS = DEFAULT;
 SHOW WARNINGS;
 CREATE INDEX `fk_livro_categoria1_idx` ON `livro` (`cod_categoria` ASC) VISIBLE;
 
+SHOW WARNINGS;
+CREATE FULLTEXT INDEX `ft_livro_titulo` ON `livro` (`titulo`);
+
+SHOW WARNINGS;
+CREATE FULLTEXT INDEX `ft_livro_editora` ON `livro` (`editora`);
+
 SHOW WARNINGS;
 
 -- -----------------------------------------------------
@@ -302,6 +314,50 @@ CREATE INDEX `fk_usuario_has_livro_livro2_idx` ON `reserva` (`isbn` ASC) VISIBLE
 SHOW WARNINGS;
 CREATE INDEX `fk_usuario_has_livro_usuario2_idx` ON `reserva` (`matricula` ASC) VISIBLE;
 
+SHOW WARNINGS;
+
+-- -----------------------------------------------------
+-- Tabela de resumo `resumo_livro_autores` (view_livro_autores materializada)
+-- Mantida por teca/materializacao.py
+-- -----------------------------------------------------
+DROP TABLE IF EXISTS `resumo_livro_autores` ;
+
+SHOW WARNINGS;
+CREATE TABLE IF NOT EXISTS `resumo_livro_autores` (
+  `isbn` CHAR(13) NOT NULL,
+  `titulo` VARCHAR(100) NOT NULL,
+  `autores` TEXT NOT NULL,
+  PRIMARY KEY (`isbn`))
+ENGINE = InnoDB;
+
+SHOW WARNINGS;
+CREATE INDEX `idx_resumo_livro_autores_titulo` ON `resumo_livro_autores` (`titulo` ASC) VISIBLE;
+
+SHOW WARNINGS;
+
+-- -----------------------------------------------------
+-- Tabela de resumo `resumo_reserva_livro` (view_reserva_livro materializada)
+-- Mantida por teca/materializacao.py
+-- -----------------------------------------------------
+DROP TABLE IF EXISTS `resumo_reserva_livro` ;
+
+SHOW WARNINGS;
+CREATE TABLE IF NOT EXISTS `resumo_reserva_livro` (
+  `matricula` INT NOT NULL,
+  `isbn` CHAR(13) NOT NULL,
+  `titulo` VARCHAR(100) NOT NULL,
+  `nome_usuario` VARCHAR(100) NOT NULL,
+  `data_de_reserva` DATETIME NOT NULL,
+  `data_contemplado` DATETIME NULL,
+  PRIMARY KEY (`matricula`, `isbn`))
+ENGINE = InnoDB;
+
+SHOW WARNINGS;
+CREATE INDEX `idx_resumo_reserva_livro_titulo` ON `resumo_reserva_livro` (`titulo` ASC, `data_de_reserva` ASC) VISIBLE;
+
+SHOW WARNINGS;
+CREATE INDEX `idx_resumo_reserva_livro_isbn` ON `resumo_reserva_livro` (`isbn` ASC) VISIBLE;
+
 SHOW WARNINGS;
 USE `equipe385145` ;
 
@@ -737,3 +793,25 @@ INSERT INTO `reserva` (`matricula`, `isbn`, `data_de_reserva`, `data_contemplado
 
 COMMIT;
 
+
+-- -----------------------------------------------------
+-- Dados das tabelas de resumo (veja teca/materializacao.py)
+-- -----------------------------------------------------
+START TRANSACTION;
+USE `equipe385145`;
+DELETE FROM `resumo_livro_autores`;
+INSERT INTO `resumo_livro_autores` (`isbn`, `titulo`, `autores`)
+SELECT l.isbn, l.titulo, GROUP_CONCAT(a.nome ORDER BY a.nome SEPARATOR ', ')
+FROM autor_livro al
+JOIN livro l ON l.isbn = al.livro_isbn
+JOIN autor a ON a.cpf = al.autor_cpf
+GROUP BY l.isbn, l.titulo;
+DELETE FROM `resumo_reserva_livro`;
+INSERT INTO `resumo_reserva_livro` (`matricula`, `isbn`, `titulo`, `nome_usuario`, `data_de_reserva`, `data_contemplado`)
+SELECT r.matricula, r.isbn, l.titulo, u.nome, r.data_de_reserva, r.data_contemplado
+FROM reserva r
+JOIN livro l ON l.isbn = r.isbn
+JOIN usuario u ON u.matricula = r.matricula;
+
+COMMIT;
+
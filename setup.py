@@ -19,11 +19,11 @@ setup(
     classifiers=[
         "Environment :: Console",
         "Topic :: Utilities",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
     ],
     # Pegas as strings a partir de http://pypi.python.org/pypi?%3Aaction=list_classifiers
     keywords='teca databases library',
+    python_requires='>=3.7',
     author=teca.__author__,
     author_email=teca.__email__,
     packages=find_packages(exclude=['ez_setup', 'examples',
@@ -31,7 +31,9 @@ setup(
     install_requires=install_requires,
     entry_points={
         'console_scripts': [
-            'teca = teca.main:main'
+            'teca = teca.main:main',
+            'teca-fila = teca.fila:main',
+            'teca-materializacao = teca.materializacao:main',
         ]
     },
 )
@@ -11,6 +11,7 @@ Utiliza:
 from teca import database
 from teca import term
 from teca import check
+from teca import instrumentacao
 import getpass
 from mysql.connector.errors import DatabaseError
 
@@ -94,14 +95,13 @@ def admin_inserir():
 
     status = None
     try:
-        status = instancia.insert()
-        if tabela_escolhida._table == 'usuario' and status:
-            usuario_extra.insert()
+        with database.Database.transaction():
+            status = instancia.insert()
+            if tabela_escolhida._table == 'usuario':
+                usuario_extra.insert()
     except DatabaseError as e:
         print("Não foi possível completar a ação. Uma exceção foi disparada!")
         print("Exceção: ", e)
-        if status:
-            instancia.delete()
         return
 
     if status:
@@ -170,16 +170,17 @@ def tela_admin():
         print("Opções: ")
         opcao = term.menu_enumeracao(opcoes)
         try:
-            if opcao == '0':
-                break
-            elif opcao == '1':
-                admin_inserir()
-            elif opcao == '2':
-                admin_remover()
-            elif opcao == '3':
-                admin_alterar()
-            elif opcao == '4':
-                admin_imprimir()
+            with instrumentacao.acao(opcoes.get(opcao, opcao)):
+                if opcao == '0':
+                    break
+                elif opcao == '1':
+                    admin_inserir()
+                elif opcao == '2':
+                    admin_remover()
+                elif opcao == '3':
+                    admin_alterar()
+                elif opcao == '4':
+                    admin_imprimir()
         except KeyboardInterrupt:
             print("\nOperação interrompida!")
 8
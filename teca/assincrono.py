@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Interface assíncrona (asyncio) com o SGBD.
+
+Permite que um único event loop atenda muitas consultas concorrentes,
+como centenas de buscas no catálogo ao mesmo tempo. A API segue a de
+database.Tabela, com os métodos como corrotinas:
+
+>>> from teca import assincrono
+>>> livro = await assincrono.Livro.select('9788576082675')
+>>> async for emprestimo in assincrono.Emprestimo.iter_all():
+...     print(emprestimo.isbn)
+
+O driver MySQL é bloqueante, então cada operação numa conexão é
+executada num pool de threads (loop.run_in_executor), enquanto o event
+loop segue livre. As conexões vêm de um pool assíncrono (AsyncPool)
+e cada uma é usada por uma única tarefa por vez.
+
+As consultas SQL são as mesmas geradas (e guardadas em cache) pelas
+classes de database.Tabela, e os objetos retornados são instâncias
+dessas classes. As escritas notificam database.on_write no executor,
+pois as funções registradas fazem consultas bloqueantes; dentro de um
+bloco transaction, as notificações são enviadas após o commit (veja
+AsyncDatabase.notify_write).
+
+Para testes, AsyncDatabase aceita uma fábrica de conexões (factory)
+qualquer que siga a DB-API com parâmetros no formato %s, como o
+adaptador para o SQLite de teca.benchmark (veja tests/test_assincrono.py).
+
+Requer Python 3.7 ou superior.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector as mysql_driver
+from mysql.connector.errors import PoolError
+from teca import database
+
+
+class AsyncPool(object):
+
+    """Pool assíncrono de conexões reutilizáveis com o SGBD.
+
+    Mantém até `size` conexões abertas. Quando todas estão em uso,
+    as tarefas aguardam (sem bloquear o event loop) por até `timeout`
+    segundos até que uma conexão seja devolvida.
+
+    Parâmetros
+    ----------
+    factory: função bloqueante que abre uma nova conexão.
+    run: corrotina que executa uma função bloqueante fora do event loop,
+    como AsyncDatabase.run.
+    """
+
+    def __init__(self, factory, run, size=10, timeout=30):
+        self.factory = factory
+        self.run = run
+        self.size = size
+        self.timeout = timeout
+        self.created = 0
+        self.closed = False
+        self._idle = None  # asyncio.Queue, criada no event loop em uso
+
+    @property
+    def idle(self):
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+        return self._idle
+
+    async def acquire(self):
+        """Retira uma conexão do pool, abrindo uma nova se possível."""
+        if self.closed:
+            raise PoolError("AsyncPool: pool is closed")
+        try:
+            return self.idle.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+        if self.created < self.size:
+            self.created += 1
+            try:
+                return await self.run(self.factory)
+            except Exception:
+                self.created -= 1
+                raise
+        try:
+            return await asyncio.wait_for(self.idle.get(), self.timeout)
+        except asyncio.TimeoutError:
+            raise PoolError(f"AsyncPool: no connection available "
+                            f"after {self.timeout}s (size={self.size})")
+
+    async def discard(self, conn):
+        """Fecha uma conexão, liberando espaço no pool para outra."""
+        self.created -= 1
+        try:
+            await self.run(conn.close)
+        except Exception:
+            pass
+
+    async def release(self, conn):
+        """Devolve uma conexão ao pool, desfazendo transações pendentes."""
+        if self.closed:
+            await self.discard(conn)
+            return
+        try:
+            await self.run(conn.rollback)
+        except Exception:
+            await self.discard(conn)
+        else:
+            self.idle.put_nowait(conn)
+
+    @contextlib.asynccontextmanager
+    async def checkout(self):
+        """Retira uma conexão e a devolve ao final do bloco async with."""
+        conn = await self.acquire()
+        try:
+            yield conn
+        finally:
+            await self.release(conn)
+
+    async def close(self):
+        """Fecha todas as conexões ociosas e recusa novas retiradas."""
+        self.closed = True
+        while self._idle is not None and not self._idle.empty():
+            await self.discard(self._idle.get_nowait())
+
+
+class AsyncDatabase(object):
+
+    """Versão assíncrona de database.Database.
+
+    Parâmetros
+    ----------
+    factory: função que abre uma nova conexão. Por padrão, uma conexão
+    com o MySQL (veja new_connection).
+    executor: executor das operações bloqueantes. Por padrão, um pool
+    de threads do mesmo tamanho do pool de conexões.
+    """
+
+    instance = None
+    pool_size = 10
+    use_fulltext = True
+
+    def __init__(self, database, user, password, pool_size=None,
+                 factory=None, executor=None):
+        self.database = database
+        self.user = user
+        self.password = password
+        self.pool_size = pool_size or self.pool_size
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=self.pool_size, thread_name_prefix='teca-async')
+        self.pool = AsyncPool(factory or self.new_connection, self.run,
+                              size=self.pool_size)
+        self._transaction = contextvars.ContextVar('teca_async_transaction',
+                                                   default=None)
+        self.missing_fulltext = set()  # veja Database.missing_fulltext
+
+    def new_connection(self):
+        """Abre uma nova conexão com o SGBD, utilizada pelo pool."""
+        return mysql_driver.connect(user=self.user, password=self.password,
+                                    host='localhost',
+                                    database=self.database)
+
+    @classmethod
+    def connect(cls):
+        """Retorna a instância padrão (Singleton), como Database.connect."""
+        if not cls.instance:
+            cls.instance = AsyncDatabase('equipe385145', 'root', 'root')
+        return cls.instance
+
+    async def run(self, function, *args):
+        """Executa uma função bloqueante no executor, fora do event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor,
+                                          functools.partial(function, *args))
+
+    @property
+    def in_transaction(self):
+        return self._transaction.get() is not None
+
+    async def notify_write(self, table, operation, instances=()):
+        """Notifica as funções de database.on_write, fora do event loop.
+
+        As funções registradas fazem consultas bloqueantes numa conexão
+        síncrona, que não enxerga as escritas ainda não confirmadas.
+        Dentro de um bloco transaction, as notificações são guardadas e
+        enviadas após o commit; se a transação é desfeita, descartadas.
+        """
+        transaction = self._transaction.get()
+        if transaction is not None:
+            # cópias: os valores antigos (old) são descartados na escrita
+            transaction[1].append((table, operation,
+                                   [_snapshot(i) for i in instances]))
+        else:
+            await self.run(database.notify_write, table, operation,
+                           instances)
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        """Conexão da transação da tarefa atual, ou uma retirada do pool."""
+        transaction = self._transaction.get()
+        if transaction is not None:
+            yield transaction[0]
+        else:
+            async with self.pool.checkout() as conn:
+                yield conn
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """Executa as escritas do bloco numa única transação.
+
+        Semelhante a Database.transaction: as escritas feitas pela tarefa
+        dentro do bloco usam a mesma conexão e um único commit é feito
+        ao final; se uma exceção ocorrer, tudo é desfeito. Blocos
+        aninhados fazem parte da transação mais externa.
+
+        Ex.:
+        >>> async with db.transaction():
+        ...     await assincrono.Usuario.insert(usuario)
+        ...     await assincrono.Aluno.insert(aluno)
+        """
+        if self.in_transaction:
+            yield self
+            return
+        notifications = []
+        async with self.pool.checkout() as conn:
+            token = self._transaction.set((conn, notifications))
+            try:
+                yield self
+                await self.run(conn.commit)
+            except BaseException:
+                await self.run(conn.rollback)
+                raise
+            finally:
+                self._transaction.reset(token)
+        for notification in notifications:
+            await self.notify_write(*notification)
+
+    @staticmethod
+    def _execute(conn, sql, params, fetch):
+        """Executa uma consulta (bloqueante) e lê todo o resultado."""
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall() if fetch else cursor.rowcount
+        finally:
+            cursor.close()
+
+    async def query(self, sql, params=()):
+        """Realiza uma consulta SQL e retorna a lista de tuplas."""
+        async with self.connection() as conn:
+            return await self.run(self._execute, conn, sql, params, True)
+
+    async def stream(self, sql, params=(), batch_size=500):
+        """Itera (async for) sobre o resultado em lotes de batch_size."""
+        async with self.connection() as conn:
+            cursor = conn.cursor(buffered=False)
+            try:
+                await self.run(cursor.execute, sql, params)
+                while True:
+                    rows = await self.run(cursor.fetchmany, batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield row
+            finally:
+                try:
+                    await self.run(cursor.close)
+                except Exception:
+                    pass
+
+    async def first_result(self, sql, params=()):
+        """Realiza uma consulta e retorna o primeiro resultado, ou None."""
+        rows = await self.query(sql, params)
+        return rows[0] if rows else None
+
+    async def unsafe_commit(self, sql, params=()):
+        """Semelhante a commit, mas a exceção é propagada."""
+        if self.in_transaction:
+            conn, _ = self._transaction.get()
+            return await self._write(conn, sql, params)
+        async with self.pool.checkout() as conn:
+            rowcount = await self._write(conn, sql, params)
+            await self.run(conn.commit)
+            return rowcount
+
+    async def _write(self, conn, sql, params):
+        return await self.run(self._execute, conn, sql, params, False)
+
+    async def commit(self, sql, params=()):
+        """Realiza uma consulta SQL seguida de commit.
+
+        Como Database.commit: retorna True se tudo ocorre bem; do
+        contrário exibe o erro e retorna False (o pool desfaz a
+        transação ao receber a conexão de volta). Dentro de um bloco
+        transaction, as exceções são propagadas.
+        """
+        if self.in_transaction:
+            await self.unsafe_commit(sql, params)
+            return True
+        try:
+            await self.unsafe_commit(sql, params)
+        except Exception as e:
+            err_name = e.__class__.__name__
+            print(f"Warning: AsyncDatabase.commit: {err_name}: {e}")
+            return False
+        return True
+
+    async def close(self):
+        """Fecha as conexões do pool e o executor."""
+        await self.pool.close()
+        self.executor.shutdown(wait=False)
+
+
+def _snapshot(instance):
+    """Cópia de um objeto com os valores atuais e os antigos (old)."""
+    copy = type(instance)(*instance._values)
+    copy._old = instance._old
+    return copy
+
+
+class AsyncTabela(object):
+
+    """Métodos assíncronos de uma classe de database.Tabela.
+
+    As consultas são geradas pela própria classe (tabela) e os objetos
+    retornados são instâncias dela. Como acessar uma coluna adiada
+    (veja Tabela._deferred) faria uma consulta bloqueante, por padrão
+    todas as colunas são selecionadas; columns restringe a seleção.
+
+    O identity_map e os relacionamentos (prefetch) são exclusivos da
+    interface síncrona.
+    """
+
+    tabela = None
+    database = None  # por padrão, AsyncDatabase.connect()
+
+    @classmethod
+    def db(cls):
+        return cls.database or AsyncDatabase.connect()
+
+    @classmethod
+    def _columns(cls, columns):
+        return cls.tabela._columns if columns is None else columns
+
+    @classmethod
+    async def select(cls, pk, unpack=True, columns=None):
+        """Versão assíncrona de Tabela.select."""
+        tabela = cls.tabela
+        not_scalar = any(isinstance(pk, t) for t in [list, tuple])
+        keys = len(pk) if not_scalar else 1
+        params = tuple(pk) if not_scalar else (pk,)
+        sql, indexes = tabela._select_sql(tabela._columns[0:keys],
+                                          cls._columns(columns))
+        rows = await cls.db().query(sql, params)
+        instances = [tabela._from_row(r, indexes) for r in rows]
+        if unpack:
+            return instances[0] if instances else None
+        return instances
+
+    @classmethod
+    async def filter(cls, pk=None, columns=None, **kwargs):
+        """Versão assíncrona de Tabela.filter."""
+        if pk is not None:
+            return await cls.select(pk, unpack=False, columns=columns)
+        elif len(kwargs) > 0:
+            where_columns, values = zip(*kwargs.items())
+            sql, indexes = cls.tabela._select_sql(where_columns,
+                                                  cls._columns(columns))
+            rows = await cls.db().query(sql, values)
+            return [cls.tabela._from_row(r, indexes) for r in rows]
+        else:
+            raise ValueError("AsyncTabela.filter: must have at least 1 arg, got 0.")  # noqa
+
+    @classmethod
+    async def select_all(cls, columns=None):
+        """Versão assíncrona de Tabela.select_all."""
+        sql, indexes = cls.tabela._select_all_sql(cls._columns(columns))
+        rows = await cls.db().query(sql)
+        if not rows:
+            return None
+        return [cls.tabela._from_row(r, indexes) for r in rows]
+
+    @classmethod
+    async def iter_all(cls, batch_size=500, columns=None):
+        """Versão assíncrona de Tabela.iter_all, para uso com async for."""
+        sql, indexes = cls.tabela._select_all_sql(cls._columns(columns))
+        async for row in cls.db().stream(sql, batch_size=batch_size):
+            yield cls.tabela._from_row(row, indexes)
+
+    @classmethod
+    async def select_many(cls, pks, columns=None):
+        """Versão assíncrona de Tabela.select_many.
+
+        Os blocos de IN (...) são consultados concorrentemente.
+        """
+        tabela = cls.tabela
+        primary_key = tabela._primary_key
+        composite = len(primary_key) > 1
+        column = primary_key if composite else primary_key[0]
+        keys = {str(pk): tuple(pk) if composite else pk for pk in pks}
+        queries = tabela._select_in_sql(column, keys.values(),
+                                        cls._columns(columns))
+        db = cls.db()
+        results = await asyncio.gather(*[db.query(sql, params)
+                                         for sql, params, _ in queries])
+        _, indexes = tabela._projection(cls._columns(columns))
+        result = {}
+        for rows in results:
+            for row in rows:
+                instance = tabela._from_row(row, indexes)
+                pk = tuple(getattr(instance, k) for k in primary_key)
+                result[pk if composite else pk[0]] = instance
+        return result
+
+    @classmethod
+    async def search(cls, string, attrs=(), limit=None):
+        """Versão assíncrona de Tabela.search.
+
+        Se a tabela possui um índice de busca em memória já construído
+        (veja o módulo indice.py), ele é usado diretamente. Como nos
+        demais métodos, todas as colunas são selecionadas, inclusive as
+        de _deferred, para que nenhum acesso aos objetos retornados faça
+        uma consulta bloqueante.
+        """
+        tabela = cls.tabela
+        index = tabela._search_index
+        if index is not None and index.construido:
+            return await cls._undefer(index.search(string, attrs, limit))
+
+        # procura por chave
+        row = await cls.select(string)
+        if row:
+            return [row]
+
+        # procure por atributo (igual)
+        for attr in attrs:
+            if attr not in tabela._columns:
+                continue
+            rows = await cls.filter(**{attr: string})
+            if len(rows) == 1:
+                return rows
+
+        # procura por substrings para cada atributo passado
+        limit = limit or tabela.search_limit
+        db = cls.db()
+        candidates = []
+        if tabela._fulltext_enabled(db):
+            try:
+                candidates = await cls._search_substring(string, attrs,
+                                                         limit, True)
+            except database.DatabaseError as e:
+                tabela._fulltext_error(db, e)
+        if len(candidates) < limit:
+            more = await cls._search_substring(string, attrs,
+                                               limit + len(candidates), False)
+            candidates = tabela._merge_search(candidates, more, limit)
+        return candidates
+
+    @classmethod
+    async def _undefer(cls, instances):
+        """Carrega as colunas adiadas de objetos lidos pela interface
+        síncrona (ex.: do índice de busca), numa consulta assíncrona."""
+        tabela = cls.tabela
+        primary_key = tabela._primary_key
+        pendentes = [i for i in instances
+                     if any(v is database.DEFERRED for v in i._values)]
+        if not pendentes:
+            return instances
+
+        def pk_of(instance):
+            pk = tuple(getattr(instance, k) for k in primary_key)
+            return pk if len(primary_key) > 1 else pk[0]
+
+        carregados = await cls.select_many([pk_of(i) for i in pendentes])
+        for instance in pendentes:
+            loaded = carregados.get(pk_of(instance))
+            if loaded is not None:
+                instance._fill(loaded)
+        return instances
+
+    @classmethod
+    async def _search_substring(cls, string, attrs, limit, fulltext):
+        query = cls.tabela._search_sql(string, attrs, limit, fulltext,
+                                       cls.tabela._columns)
+        if query is None:
+            return []
+        sql, params, indexes = query
+        rows = await cls.db().query(sql, params)
+        return [cls.tabela._from_row(r, indexes) for r in rows]
+
+    @classmethod
+    async def insert(cls, instance):
+        """Versão assíncrona de Tabela.insert."""
+        columns, values = zip(*instance.items())
+        status = await cls.db().commit(instance._insert_sql(columns),
+                                       tuple(values))
+        if status:
+            await cls.db().notify_write(cls.tabela, 'insert', [instance])
+            instance._reset_old()
+        return status
+
+    @classmethod
+    async def update(cls, instance):
+        """Versão assíncrona de Tabela.update."""
+        columns = tuple(instance.dirty())
+        if not columns:
+            return True
+        sql, params = instance._update_sql(columns)
+        status = await cls.db().commit(sql, params)
+        if status:
+            await cls.db().notify_write(cls.tabela, 'update', [instance])
+            instance._reset_old()
+        return status
+
+    @classmethod
+    async def delete(cls, instance):
+        """Versão assíncrona de Tabela.delete."""
+        pk = tuple(getattr(instance, k) for k in cls.tabela._primary_key)
+        status = await cls.db().commit(instance._delete_sql(), pk)
+        if status:
+            await cls.db().notify_write(cls.tabela, 'delete', [instance])
+        return status
+
+
+def assincrona(tabela):
+    """Cria a classe assíncrona (AsyncTabela) de uma classe de Tabela."""
+    return type(tabela.__name__, (AsyncTabela,),
+                {'tabela': tabela,
+                 '__doc__': f'Versão assíncrona de database.{tabela.__name__}.'})  # noqa
+
+
+Usuario = assincrona(database.Usuario)
+Aluno = assincrona(database.Aluno)
+Professor = assincrona(database.Professor)
+Funcionario = assincrona(database.Funcionario)
+Livro = assincrona(database.Livro)
+Reserva = assincrona(database.Reserva)
+Emprestimo = assincrona(database.Emprestimo)
+Telefones = assincrona(database.Telefones)
+Autor = assincrona(database.Autor)
+AutorLivro = assincrona(database.AutorLivro)
+Curso = assincrona(database.Curso)
+Categoria = assincrona(database.Categoria)
@@ -0,0 +1,694 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Benchmarks do ORM e das operações do sistema.
+
+São dois benchmarks:
+
+- operacoes: gera um acervo sintético e determinístico (usuários, livros,
+  autores, empréstimos e reservas, respeitando o esquema de
+  modelo/povoar.sql), e mede a latência (percentis) e a quantidade de
+  consultas SQL de operações como Tabela.search, Livro.disponiveis,
+  check.emprestimo, bibliotecario.fila_anda e views.imprimir_consulta.
+  Por padrão é utilizado um SQLite local no lugar do MySQL (veja
+  SQLiteDatabase); com --mysql, o banco configurado em
+  Database.connect(). Os resultados podem ser salvos em JSON e
+  comparados com os de uma execução anterior.
+
+- memoria: compara o consumo de memória por objeto da representação
+  compacta das classes de Tabela (valores numa tupla, sem __dict__) com
+  a representação antiga, em que cada objeto guardava os valores num
+  __dict__ e uma cópia deles num dicionário self.old.
+
+Ex.:
+
+    $ python -m teca.benchmark operacoes --usuarios 2000 --saida antes.json
+    $ python -m teca.benchmark operacoes --usuarios 2000 --comparar antes.json
+    $ python -m teca.benchmark memoria 100000
+"""
+
+import argparse
+import contextlib
+import datetime
+import gc
+import io
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from teca import database
+
+
+# ---------------------------------------------------------------------------
+# Gerador de dados sintéticos
+# ---------------------------------------------------------------------------
+
+PRENOMES = ['Ana', 'Bruno', 'Carla', 'Daniel', 'Eduarda', 'Felipe',
+            'Gabriela', 'Heitor', 'Isabela', 'João', 'Larissa', 'Manoel',
+            'Natália', 'Otávio', 'Paula', 'Rafael', 'Samuel', 'Tatiane',
+            'Vinícius', 'Yasmin', 'Gerônimo', 'Luíza', 'Marcos', 'Cecília']
+SOBRENOMES = ['Silva', 'Souza', 'Oliveira', 'Pereira', 'Lima', 'Carvalho',
+              'Ferreira', 'Rodrigues', 'Almeida', 'Costa', 'Gomes', 'Martins',
+              'Araújo', 'Ribeiro', 'Vilela', 'Aguiar', 'Hericles', 'Barbosa',
+              'Rocha', 'Dias', 'Nascimento', 'Moreira', 'Cavalcante', 'Mendes']
+PALAVRAS = ['Sistemas', 'Banco', 'Dados', 'Algoritmos', 'Redes',
+            'Computadores', 'Introdução', 'Programação', 'Estruturas',
+            'Cálculo', 'Física', 'Química', 'Engenharia', 'Software',
+            'Teoria', 'Grafos', 'Compiladores', 'Linguagens', 'Análise',
+            'Projeto', 'Arquitetura', 'Operacionais', 'Distribuídos',
+            'Inteligência', 'Artificial', 'Aprendizado', 'Máquina',
+            'Matemática', 'Discreta', 'Probabilidade', 'Estatística',
+            'Segurança', 'Criptografia', 'Otimização', 'Numérico']
+CONECTIVOS = ['de', 'e', 'para', 'em', 'com']
+EDITORAS = ['Pearson', 'Bookman', 'Elsevier', 'LTC', 'Novatec', 'Campus',
+            'Addison-Wesley', "O'Reilly", 'Cengage', 'Saraiva', 'Blucher']
+NACIONALIDADES = ['brasileira', 'americana', 'inglesa', 'portuguesa',
+                  'alemã', 'francesa', 'indiana', 'canadense']
+CATEGORIAS = ['Computação', 'Matemática', 'Física', 'Química', 'Engenharia',
+              'Estatística', 'Administração', 'Letras', 'Biologia', 'Direito']
+CURSOS = ['Ciência da Computação', 'Engenharia de Computação',
+          'Engenharia Elétrica', 'Matemática Industrial', 'Física',
+          'Química', 'Estatística', 'Sistemas de Informação']
+
+
+def _nome(rng):
+    return (f'{rng.choice(PRENOMES)} {rng.choice(SOBRENOMES)} '
+            f'{rng.choice(SOBRENOMES)}')
+
+
+def _titulo(rng):
+    palavras = [rng.choice(PALAVRAS)]
+    for _ in range(rng.randint(1, 4)):
+        if rng.random() < 0.3:
+            palavras.append(rng.choice(CONECTIVOS))
+        palavras.append(rng.choice(PALAVRAS))
+    return ' '.join(palavras)[:100]
+
+
+def gerar(usuarios=1000, livros=2000, autores=500, semente=42, hoje=None):
+    """Gera um acervo sintético e determinístico.
+
+    Para a mesma semente e a mesma data de referência (hoje), os mesmos
+    objetos são gerados. As datas de empréstimos e reservas são relativas
+    a hoje, para que a proporção de empréstimos vencidos seja estável.
+
+    O esquema de modelo/povoar.sql é respeitado: valores dos ENUMs,
+    tamanhos das colunas, chaves únicas e estrangeiras, datas de conclusão
+    futuras (gatilho trg_1), o limite de empréstimos de cada tipo de
+    usuário (livros_max) e a quantidade de exemplares de cada livro.
+
+    Retorna uma lista de (classe de Tabela, lista de objetos), na ordem
+    em que devem ser inseridos.
+    """
+    rng = random.Random(semente)
+    hoje = hoje or datetime.date.today()
+
+    cursos = [database.Curso(i + 1, nome) for i, nome in enumerate(CURSOS)]
+    categorias = [database.Categoria(i + 1, descricao)
+                  for i, descricao in enumerate(CATEGORIAS)]
+
+    tabela_usuarios, alunos, professores, funcionarios = [], [], [], []
+    telefones = []
+    for i in range(usuarios):
+        matricula = 100000 + i
+        tipo = rng.choices(['aluno', 'professor', 'funcionario'],
+                           [80, 15, 5])[0]
+        if i == 0:
+            permissao = 'administrador'
+        elif tipo == 'funcionario' and rng.random() < 0.5:
+            permissao = 'bibliotecario'
+        else:
+            permissao = 'usuario'
+        nome = _nome(rng)
+        tabela_usuarios.append(database.Usuario(
+            matricula, f'u{matricula}', database.senha_hash(f'senha{i}'),
+            nome, f'Rua {rng.randint(1, 999)}, {rng.randint(1, 3000)}',
+            tipo, permissao))
+        curso = rng.randint(1, len(cursos))
+        if tipo == 'aluno':
+            ingresso = hoje - datetime.timedelta(days=rng.randint(0, 1800))
+            conclusao = hoje + datetime.timedelta(days=rng.randint(180, 1800))
+            alunos.append(database.Aluno(matricula, conclusao, ingresso,
+                                         curso))
+        elif tipo == 'professor':
+            contratacao = hoje - datetime.timedelta(days=rng.randint(0, 9000))
+            professores.append(database.Professor(
+                matricula, contratacao, rng.choice(['20H', '40H', 'DE']),
+                curso))
+        else:
+            funcionarios.append(database.Funcionario(matricula))
+        for numero in rng.sample(range(10 ** 8), rng.randint(0, 2)):
+            telefones.append(database.Telefones(matricula,
+                                                f'859{numero:08d}'))
+
+    tabela_autores = []
+    for i in range(autores):
+        tabela_autores.append(database.Autor(
+            f'{10 ** 10 + i:011d}', _nome(rng)[:60],
+            rng.choice(NACIONALIDADES)))
+
+    tabela_livros, autor_livro = [], []
+    for i in range(livros):
+        isbn = f'{9780000000000 + i:013d}'
+        tabela_livros.append(database.Livro(
+            isbn, _titulo(rng), rng.randint(1970, hoje.year),
+            rng.choice(EDITORAS), rng.randint(1, 5),
+            rng.randint(1, len(categorias))))
+        for autor in rng.sample(tabela_autores, rng.randint(1, 3)):
+            autor_livro.append(database.AutorLivro(autor.cpf, isbn))
+
+    # empréstimos: limitados por livros_max e pelos exemplares de cada livro
+    limites = {'aluno': database.Aluno.livros_max,
+               'professor': database.Professor.livros_max,
+               'funcionario': database.Funcionario.livros_max}
+    exemplares = {livro.isbn: livro.qt_copias for livro in tabela_livros}
+    emprestimos, pares = [], set()
+    for usuario in tabela_usuarios:
+        quantidade = rng.randint(0, limites[usuario.tipo])
+        for livro in rng.sample(tabela_livros, quantidade):
+            if exemplares[livro.isbn] == 0:
+                continue
+            exemplares[livro.isbn] -= 1
+            pares.add((usuario.matricula, livro.isbn))
+            inicio = hoje - datetime.timedelta(days=rng.randint(0, 40))
+            devolucao = inicio + datetime.timedelta(days=15)
+            emprestimos.append(database.Emprestimo(
+                usuario.matricula, livro.isbn, inicio, devolucao))
+
+    # reservas: concentradas nos livros sem exemplares disponíveis
+    esgotados = [isbn for isbn, n in exemplares.items() if n == 0]
+    reservas = []
+    for usuario in tabela_usuarios:
+        if not esgotados or rng.random() > 0.3:
+            continue
+        for isbn in rng.sample(esgotados, min(len(esgotados), 2)):
+            if (usuario.matricula, isbn) in pares:
+                continue
+            pares.add((usuario.matricula, isbn))
+            instante = datetime.datetime.combine(
+                hoje - datetime.timedelta(days=rng.randint(0, 30)),
+                datetime.time(rng.randint(8, 21), rng.randint(0, 59)))
+            reservas.append(database.Reserva(usuario.matricula, isbn,
+                                             instante, None))
+
+    return [(database.Curso, cursos),
+            (database.Categoria, categorias),
+            (database.Usuario, tabela_usuarios),
+            (database.Aluno, alunos),
+            (database.Professor, professores),
+            (database.Funcionario, funcionarios),
+            (database.Telefones, telefones),
+            (database.Autor, tabela_autores),
+            (database.Livro, tabela_livros),
+            (database.AutorLivro, autor_livro),
+            (database.Emprestimo, emprestimos),
+            (database.Reserva, reservas)]
+
+
+def povoar(dados):
+    """Insere os dados gerados no banco de dados em lotes."""
+    for tabela, objetos in dados:
+        falhas = tabela.insert_many(objetos)
+        if falhas:
+            raise RuntimeError(f'povoar: {len(falhas)} lotes de '
+                               f'{tabela._table} falharam')
+
+
+# ---------------------------------------------------------------------------
+# SQLite no lugar do MySQL
+# ---------------------------------------------------------------------------
+
+ESQUEMA_SQLITE = '''
+CREATE TABLE autor (cpf CHAR(11) PRIMARY KEY, nome VARCHAR(60) NOT NULL,
+                    nacionalidade VARCHAR(45) NOT NULL);
+CREATE TABLE usuario (matricula INT PRIMARY KEY,
+                      nickname VARCHAR(45) UNIQUE,
+                      senha_hash CHAR(64) NOT NULL,
+                      nome VARCHAR(100) NOT NULL,
+                      endereco VARCHAR(100) NOT NULL,
+                      tipo TEXT NOT NULL
+                        CHECK (tipo IN ('aluno', 'professor', 'funcionario')),
+                      permissao TEXT NOT NULL
+                        CHECK (permissao IN ('administrador', 'bibliotecario',
+                                             'usuario')));
+CREATE TABLE curso (cod_curso INT PRIMARY KEY,
+                    nome_curso VARCHAR(45) NOT NULL);
+CREATE TABLE aluno (matricula INT PRIMARY KEY REFERENCES usuario,
+                    data_de_conclusao_prevista DATE NOT NULL,
+                    data_de_ingresso DATE NOT NULL,
+                    cod_curso INT NOT NULL REFERENCES curso);
+CREATE TABLE professor (mat_siape INT PRIMARY KEY REFERENCES usuario,
+                        data_de_contratacao DATE NOT NULL,
+                        regime_trabalho TEXT NOT NULL
+                          CHECK (regime_trabalho IN ('20H', '40H', 'DE')),
+                        cod_curso INT NOT NULL REFERENCES curso);
+CREATE TABLE funcionario (matricula INT PRIMARY KEY REFERENCES usuario);
+CREATE TABLE telefones (matricula INT NOT NULL REFERENCES usuario,
+                        numero CHAR(11) NOT NULL,
+                        PRIMARY KEY (matricula, numero));
+CREATE TABLE categoria (cod_categoria INT PRIMARY KEY,
+                        descricao VARCHAR(45) NOT NULL);
+CREATE TABLE livro (isbn CHAR(13) PRIMARY KEY, titulo VARCHAR(100) NOT NULL,
+                    ano INT NOT NULL, editora VARCHAR(45) NOT NULL,
+                    qt_copias INT NOT NULL,
+                    cod_categoria INT NOT NULL REFERENCES categoria);
+CREATE INDEX fk_livro_categoria1_idx ON livro (cod_categoria);
+CREATE TABLE autor_livro (autor_cpf CHAR(11) NOT NULL REFERENCES autor,
+                          livro_isbn CHAR(13) NOT NULL REFERENCES livro,
+                          PRIMARY KEY (autor_cpf, livro_isbn));
+CREATE INDEX fk_autor_has_livro_livro1_idx ON autor_livro (livro_isbn);
+CREATE TABLE emprestimo (matricula INT NOT NULL REFERENCES usuario,
+                         isbn CHAR(13) NOT NULL REFERENCES livro,
+                         data_de_emprestimo DATE NOT NULL,
+                         data_de_devolucao DATE NOT NULL,
+                         PRIMARY KEY (matricula, isbn));
+CREATE INDEX fk_usuario_has_livro_livro1_idx ON emprestimo (isbn);
+CREATE TABLE reserva (matricula INT NOT NULL REFERENCES usuario,
+                      isbn CHAR(13) NOT NULL REFERENCES livro,
+                      data_de_reserva TIMESTAMP NOT NULL,
+                      data_contemplado TIMESTAMP NULL,
+                      PRIMARY KEY (matricula, isbn));
+CREATE INDEX fk_usuario_has_livro_livro2_idx ON reserva (isbn);
+CREATE TABLE resumo_livro_autores (isbn CHAR(13) PRIMARY KEY,
+                                   titulo VARCHAR(100) NOT NULL,
+                                   autores TEXT NOT NULL);
+CREATE TABLE resumo_reserva_livro (matricula INT NOT NULL,
+                                   isbn CHAR(13) NOT NULL,
+                                   titulo VARCHAR(100) NOT NULL,
+                                   nome_usuario VARCHAR(100) NOT NULL,
+                                   data_de_reserva TIMESTAMP NOT NULL,
+                                   data_contemplado TIMESTAMP NULL,
+                                   PRIMARY KEY (matricula, isbn));
+
+CREATE VIEW view_professor_curso AS
+    SELECT usuario.nome AS nome, curso.nome_curso AS nome_curso
+    FROM professor
+    JOIN curso ON professor.cod_curso = curso.cod_curso
+    JOIN usuario ON professor.mat_siape = usuario.matricula
+    ORDER BY curso.cod_curso;
+CREATE VIEW view_livro_categoria AS
+    SELECT titulo, descricao AS nome_categoria
+    FROM livro NATURAL JOIN categoria ORDER BY descricao;
+CREATE VIEW view_livro_ano AS
+    SELECT titulo, ano FROM livro ORDER BY ano;
+CREATE VIEW view_livro_editora AS
+    SELECT titulo, editora FROM livro ORDER BY editora;
+CREATE VIEW view_livro_autores AS
+    SELECT titulo, GROUP_CONCAT(nome, ', ') AS autores
+    FROM autor_livro
+    JOIN livro ON isbn = livro_isbn
+    JOIN autor ON autor_cpf = cpf
+    GROUP BY titulo;
+CREATE VIEW view_reserva_livro AS
+    SELECT isbn, titulo, nome AS nome_usuario, data_de_reserva,
+           data_contemplado
+    FROM reserva NATURAL JOIN livro NATURAL JOIN usuario
+    ORDER BY titulo, data_de_reserva;
+'''
+
+
+def _parametro_sqlite(valor):
+    if isinstance(valor, datetime.datetime):
+        return valor.isoformat(' ')
+    if isinstance(valor, datetime.date):
+        return valor.isoformat()
+    return valor
+
+
+class CursorSQLite(object):
+
+    """Cursor do sqlite3 com a interface utilizada do driver MySQL."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, sql, params=()):
+        params = tuple(_parametro_sqlite(p) for p in params)
+        return self.cursor.execute(sql.replace('%s', '?'), params)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self.cursor.fetchmany(size)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    def close(self):
+        self.cursor.close()
+
+
+class ConexaoSQLite(object):
+
+    """Conexão do sqlite3 com a interface utilizada do driver MySQL.
+
+    Os parâmetros %s são convertidos para ? e as colunas DATE e
+    TIMESTAMP são lidas como objetos date e datetime, como no MySQL.
+    """
+
+    def __init__(self, caminho):
+        self.conn = sqlite3.connect(caminho, check_same_thread=False,
+                                    detect_types=sqlite3.PARSE_DECLTYPES)
+
+    def cursor(self, **kwargs):
+        return CursorSQLite(self.conn.cursor())
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+    def is_connected(self):
+        return True
+
+    @property
+    def in_transaction(self):
+        return self.conn.in_transaction
+
+
+class SQLiteDatabase(database.Database):
+
+    """Database que utiliza um arquivo SQLite no lugar do MySQL.
+
+    O esquema ESQUEMA_SQLITE reproduz as tabelas e views de
+    modelo/povoar.sql. Índices FULLTEXT não existem no SQLite, então
+    as buscas usam apenas LIKE.
+    """
+
+    use_fulltext = False
+
+    def __init__(self, caminho, pool_size=None):
+        super().__init__(caminho, None, None, pool_size=pool_size)
+
+    def new_connection(self):
+        return ConexaoSQLite(self.database)
+
+    @classmethod
+    def criar(cls, caminho=None):
+        """Cria o arquivo com o esquema e o define como Database padrão."""
+        if caminho is None:
+            fd, caminho = tempfile.mkstemp(prefix='teca-', suffix='.sqlite3')
+            os.close(fd)
+        conn = sqlite3.connect(caminho)
+        conn.executescript(ESQUEMA_SQLITE)
+        conn.close()
+        database.Database.instance = cls(caminho)
+        return database.Database.instance
+
+
+# ---------------------------------------------------------------------------
+# Operações medidas
+# ---------------------------------------------------------------------------
+
+class ContadorConsultas(object):
+
+    """Gancho de instrumentação que conta as consultas executadas."""
+
+    def __init__(self):
+        self.total = 0
+
+    def before(self, evento):
+        pass
+
+    def after(self, evento):
+        self.total += 1
+
+
+def operacoes(dados, semente=42):
+    """Cria as operações medidas, com entradas escolhidas de dados.
+
+    Retorna um dicionário {nome da operação: função sem parâmetros}.
+    """
+    from teca import check
+    from teca import bibliotecario
+    from teca import views
+
+    rng = random.Random(semente)
+    tabelas = dict(dados)
+    livros = tabelas[database.Livro]
+    usuarios = [u for u in tabelas[database.Usuario]
+                if u.permissao == 'usuario']
+
+    def palavra():
+        return rng.choice(rng.choice(livros).titulo.split())
+
+    def sobrenome():
+        return rng.choice(rng.choice(usuarios).nome.split()[1:])
+
+    def disponiveis():
+        livro = database.Livro.select(rng.choice(livros).isbn)
+        return livro.disponiveis
+
+    def emprestimo():
+        usuario = database.Usuario.select(rng.choice(usuarios).matricula)
+        livro = database.Livro.select(rng.choice(livros).isbn)
+        return check.emprestimo(usuario, livro)
+
+    def silencioso(funcao, *args):
+        def executar():
+            with contextlib.redirect_stdout(io.StringIO()):
+                return funcao(*args)
+        return executar
+
+    medidas = {
+        'Livro.search': lambda: database.Livro.search(
+            palavra(), ['titulo', 'editora', 'autores', 'categoria']),
+        'Usuario.search': lambda: database.Usuario.search(
+            sobrenome(), ['nome', 'nickname']),
+        'Livro.disponiveis': disponiveis,
+        'check.emprestimo': emprestimo,
+        'bibliotecario.fila_anda': silencioso(bibliotecario.fila_anda),
+    }
+    for view in ('view_livro_ano', 'view_livro_categoria',
+                 'view_livro_editora', 'view_livro_autores',
+                 'view_professor_curso', 'view_reserva_livro'):
+        medidas[f'views.{view}'] = silencioso(views.imprimir_consulta,
+                                              f'SELECT * FROM {view}')
+    return medidas
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) de uma lista ordenada, pelo posto mais próximo."""
+    if not valores:
+        return 0.0
+    posto = max(1, -(-len(valores) * p // 100))
+    return valores[int(posto) - 1]
+
+
+def medir_operacao(funcao, repeticoes=50, aquecimento=3):
+    """Mede a latência e a quantidade de consultas de uma operação."""
+    contador = database.instrument(ContadorConsultas())
+    try:
+        for _ in range(aquecimento):
+            funcao()
+        contador.total = 0
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            funcao()
+            tempos.append(time.perf_counter() - inicio)
+    finally:
+        database.remove_instrument(contador)
+    tempos.sort()
+    return {'repeticoes': repeticoes,
+            'media_ms': round(sum(tempos) / len(tempos) * 1000, 3),
+            'p50_ms': round(percentil(tempos, 50) * 1000, 3),
+            'p90_ms': round(percentil(tempos, 90) * 1000, 3),
+            'p99_ms': round(percentil(tempos, 99) * 1000, 3),
+            'max_ms': round(tempos[-1] * 1000, 3),
+            'consultas': round(contador.total / repeticoes, 2)}
+
+
+def executar(usuarios=1000, livros=2000, autores=500, semente=42,
+             repeticoes=50, mysql=False, indice=False, filtro=None):
+    """Gera os dados, povoa o banco e mede todas as operações.
+
+    Retorna um dicionário serializável em JSON com os resultados.
+    """
+    dados = gerar(usuarios, livros, autores, semente)
+    if mysql:
+        db = database.Database.connect()
+    else:
+        db = SQLiteDatabase.criar()
+    inicio = time.perf_counter()
+    povoar(dados)
+    carga = time.perf_counter() - inicio
+    if indice:
+        from teca import indice as modulo_indice
+        modulo_indice.ativar()
+
+    resultados = {}
+    try:
+        for nome, funcao in operacoes(dados, semente).items():
+            if filtro and filtro not in nome:
+                continue
+            resultados[nome] = medir_operacao(funcao, repeticoes)
+    finally:
+        if not mysql:
+            db.close()
+            database.Database.instance = None
+            os.remove(db.database)
+
+    return {'data': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'backend': 'mysql' if mysql else 'sqlite',
+            'parametros': {'usuarios': usuarios, 'livros': livros,
+                           'autores': autores, 'semente': semente,
+                           'repeticoes': repeticoes, 'indice': indice},
+            'tuplas': {t._table: len(o) for t, o in dados},
+            'carga_s': round(carga, 3),
+            'operacoes': resultados}
+
+
+def imprimir_resultados(resultados, anterior=None):
+    """Exibe os resultados, com a variação do p50 em relação a anterior."""
+    from tabulate import tabulate
+    linhas = []
+    for nome, r in resultados['operacoes'].items():
+        linha = [nome, r['p50_ms'], r['p90_ms'], r['p99_ms'], r['max_ms'],
+                 r['consultas']]
+        if anterior is not None:
+            antes = anterior['operacoes'].get(nome)
+            if antes and antes['p50_ms']:
+                linha.append(f"{r['p50_ms'] / antes['p50_ms']:.2f}x")
+            else:
+                linha.append('-')
+        linhas.append(linha)
+    headers = ['operação', 'p50 ms', 'p90 ms', 'p99 ms', 'máx ms',
+               'consultas']
+    if anterior is not None:
+        headers.append('p50 / anterior')
+    print(f"backend: {resultados['backend']}, tuplas: {resultados['tuplas']}")
+    print(f"carga: {resultados['carga_s']}s")
+    print(tabulate(linhas, headers, 'psql'))
+
+
+# ---------------------------------------------------------------------------
+# Memória por objeto
+# ---------------------------------------------------------------------------
+
+class Legado(object):
+
+    """Representação antiga dos objetos de Tabela, para comparação."""
+
+    def __init__(self, columns, *args):
+        self.old = {}
+        for k, v in zip(columns, args):
+            setattr(self, k, v)
+            self.old[k] = v
+
+
+def usuario(i):
+    """Gera a i-ésima tupla de usuario."""
+    return (100000 + i, f'usuario{i}', 'f' * 64, f'Usuário Número {i}',
+            f'Rua {i}, Fortaleza', 'ALUNO', 'USUARIO')
+
+
+def emprestimo(i):
+    """Gera a i-ésima tupla de emprestimo."""
+    data = datetime.date(2019, 1, 1) + datetime.timedelta(days=i % 365)
+    return (100000 + i, f'{9780000000000 + i}', data,
+            data + datetime.timedelta(days=15))
+
+
+def medir(construir, linhas):
+    """Retorna os bytes alocados por objeto ao construir todas as linhas.
+
+    As tuplas de entrada são alocadas antes da medição, como se já
+    tivessem sido lidas do cursor; o que é medido é o custo do objeto.
+    """
+    gc.collect()
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    objetos = [construir(*row) for row in linhas]
+    depois = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objetos
+    return (depois - antes) / len(linhas)
+
+
+def memoria(n=100000):
+    """Compara o consumo de memória por objeto para Usuario e Emprestimo.
+
+    Retorna uma lista de (tabela, bytes legado, bytes compacto).
+    """
+    resultados = []
+    for tabela, gerar_tupla in ((database.Usuario, usuario),
+                                (database.Emprestimo, emprestimo)):
+        linhas = [gerar_tupla(i) for i in range(n)]
+        columns = tabela._columns
+        legado = medir(lambda *row: Legado(columns, *row), linhas)
+        compacto = medir(tabela, linhas)
+        resultados.append((tabela.__name__, legado, compacto))
+    return resultados
+
+
+def imprimir_memoria(n):
+    print(f'Memória por objeto ({n} objetos, Python {sys.version.split()[0]})')
+    print(f'{"tabela":<12}{"legado":>12}{"compacto":>12}{"redução":>10}')
+    for nome, legado, compacto in memoria(n):
+        reducao = 1 - compacto / legado
+        print(f'{nome:<12}{legado:>10.0f} B{compacto:>10.0f} B{reducao:>10.0%}')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m teca.benchmark',
+                                     description='Benchmarks da TECA.')
+    sub = parser.add_subparsers(dest='comando')
+    p = sub.add_parser('operacoes', help='latência e consultas por operação')
+    p.add_argument('--usuarios', type=int, default=1000)
+    p.add_argument('--livros', type=int, default=2000)
+    p.add_argument('--autores', type=int, default=500)
+    p.add_argument('--semente', type=int, default=42)
+    p.add_argument('--repeticoes', type=int, default=50)
+    p.add_argument('--filtro', help='mede só operações com esse texto')
+    p.add_argument('--indice', action='store_true',
+                   help='ativa o índice de busca em memória')
+    p.add_argument('--mysql', action='store_true',
+                   help='usa o MySQL de Database.connect() (banco vazio)')
+    p.add_argument('--saida', help='salva os resultados num arquivo JSON')
+    p.add_argument('--comparar', help='JSON de uma execução anterior')
+    m = sub.add_parser('memoria', help='memória por objeto de Tabela')
+    m.add_argument('n', type=int, nargs='?', default=100000)
+    argv = sys.argv[1:]
+    if not argv or argv[0].startswith('-') and argv[0] not in ('-h', '--help'):
+        argv = ['operacoes'] + argv  # comando padrão
+    args = parser.parse_args(argv)
+
+    if args.comando == 'memoria':
+        imprimir_memoria(args.n)
+        return
+
+    resultados = executar(args.usuarios, args.livros, args.autores,
+                          args.semente, args.repeticoes, args.mysql,
+                          args.indice, args.filtro)
+    anterior = None
+    if args.comparar:
+        with open(args.comparar) as f:
+            anterior = json.load(f)
+    imprimir_resultados(resultados, anterior)
+    if args.saida:
+        with open(args.saida, 'w') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+        print(f'Resultados salvos em {args.saida}')
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,8 @@ from teca import term
 from teca import database
 from teca import check
 from teca import views
+from teca import fila
+from teca import instrumentacao
 from teca.term import selecionar_livro, selecionar_usuario
 from teca.term import sumario_reserva
 from teca.term import sumario_emprestimo
@@ -25,15 +27,13 @@ def imprimir_usuario(u):
     Como por exemplo: empréstimos, reservas e dados cadastrais.
     """
     u.senha_hash = '*' * 8
-    emps = u.emprestimos
-    resv = u.reservas
+    emps = database.Emprestimo.prefetch(u.emprestimos, 'livro')
+    resv = database.Reserva.prefetch(u.reservas, 'livro')
     extra = u.extra
     print("== INFORMAÇÃO DE USUÁRIO")
     print(u)
     if extra:
-        extra._column = [k for k in extra._columns
-                         if k not in extra._primary_key]
-        print(u.extra)
+        print(extra)
         if u.tipo in ('aluno', 'professor'):
             print("curso: ", extra.nome_curso)
     print("empréstimos: ", len(emps))
@@ -63,16 +63,16 @@ def imprimir_livro(livro):
     print("reservados: ", len(reservas))
     print("disponíveis: ", livro.disponiveis)
 
+    matriculas = [e.matricula for e in emprestimos + reservas]
+    usuarios = database.Usuario.select_many(matriculas)
     if len(emprestimos) > 0:
         print("== USUÁRIOS COM EMPRÉSTIMO", )
-        for e in database.Emprestimo.filter(isbn=livro.isbn):
-            u = database.Usuario.select(e.matricula)
-            print("    ", sumario_usuario(u))
+        for e in emprestimos:
+            print("    ", sumario_usuario(usuarios[e.matricula]))
     if len(reservas) > 0:
         print("== USUÁRIOS COM RESERVA")
-        for e in database.Reserva.filter(isbn=livro.isbn):
-            u = database.Usuario.select(e.matricula)
-            print("    ", sumario_usuario(u))
+        for e in reservas:
+            print("    ", sumario_usuario(usuarios[e.matricula]))
 
 
 def consultar_usuarios():
@@ -144,7 +144,7 @@ def dar_baixa_emprestimo():
     """Lista os empréstimos de um usuário e realiza a baixa de um em específico."""
     print("Escolha um usuário!")
     u = selecionar_usuario()
-    emps = u.emprestimos
+    emps = database.Emprestimo.prefetch(u.emprestimos, 'livro')
     if not emps:
         print("Usuário não possuí empréstimos")
         return None
@@ -160,23 +160,9 @@ def dar_baixa_emprestimo():
 
 
 def fila_anda():
-    """Método para o mecanismo da fila andar."""
-    conn = database.Database.connect()
-    sql = ("DELETE FROM reserva "
-           "WHERE data_contemplado is not null")
-    conn.commit(sql)
-    instances = database.Livro.select_all()
-
-    for instance in instances:
-        isb = instance.isbn
-        i = instance.qt_copias - len(instance.emprestimos)
-        sql = ("UPDATE reserva "
-               "SET data_contemplado = now()"
-               "WHERE isbn = %s"
-               "ORDER BY data_de_reserva "
-               "LIMIT %s")
-        params = (isb, i)
-        conn.commit(sql, params)
+    """Método para o mecanismo da fila andar (veja o módulo fila.py)."""
+    contempladas = fila.andar()
+    fila.imprimir_relatorio(contempladas)
     print("Concluído!")
 
 
@@ -203,26 +189,28 @@ def tela_bibliotecario():
             break
 
         try:
-            if op == '1':
-                consultar_usuarios()
-            elif op == '2':
-                consultar_livros()
-            elif op == '3':
-                consultar_reservas()
-            elif op == '4':
-                consultar_emprestimos()
-            elif op == '5':
-                realizar_emprestimo()
-            elif op == '6':
-                realizar_reserva()
-            elif op == '7':
-                dar_baixa_emprestimo()
-            elif op == '8':
-                fila_anda()
-            elif op == '0':
-                break
-            else:
-                print('Não implementado!')
+            with database.identity_map(), \
+                    instrumentacao.acao(opcoes.get(op, op)):
+                if op == '1':
+                    consultar_usuarios()
+                elif op == '2':
+                    consultar_livros()
+                elif op == '3':
+                    consultar_reservas()
+                elif op == '4':
+                    consultar_emprestimos()
+                elif op == '5':
+                    realizar_emprestimo()
+                elif op == '6':
+                    realizar_reserva()
+                elif op == '7':
+                    dar_baixa_emprestimo()
+                elif op == '8':
+                    fila_anda()
+                elif op == '0':
+                    break
+                else:
+                    print('Não implementado!')
 
             input("Pressione enter para continuar...")
         except KeyboardInterrupt:
@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Criação rápida do esquema e carga em massa dos dados iniciais.
+
+Substitui a execução de modelo/povoar.sql, que apaga o esquema e insere
+os dados uma tupla por vez. O bootstrap:
+
+1. Cria o esquema e as tabelas de forma idempotente, a partir das
+   instruções de modelo/povoar.sql: DROP SCHEMA/TABLE/VIEW são ignorados
+   e índices já existentes (erro 1061) são mantidos. Rodar o bootstrap
+   de novo não apaga dados;
+2. Carrega os arquivos CSV de modelo/dados (e dos diretórios passados
+   com --dados, como um acervo gerado por benchmark.gerar) com INSERTs
+   de várias tuplas por vez, ou com LOAD DATA LOCAL INFILE (opção
+   --local-infile). Tuplas cujas chaves já existem são ignoradas;
+3. Durante a carga, FOREIGN_KEY_CHECKS e UNIQUE_CHECKS ficam desligados.
+   Como religá-los não valida os dados já carregados, ao final são
+   procuradas chaves estrangeiras órfãs e chaves únicas duplicadas;
+4. As views e os gatilhos são criados por último, depois dos dados: o
+   gatilho trg_1, por exemplo, recusaria alunos já formados do acervo.
+   Em seguida as tabelas de resumo (teca.materializacao) são recalculadas.
+
+Formato dos CSVs: um arquivo <tabela>.csv por tabela, com os nomes das
+colunas na primeira linha. NULL é escrito como \\N e a barra invertida
+como \\\\, a mesma convenção do LOAD DATA do MySQL.
+
+Ex.:
+
+    $ teca bootstrap
+    $ teca bootstrap --exportar-catalogo /tmp/acervo --usuarios 5000
+    $ teca bootstrap --dados /tmp/acervo --local-infile
+"""
+
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+import mysql.connector as mysql_driver
+from mysql.connector import DatabaseError
+
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POVOAR = os.path.join(RAIZ, 'modelo', 'povoar.sql')
+DADOS = os.path.join(RAIZ, 'modelo', 'dados')
+BANCO = 'equipe385145'
+
+# ordem de carga, das tabelas referenciadas para as que referenciam
+ORDEM = ['autor', 'usuario', 'curso', 'aluno', 'professor', 'funcionario',
+         'telefones', 'categoria', 'livro', 'autor_livro', 'emprestimo',
+         'reserva']
+
+ER_DUP_KEYNAME = 1061
+TUPLAS_POR_INSERT = 1000
+NULL = '\\N'
+
+
+# ---------------------------------------------------------------------------
+# Instruções de modelo/povoar.sql
+# ---------------------------------------------------------------------------
+
+def instrucoes(caminho=POVOAR):
+    """Divide um script SQL em instruções, respeitando o DELIMITER.
+
+    Comentários de linha (--) são descartados. Retorna as instruções
+    sem o delimitador final.
+    """
+    delimitador = ';'
+    atual = []
+    with open(caminho, encoding='utf-8') as f:
+        for linha in f:
+            limpa = linha.strip()
+            if not atual and (not limpa or limpa.startswith('--')):
+                continue
+            if limpa.upper().startswith('DELIMITER '):
+                delimitador = limpa.split()[1]
+                continue
+            if limpa.endswith(delimitador):
+                atual.append(linha.rstrip()[:-len(delimitador)])
+                instrucao = '\n'.join(atual).strip()
+                atual = []
+                if instrucao:
+                    yield instrucao
+            else:
+                atual.append(linha.rstrip())
+
+
+REGEX_CREATE_TABLE = re.compile(
+    r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?`?(\w+)", re.IGNORECASE)
+# CREATE [OR REPLACE] [ALGORITHM = ...] [DEFINER = ...] [SQL SECURITY ...] VIEW
+REGEX_CREATE_VIEW = re.compile(
+    r"CREATE\s+(?:OR\s+REPLACE\s+)?(?:ALGORITHM\s*=\s*\w+\s+)?"
+    r"(?:DEFINER\s*=\s*\S+\s+)?(?:SQL\s+SECURITY\s+\w+\s+)?VIEW\b",
+    re.IGNORECASE)
+REGEX_CREATE_TRIGGER = re.compile(
+    r"CREATE\s+(?:DEFINER\s*=\s*\S+\s+)?TRIGGER\s+`?(\w+)", re.IGNORECASE)
+REGEX_DROP_TRIGGER = re.compile(
+    r"DROP\s+TRIGGER\s+IF\s+EXISTS\s+`?(\w+)", re.IGNORECASE)
+
+
+def classificar(instrucao):
+    """Etapa do bootstrap de uma instrução de povoar.sql, ou None.
+
+    Etapas: 'esquema', 'tabelas', 'dados', 'views', 'gatilhos' e
+    'resumos' (tabelas de resumo de teca.materializacao). O DROP
+    TRIGGER IF EXISTS que precede cada gatilho fica na etapa 'gatilhos',
+    para que ela possa ser executada de novo. São ignoradas (None) as
+    demais instruções destrutivas (DROP SCHEMA/TABLE/VIEW), as de
+    sessão (SET, USE, SHOW WARNINGS, START TRANSACTION, COMMIT) e as
+    tabelas provisórias das views, que o povoar.sql apaga em seguida.
+    """
+    palavras = instrucao.upper().split()
+    comando = ' '.join(palavras[:2])
+    if len(palavras) < 2:
+        return None
+    if comando == 'CREATE SCHEMA':
+        return 'esquema'
+    if comando == 'CREATE TABLE':
+        tabela = REGEX_CREATE_TABLE.match(instrucao).group(1)
+        return None if tabela.lower().startswith('view_') else 'tabelas'
+    if palavras[0] == 'CREATE' and palavras[1] in ('INDEX', 'UNIQUE',
+                                                   'FULLTEXT'):
+        return 'tabelas'
+    if comando == 'INSERT INTO':
+        return 'dados' if 'VALUES' in palavras else 'resumos'
+    if comando == 'DELETE FROM':
+        return 'resumos'
+    if REGEX_CREATE_VIEW.match(instrucao):
+        return 'views'
+    if REGEX_CREATE_TRIGGER.match(instrucao) or \
+            REGEX_DROP_TRIGGER.match(instrucao):
+        return 'gatilhos'
+    return None
+
+
+def etapas(caminho=POVOAR):
+    """Agrupa as instruções de povoar.sql por etapa do bootstrap."""
+    grupos = {'esquema': [], 'tabelas': [], 'dados': [], 'views': [],
+              'gatilhos': [], 'resumos': []}
+    for instrucao in instrucoes(caminho):
+        etapa = classificar(instrucao)
+        if etapa is not None:
+            grupos[etapa].append(instrucao)
+    return grupos
+
+
+# ---------------------------------------------------------------------------
+# Arquivos CSV
+# ---------------------------------------------------------------------------
+
+def _codificar(valor):
+    if valor is None:
+        return NULL
+    return str(valor).replace('\\', '\\\\')
+
+
+def _decodificar(campo):
+    if campo == NULL:
+        return None
+    return campo.replace('\\\\', '\\')
+
+
+def salvar_csv(caminho, colunas, linhas):
+    """Escreve as linhas de uma tabela num arquivo CSV."""
+    with open(caminho, 'w', encoding='utf-8', newline='') as f:
+        escritor = csv.writer(f, lineterminator='\n')
+        escritor.writerow(colunas)
+        for linha in linhas:
+            escritor.writerow([_codificar(v) for v in linha])
+
+
+def ler_csv(caminho):
+    """Lê um arquivo CSV, retornando (colunas, lista de tuplas)."""
+    with open(caminho, encoding='utf-8', newline='') as f:
+        leitor = csv.reader(f)
+        colunas = next(leitor)
+        return colunas, [tuple(_decodificar(c) for c in linha)
+                         for linha in leitor if linha]
+
+
+REGEX_INSERT = re.compile(
+    r"INSERT INTO `?(\w+)`?\s*\(([^)]*)\)\s*VALUES\s*\((.*)\)\s*$",
+    re.IGNORECASE | re.DOTALL)
+REGEX_VALOR = re.compile(r"\s*(?:'((?:[^']|'')*)'|(NULL)|([-+\d.]+))\s*(?:,|$)",
+                         re.IGNORECASE)
+
+
+def _valores(texto):
+    valores = []
+    for m in REGEX_VALOR.finditer(texto):
+        string, nulo, numero = m.groups()
+        if string is not None:
+            valores.append(string.replace("''", "'"))
+        elif nulo is not None:
+            valores.append(None)
+        else:
+            valores.append(str(int(numero)) if numero.isdigit() else numero)
+    return valores
+
+
+def exportar_sql(caminho=POVOAR, destino=DADOS):
+    """Extrai os INSERTs de povoar.sql em arquivos CSV, um por tabela.
+
+    Retorna {tabela: quantidade de tuplas}.
+    """
+    tabelas = {}
+    for instrucao in etapas(caminho)['dados']:
+        m = REGEX_INSERT.match(instrucao)
+        if m is None:
+            raise ValueError(f'INSERT não reconhecido: {instrucao[:80]}')
+        tabela, colunas, valores = m.groups()
+        colunas = [c.strip(' `') for c in colunas.split(',')]
+        linhas = tabelas.setdefault(tabela, (colunas, []))[1]
+        linhas.append(_valores(valores))
+    os.makedirs(destino, exist_ok=True)
+    for tabela, (colunas, linhas) in tabelas.items():
+        salvar_csv(os.path.join(destino, f'{tabela}.csv'), colunas, linhas)
+    return {tabela: len(linhas) for tabela, (_, linhas) in tabelas.items()}
+
+
+def exportar_catalogo(dados, destino):
+    """Escreve um acervo de benchmark.gerar em arquivos CSV.
+
+    Retorna {tabela: quantidade de tuplas}.
+    """
+    os.makedirs(destino, exist_ok=True)
+    quantidades = {}
+    for tabela, objetos in dados:
+        caminho = os.path.join(destino, f'{tabela._table}.csv')
+        salvar_csv(caminho, tabela._columns, (o._values for o in objetos))
+        quantidades[tabela._table] = len(objetos)
+    return quantidades
+
+
+def arquivos(diretorio):
+    """Arquivos <tabela>.csv de um diretório, na ordem de carga."""
+    existentes = {os.path.splitext(nome)[0]
+                  for nome in os.listdir(diretorio) if nome.endswith('.csv')}
+    ordem = ORDEM + sorted(existentes - set(ORDEM))
+    return [(tabela, os.path.join(diretorio, f'{tabela}.csv'))
+            for tabela in ordem if tabela in existentes]
+
+
+# ---------------------------------------------------------------------------
+# Bootstrap
+# ---------------------------------------------------------------------------
+
+class Bootstrap(object):
+
+    """Executa as etapas do bootstrap numa conexão própria.
+
+    A conexão é aberta sem esquema selecionado, pois ele pode ainda não
+    existir. As variáveis de sessão FOREIGN_KEY_CHECKS e UNIQUE_CHECKS
+    só valem para essa conexão.
+    """
+
+    def __init__(self, usuario='root', senha='root', banco=BANCO,
+                 local_infile=False, povoar=POVOAR):
+        self.banco = banco
+        self.local_infile = local_infile
+        self.etapas = etapas(povoar)
+        self.conn = mysql_driver.connect(user=usuario, password=senha,
+                                         host='localhost',
+                                         allow_local_infile=local_infile)
+
+    def executar(self, sql, params=(), ignorar=()):
+        """Executa uma instrução, ignorando os códigos de erro passados."""
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            if cursor.with_rows:
+                return cursor.fetchall()
+        except DatabaseError as e:
+            if e.errno not in ignorar:
+                raise
+        finally:
+            cursor.close()
+
+    def criar_esquema(self):
+        """Cria esquema, tabelas e índices que ainda não existem."""
+        for sql in self.etapas['esquema']:
+            self.executar(sql)
+        self.executar(f'USE `{self.banco}`')
+        for sql in self.etapas['tabelas']:
+            self.executar(sql, ignorar=(ER_DUP_KEYNAME,))
+        self.conn.commit()
+
+    def criar_views_gatilhos(self):
+        """(Re)cria as views e os gatilhos de povoar.sql."""
+        for sql in self.etapas['views'] + self.etapas['gatilhos']:
+            self.executar(sql)
+        self.conn.commit()
+
+    def reconstruir_resumos(self):
+        """Recalcula as tabelas de resumo (veja teca.materializacao)."""
+        for sql in self.etapas['resumos']:
+            self.executar(sql)
+        self.conn.commit()
+
+    def _colunas(self, tabela):
+        linhas = self.executar(
+            "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s",
+            (self.banco, tabela))
+        return {c for (c,) in linhas or ()}
+
+    def carregar(self, tabela, caminho):
+        """Carrega um arquivo CSV numa tabela, retornando as tuplas lidas."""
+        with open(caminho, encoding='utf-8', newline='') as f:
+            colunas = next(csv.reader(f))
+        desconhecidas = set(colunas) - self._colunas(tabela)
+        if desconhecidas:
+            raise ValueError(f'{caminho}: colunas desconhecidas em {tabela}: '
+                             f'{", ".join(sorted(desconhecidas))}')
+        nomes = ', '.join(f'`{c}`' for c in colunas)
+        if self.local_infile:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute(
+                    f"LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE `{tabela}` "
+                    "CHARACTER SET utf8 "
+                    "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+                    "LINES TERMINATED BY '\\n' IGNORE 1 LINES "
+                    f"({nomes})", (os.path.abspath(caminho),))
+                return cursor.rowcount
+            finally:
+                cursor.close()
+        _, linhas = ler_csv(caminho)
+        tupla = '(' + ', '.join(['%s'] * len(colunas)) + ')'
+        for i in range(0, len(linhas), TUPLAS_POR_INSERT):
+            lote = linhas[i:i + TUPLAS_POR_INSERT]
+            sql = (f'INSERT IGNORE INTO `{tabela}` ({nomes}) VALUES '
+                   + ', '.join([tupla] * len(lote)))
+            self.executar(sql, [v for linha in lote for v in linha])
+        return len(linhas)
+
+    def carregar_diretorios(self, diretorios):
+        """Carrega os CSVs dos diretórios com as checagens desligadas.
+
+        Retorna uma lista de (tabela, tuplas, segundos).
+        """
+        resultados = []
+        self.executar('SET FOREIGN_KEY_CHECKS = 0, UNIQUE_CHECKS = 0')
+        try:
+            for diretorio in diretorios:
+                for tabela, caminho in arquivos(diretorio):
+                    inicio = time.perf_counter()
+                    n = self.carregar(tabela, caminho)
+                    self.conn.commit()
+                    resultados.append((tabela, n,
+                                       time.perf_counter() - inicio))
+        except BaseException:
+            self.conn.rollback()
+            raise
+        finally:
+            self.executar('SET FOREIGN_KEY_CHECKS = 1, UNIQUE_CHECKS = 1')
+        return resultados
+
+    def verificar(self):
+        """Procura chaves estrangeiras órfãs e chaves únicas duplicadas.
+
+        Retorna a lista de problemas encontrados (vazia se tudo ok).
+        """
+        problemas = []
+        estrangeiras = {}
+        for nome, tabela, coluna, ref_tabela, ref_coluna in self.executar(
+                "SELECT CONSTRAINT_NAME, TABLE_NAME, COLUMN_NAME, "
+                "REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME "
+                "FROM information_schema.KEY_COLUMN_USAGE "
+                "WHERE TABLE_SCHEMA = %s AND REFERENCED_TABLE_NAME IS NOT NULL "
+                "ORDER BY CONSTRAINT_NAME, ORDINAL_POSITION",
+                (self.banco,)) or ():
+            chave = estrangeiras.setdefault((nome, tabela, ref_tabela), [])
+            chave.append((coluna, ref_coluna))
+        for (nome, tabela, ref_tabela), pares in estrangeiras.items():
+            nao_nulas = ' AND '.join(f'f.`{c}` IS NOT NULL' for c, _ in pares)
+            juncao = ' AND '.join(f'r.`{rc}` = f.`{c}`' for c, rc in pares)
+            [(orfas,)] = self.executar(
+                f"SELECT COUNT(*) FROM `{tabela}` f WHERE {nao_nulas} "
+                f"AND NOT EXISTS (SELECT 1 FROM `{ref_tabela}` r "
+                f"WHERE {juncao})")
+            if orfas:
+                problemas.append(f'{tabela}: {orfas} tupla(s) sem '
+                                 f'correspondente em {ref_tabela} ({nome})')
+
+        unicas = {}
+        for tabela, indice, coluna in self.executar(
+                "SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME "
+                "FROM information_schema.STATISTICS "
+                "WHERE TABLE_SCHEMA = %s AND NON_UNIQUE = 0 "
+                "ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX",
+                (self.banco,)) or ():
+            unicas.setdefault((tabela, indice), []).append(coluna)
+        for (tabela, indice), colunas in unicas.items():
+            nomes = ', '.join(f'`{c}`' for c in colunas)
+            nao_nulas = ' AND '.join(f'`{c}` IS NOT NULL' for c in colunas)
+            [(duplicadas,)] = self.executar(
+                f"SELECT COUNT(*) FROM (SELECT 1 FROM `{tabela}` "
+                f"WHERE {nao_nulas} GROUP BY {nomes} "
+                f"HAVING COUNT(*) > 1) d")
+            if duplicadas:
+                problemas.append(f'{tabela}: {duplicadas} valor(es) '
+                                 f'duplicado(s) em {indice} ({nomes})')
+        return problemas
+
+    def close(self):
+        self.conn.close()
+
+
+def bootstrap(diretorios=(DADOS,), local_infile=False,
+              usuario='root', senha='root'):
+    """Executa todas as etapas do bootstrap, exibindo o progresso.
+
+    Retorna True se a verificação final não encontrou problemas.
+    """
+    b = Bootstrap(usuario, senha, local_infile=local_infile)
+    try:
+        inicio = time.perf_counter()
+        b.criar_esquema()
+        print(f'Esquema {b.banco} criado ou já existente.')
+        for tabela, n, segundos in b.carregar_diretorios(diretorios):
+            print(f'  {tabela:<12} {n:>8} tupla(s) em {segundos:.2f}s')
+        problemas = b.verificar()
+        for problema in problemas:
+            print('Erro:', problema)
+        b.criar_views_gatilhos()
+        b.reconstruir_resumos()
+        print(f'Bootstrap concluído em {time.perf_counter() - inicio:.2f}s.')
+        return not problemas
+    finally:
+        b.close()
+
+
+def main(argv=None):
+    """Linha de comando do bootstrap (teca bootstrap)."""
+    parser = argparse.ArgumentParser(prog='teca bootstrap',
+                                     description=__doc__.split('\n')[0])
+    parser.add_argument('--dados', action='append', metavar='DIR',
+                        help='diretório de CSVs a carregar após os de '
+                             'modelo/dados (pode ser repetido)')
+    parser.add_argument('--sem-seeds', action='store_true',
+                        help='não carrega os CSVs de modelo/dados')
+    parser.add_argument('--local-infile', action='store_true',
+                        help='carrega com LOAD DATA LOCAL INFILE')
+    parser.add_argument('--usuario', default='root')
+    parser.add_argument('--senha', default='root')
+    parser.add_argument('--exportar-seeds', action='store_true',
+                        help='regenera modelo/dados a partir dos INSERTs '
+                             'de modelo/povoar.sql e sai')
+    parser.add_argument('--exportar-catalogo', metavar='DIR',
+                        help='gera um acervo sintético (benchmark.gerar) '
+                             'em CSVs no diretório e sai')
+    parser.add_argument('--usuarios', type=int, default=1000)
+    parser.add_argument('--livros', type=int, default=2000)
+    parser.add_argument('--autores', type=int, default=500)
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    if args.exportar_seeds:
+        for tabela, n in exportar_sql().items():
+            print(f'{tabela}: {n} tupla(s)')
+        return 0
+    if args.exportar_catalogo:
+        from teca import benchmark
+        dados = benchmark.gerar(args.usuarios, args.livros, args.autores,
+                                args.semente)
+        for tabela, n in exportar_catalogo(dados,
+                                           args.exportar_catalogo).items():
+            print(f'{tabela}: {n} tupla(s)')
+        return 0
+
+    diretorios = ([] if args.sem_seeds else [DADOS]) + (args.dados or [])
+    try:
+        ok = bootstrap(diretorios, args.local_infile,
+                       args.usuario, args.senha)
+    except DatabaseError as e:
+        print('Erro:', e)
+        return 1
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Cache de resultados das consultas exibidas em views.imprimir_consulta.
+
+Cada resultado é guardado pela chave (sql, params) durante um tempo de
+vida (TTL) que depende das views consultadas: view_livro_autores, que
+faz GROUP_CONCAT sobre três tabelas, é guardada por mais tempo que
+view_reserva_livro, que muda a cada reserva.
+
+As tabelas das quais uma consulta depende são extraídas das cláusulas
+FROM e JOIN, expandindo as views pelas tabelas de DEPENDENCIAS. Uma
+escrita do ORM (database.on_write) numa dessas tabelas invalida o
+resultado antes do TTL. Consultas com tabelas desconhecidas são
+invalidadas por qualquer escrita.
+
+O cache é ativado ao iniciar o programa com a variável de ambiente
+TECA_CACHE=1, ou chamando ativar().
+
+Ex.:
+
+>>> from teca import cache
+>>> cache.ativar()
+>>> cache.consultas.consultar('SELECT * FROM view_livro_ano')
+(['titulo', 'ano'], [...])
+>>> cache.consultas.estatisticas()
+{'acertos': 0, 'faltas': 1, 'invalidacoes': 0, 'expiracoes': 0, ...}
+"""
+
+import collections
+import os
+import re
+import threading
+import time
+from teca import database
+
+
+HABILITADO = os.environ.get('TECA_CACHE') == '1'
+
+# tabelas de que cada view depende
+DEPENDENCIAS = {
+    'view_livro_ano': ('livro',),
+    'view_livro_categoria': ('livro', 'categoria'),
+    'view_livro_editora': ('livro',),
+    'view_livro_autores': ('livro', 'autor', 'autor_livro'),
+    'view_professor_curso': ('professor', 'curso', 'usuario'),
+    'view_reserva_livro': ('reserva', 'livro', 'usuario'),
+    # tabelas de resumo de teca.materializacao
+    'resumo_livro_autores': ('livro', 'autor', 'autor_livro',
+                             'resumo_livro_autores'),
+    'resumo_reserva_livro': ('reserva', 'livro', 'usuario',
+                             'resumo_reserva_livro'),
+}
+
+# tempo de vida em segundos; consultas com várias views usam o menor
+TTL = {
+    'view_livro_ano': 300,
+    'view_livro_categoria': 300,
+    'view_livro_editora': 300,
+    'view_livro_autores': 600,
+    'view_professor_curso': 600,
+    'view_reserva_livro': 30,
+    'resumo_livro_autores': 600,
+    'resumo_reserva_livro': 30,
+}
+TTL_PADRAO = 60
+
+REGEX_TABELAS = re.compile(r'\b(?:FROM|JOIN)\s+`?(\w+)`?', re.IGNORECASE)
+TABELAS = {t._table for t in database.tabelas_todas}
+
+
+def dependencias(sql):
+    """Tabelas lidas por uma consulta, ou None se alguma é desconhecida.
+
+    Ex.:
+    >>> dependencias('SELECT * FROM view_livro_autores')
+    frozenset({'livro', 'autor', 'autor_livro'})
+    """
+    tabelas = set()
+    for nome in REGEX_TABELAS.findall(sql):
+        nome = nome.lower()
+        if nome in DEPENDENCIAS:
+            tabelas.update(DEPENDENCIAS[nome])
+        elif nome in TABELAS:
+            tabelas.add(nome)
+        else:
+            return None
+    return frozenset(tabelas)
+
+
+def ttl(sql):
+    """Tempo de vida do resultado de uma consulta, em segundos."""
+    nomes = [n.lower() for n in REGEX_TABELAS.findall(sql)]
+    return min((TTL.get(n, TTL_PADRAO) for n in nomes), default=TTL_PADRAO)
+
+
+class CacheConsultas(object):
+
+    """Cache LRU de resultados (colunas, tuplas) com TTL e invalidação.
+
+    Parâmetros
+    ----------
+    capacidade: quantidade máxima de resultados guardados.
+    relogio: função que retorna o tempo atual em segundos.
+    """
+
+    def __init__(self, capacidade=128, relogio=time.monotonic):
+        self.capacidade = capacidade
+        self.relogio = relogio
+        self._entradas = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+        self.invalidacoes = 0
+        self.expiracoes = 0
+        self._geracao = 0  # incrementada a cada invalidação
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def consultar(self, sql, params=()):
+        """Retorna (colunas, tuplas) do cache ou do SGBD."""
+        chave = (sql, tuple(params))
+        geracao = self._geracao
+        resultado = self._buscar(chave)
+        if resultado is not None:
+            return resultado
+        db = database.Database.connect()
+        resultado = db.query_with_headers(sql, params)
+        self._guardar(chave, sql, geracao, resultado)
+        return resultado
+
+    def _buscar(self, chave):
+        """Resultado guardado e válido de uma chave, contando acertos."""
+        agora = self.relogio()
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                expira, _, resultado = entrada
+                if agora < expira:
+                    self._entradas.move_to_end(chave)
+                    self.acertos += 1
+                    return resultado
+                del self._entradas[chave]
+                self.expiracoes += 1
+            self.faltas += 1
+        return None
+
+    def _guardar(self, chave, sql, geracao, resultado):
+        with self._lock:
+            if geracao != self._geracao:
+                # uma escrita ocorreu durante a consulta: não guarda
+                return
+            self._entradas[chave] = (self.relogio() + ttl(sql),
+                                     dependencias(sql), resultado)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.capacidade:
+                self._entradas.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._geracao += 1
+            self.invalidacoes += len(self._entradas)
+            self._entradas.clear()
+
+    def on_write(self, tabela, operacao, objetos):
+        """Invalida os resultados que dependem da tabela escrita."""
+        if tabela is None:
+            self.limpar()
+            return
+        with self._lock:
+            self._geracao += 1
+            chaves = [chave for chave, (_, deps, _) in self._entradas.items()
+                      if deps is None or tabela._table in deps]
+            for chave in chaves:
+                del self._entradas[chave]
+            self.invalidacoes += len(chaves)
+
+    def estatisticas(self):
+        """Contadores de acertos, faltas, invalidações e expirações."""
+        total = self.acertos + self.faltas
+        return {'acertos': self.acertos, 'faltas': self.faltas,
+                'invalidacoes': self.invalidacoes,
+                'expiracoes': self.expiracoes, 'tamanho': len(self),
+                'taxa_acerto': self.acertos / total if total else 0.0}
+
+
+consultas = None
+
+
+def ativar(capacidade=128):
+    """Cria o cache de consultas e o associa às escritas do ORM."""
+    global consultas
+    desativar()
+    consultas = CacheConsultas(capacidade)
+    database.on_write(consultas.on_write)
+    return consultas
+
+
+def desativar():
+    """Remove o cache; as consultas voltam a ir sempre ao SGBD."""
+    global consultas
+    if consultas is not None:
+        database.remove_write_listener(consultas.on_write)
+    consultas = None
+
+
+def consultar(sql, params=()):
+    """Consulta pelo cache, se ativo, ou diretamente no SGBD."""
+    if consultas is None:
+        db = database.Database.connect()
+        return db.query_with_headers(sql, params)
+    return consultas.consultar(sql, params)
+
+
+def iterar(sql, params=()):
+    """Como consultar, mas retorna (colunas, fonte) para term.Paginador.
+
+    fonte(inicio, quantidade) lê apenas as tuplas de uma página, com
+    LIMIT e OFFSET acrescentados à consulta (que não deve ter LIMIT).
+    Pelo cache, se ativo, cada página é guardada como uma consulta.
+    """
+    pagina = f'{sql} LIMIT %s OFFSET %s'
+    params = tuple(params)
+    headers, _ = consultar(pagina, params + (0, 0))
+
+    def fonte(inicio, quantidade):
+        return consultar(pagina, params + (quantidade, inicio))[1]
+
+    return headers, fonte
@@ -139,13 +139,12 @@ def tela_cadastro_usuario():
     ask = check.entrada('\nEstá certo os dados que você inseriu? (Y/N): ',
                         check.ask)
     if ask.lower() == 'y':
-        usuario.insert()
-        for telefone in telefones:
-            telefone.insert()
-
         while True:
             try:
-                extra.insert()
+                with database.Database.transaction():
+                    usuario.insert()
+                    database.Telefones.insert_many(telefones)
+                    extra.insert()
                 print('USUÁRIO CADASTRADO COM SUCESSO!')
                 break
             except DatabaseError:
@@ -157,7 +156,6 @@ def tela_cadastro_usuario():
                     extra.data_de_conclusao_prevista = data_de_conclusao
                 else:
                     print('CADASTRO INVÁLIDO! IGNORADO.')
-                    usuario.delete()
                     break
 
     else:
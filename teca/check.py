@@ -37,6 +37,13 @@ class Ok(ErrorMessage):
         super().__init__(message, True)
 
 
+LIVROS_MAX = {
+    'aluno': database.Aluno.livros_max,
+    'professor': database.Professor.livros_max,
+    'funcionario': database.Funcionario.livros_max,
+}
+
+
 def data(data_string, format='%Y-%m-%d'):
     """Método para checar a formatação e os dados da data inserida."""
     try:
@@ -50,7 +57,7 @@ def matricula(matricula):
     """Método para checar se a matricula é um inteiro positivo."""
     if not matricula.isdecimal():
         return Error("Matricula deve ser um inteiro positivo!")
-    elif database.Usuario.select(matricula) is not None:
+    elif database.Usuario.select(matricula, columns=[]) is not None:
         return Error("Matrícula ocupada!")
     else:
         return Ok("Matrícula ok!")
@@ -107,7 +114,7 @@ def isbn(isbn):
 
 def nickname(nickname):
     """Método para checar se o nickaname não está vazio ou já existe."""
-    if len(database.Usuario.filter(nickname=nickname)) != 0:
+    if len(database.Usuario.filter(nickname=nickname, columns=[])) != 0:
         return Error("Nickname já existe!")
     elif len(nickname) == 0:
         return Error("Nickname não pode ser vazio!")
@@ -126,23 +133,28 @@ def telefone(telefone):
 
 
 def emprestimo(usuario, livro):
-    """Método para checar as tramitações de empréstimos do usuário."""
-    emprestimos = usuario.emprestimos
-    extra = usuario.extra
-    if livro.disponiveis <= 0:
+    """Método para checar as tramitações de empréstimos do usuário.
+
+    Todas as regras são computadas numa única consulta ao SGBD (veja
+    database.Emprestimo.elegibilidade).
+    """
+    dados = database.Emprestimo.elegibilidade(usuario.matricula, livro.isbn)
+    if dados is None:
+        return Error("Usuário ou livro não encontrado!")
+    disponiveis = dados['disponiveis']
+    livros_max = LIVROS_MAX.get(dados['tipo'])
+    if disponiveis <= 0:
         return Error("Livro indisponível para empréstimo!")
-    elif extra is None:
+    elif not dados['extra'] or livros_max is None:
         return Error(f"Usuário possuí dados corrompidos na tabela {usuario.tipo!r}! Contacte o administrador.")  # noqa
-    elif len(emprestimos) >= extra.livros_max:
-        return Error(f"Usuário já alcançou o limite de {extra.livros_max} empréstimos!")  # noqa
-    elif any(livro.isbn == e.isbn for e in emprestimos):
+    elif dados['emprestimos'] >= livros_max:
+        return Error(f"Usuário já alcançou o limite de {livros_max} empréstimos!")  # noqa
+    elif dados['mesmo_livro']:
         return Error("Usuário já possuí um exemplar desse livro emprestado.")
-    elif any(e.vencido for e in emprestimos):
+    elif dados['vencidos']:
         return Error("Usuário possui empréstimo(s) vencido(s)!")
-    elif (livro.disponiveis - len(livro.reservas)) <= 0:
-        res = database.Reserva.filter(matricula=usuario.matricula,
-                                      isbn=livro.isbn)
-        if len(res) != 0 and res[0].data_contemplado is not None:
+    elif (disponiveis - dados['reservas']) <= 0:
+        if dados['contemplada']:
             return Ok("Emprestimo ok, usuario possui reserva contemplada.")
         else:
             return Error("Livro disponivel apenas para reservas contempladas!")
@@ -28,25 +28,620 @@ Ex.:
 
 import mysql.connector as mysql_driver
 from mysql.connector.errors import DatabaseError
+from mysql.connector.errors import PoolError
 import hashlib
 import abc
+import collections
+import contextlib
+import functools
+import re
+import sys
+import threading
+import time
+import weakref
 from datetime import datetime
 from datetime import timedelta
 
 
+ER_FT_MATCHING_KEY_NOT_FOUND = 1191  # MATCH sem índice FULLTEXT
+
+
+class BulkInsertError(DatabaseError):
+
+    """Falha de Tabela.insert_many dentro de uma Database.transaction.
+
+    failures contém os blocos (listas de instâncias) que falharam.
+    """
+
+    def __init__(self, failures, msg=None, errno=None):
+        super().__init__(msg=msg, errno=errno)
+        self.failures = failures
+
+
+class ConnectionPool(object):
+
+    """Pool de conexões reutilizáveis com o SGBD.
+
+    Mantém até `size` conexões abertas. As conexões ociosas ficam
+    guardadas numa fila e são reaproveitadas nas próximas retiradas
+    (checkout). Antes de entregar uma conexão ociosa é feita uma
+    checagem de saúde; conexões quebradas são descartadas e
+    substituídas por uma nova.
+
+    Conexões que ficam ociosas por mais de `max_idle` segundos são
+    fechadas, liberando recursos no servidor. A checagem de saúde, que
+    no MySQL custa uma ida ao servidor (ping), só é feita em conexões
+    ociosas há mais de `ping_after` segundos.
+
+    Ex.:
+
+    >>> pool = ConnectionPool(lambda: mysql_driver.connect(...), size=3)
+    >>> with pool.checkout() as conn:
+    ...     cursor = conn.cursor()
+    """
+
+    def __init__(self, factory, size=5, max_idle=300, timeout=30,
+                 ping_after=5):
+        self.factory = factory
+        self.size = size
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._idle = collections.deque()  # (conexão, instante do release)
+        self._in_use = 0
+        self._lock = threading.Condition()
+        self.closed = False
+
+    @staticmethod
+    def healthy(conn):
+        """Checa se uma conexão ainda está válida para uso."""
+        is_connected = getattr(conn, 'is_connected', None)
+        if is_connected is None:
+            return True
+        try:
+            return is_connected()
+        except Exception:
+            return False
+
+    @staticmethod
+    def discard(conn):
+        """Fecha uma conexão ignorando erros de uma conexão já quebrada."""
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def evict_idle(self):
+        """Fecha as conexões ociosas há mais de max_idle segundos."""
+        limit = time.monotonic() - self.max_idle
+        expired = []
+        with self._lock:
+            while self._idle and self._idle[0][1] < limit:
+                expired.append(self._idle.popleft()[0])
+        for conn in expired:
+            self.discard(conn)
+        return len(expired)
+
+    def acquire(self, timeout=None):
+        """Retira uma conexão do pool.
+
+        Se não houver conexão ociosa e o pool já estiver cheio, espera
+        até `timeout` segundos por uma devolução. Se o tempo esgotar,
+        uma exceção PoolError é disparada.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        self.evict_idle()
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while not self._idle and self._in_use >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolError(f"ConnectionPool: nenhuma conexão livre após {timeout}s")  # noqa
+                self._lock.wait(remaining)
+            conn, released = self._idle.pop() if self._idle else (None, 0)
+            self._in_use += 1
+
+        try:
+            recent = time.monotonic() - released < self.ping_after
+            if conn is not None and not recent and not self.healthy(conn):
+                self.discard(conn)
+                conn = None
+            if conn is None:
+                conn = self.factory()
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+        return conn
+
+    def release(self, conn):
+        """Devolve uma conexão ao pool.
+
+        Transações pendentes são desfeitas para que a próxima retirada
+        receba a conexão num estado limpo (e sem um snapshot antigo das
+        leituras feitas na conexão).
+        """
+        try:
+            if self.healthy(conn):
+                if getattr(conn, 'in_transaction', True):
+                    conn.rollback()
+                reusable = True
+            else:
+                reusable = False
+        except Exception:
+            reusable = False
+
+        if not reusable or self.closed:
+            self.discard(conn)
+        with self._lock:
+            self._in_use -= 1
+            if reusable and not self.closed:
+                self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+
+    @contextlib.contextmanager
+    def checkout(self, timeout=None):
+        """Retira uma conexão para ser usada num bloco with.
+
+        A conexão é devolvida ao pool ao final do bloco, mesmo que
+        uma exceção seja disparada.
+        """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Fecha todas as conexões ociosas do pool.
+
+        Conexões em uso são fechadas quando forem devolvidas.
+        """
+        with self._lock:
+            self.closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+        for conn in idle:
+            self.discard(conn)
+
+
+class IdentityMap(object):
+
+    """Mapa de identidade das tuplas já carregadas do banco de dados.
+
+    Guarda os objetos selecionados pela chave-primária, indexados por
+    (tabela, chave-primária), para que consultas repetidas pela mesma
+    chave não sejam feitas novamente ao SGBD. A quantidade de objetos
+    é limitada por capacity: ao ultrapassar, o objeto usado há mais
+    tempo é descartado (LRU).
+
+    Os objetos são invalidados automaticamente quando o ORM realiza
+    inserções, atualizações e remoções na respectiva tabela.
+    Veja a função identity_map.
+    """
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    @staticmethod
+    def key(table, pk):
+        """Normaliza a chave, ex.: ('usuario', 394192) == ('usuario', '394192')"""
+        if not isinstance(pk, (list, tuple)):
+            pk = (pk,)
+        return (table, tuple(str(v) for v in pk))
+
+    def get(self, table, pk):
+        """Retorna o objeto guardado ou None se não estiver no mapa."""
+        key = self.key(table, pk)
+        instance = self._entries.get(key)
+        if instance is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return instance
+
+    def put(self, table, pk, instance):
+        """Guarda um objeto, descartando o mais antigo se necessário."""
+        key = self.key(table, pk)
+        self._entries[key] = instance
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def discard(self, table, pk):
+        """Remove um objeto do mapa, se existir."""
+        self._entries.pop(self.key(table, pk), None)
+
+    def clear(self, table=None):
+        """Remove todos os objetos, ou apenas os de uma tabela."""
+        if table is None:
+            self._entries.clear()
+        else:
+            for key in [k for k in self._entries if k[0] == table]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def on_write(self, table, operation, instances):
+        """Invalida os objetos afetados por uma escrita do ORM."""
+        if table is None:
+            self.clear()
+            return
+        if not instances:
+            self.clear(table._table)
+            return
+        for instance in instances:
+            pk = instance._primary_key
+            self.discard(table._table, [getattr(instance, k) for k in pk])
+            self.discard(table._table, [instance.old.get(k) for k in pk])
+
+
+_local = threading.local()
+_write_listeners = []
+
+
+def on_write(listener):
+    """Registra uma função a ser chamada após cada escrita do ORM.
+
+    A função recebe os parâmetros (tabela, operacao, instancias), onde
+    tabela é a classe filha de Tabela, operacao é uma string como
+    'insert', 'update' ou 'delete' e instancias é a lista de objetos
+    escritos. Uma lista vazia significa que as tuplas afetadas são
+    desconhecidas (ex.: escrita feita por SQL puro).
+
+    Quando uma transação é desfeita, a função é chamada com
+    tabela=None e operacao='rollback'.
+
+    Pode ser utilizada como decorador.
+    """
+    _write_listeners.append(listener)
+    return listener
+
+
+def remove_write_listener(listener):
+    """Remove uma função registrada em on_write."""
+    if listener in _write_listeners:
+        _write_listeners.remove(listener)
+
+
+def notify_write(table, operation, instances=()):
+    """Notifica todas as funções registradas em on_write."""
+    current = getattr(_local, 'identity_map', None)
+    if current is not None:
+        current.on_write(table, operation, list(instances))
+    for listener in list(_write_listeners):
+        listener(table, operation, list(instances))
+
+
+@contextlib.contextmanager
+def identity_map(capacity=256):
+    """Ativa um mapa de identidade durante um bloco with (sessão).
+
+    Dentro do bloco, Tabela.select pela chave-primária completa consulta
+    primeiro o mapa. Blocos aninhados reaproveitam o mapa mais externo.
+    O mapa é próprio da thread que o criou.
+
+    Ex.:
+    >>> with identity_map():
+    ...     Livro.select('9788576082675')  # consulta o SGBD
+    ...     Livro.select('9788576082675')  # retorna o mesmo objeto
+    """
+    current = getattr(_local, 'identity_map', None)
+    if current is not None:
+        yield current
+        return
+    _local.identity_map = IdentityMap(capacity)
+    try:
+        yield _local.identity_map
+    finally:
+        _local.identity_map = None
+
+
+_query_hooks = []
+
+
+class QueryEvent(object):
+
+    """Descrição de uma consulta SQL executada, entregue aos ganchos.
+
+    Atributos
+    ---------
+    operation: 'query', 'stream' ou 'commit'.
+    sql: a consulta executada.
+    fingerprint: a consulta normalizada (veja a função fingerprint).
+    arity: quantidade de parâmetros.
+    caller: método de Tabela que originou a consulta, ex.: 'Livro.select',
+    ou None se a consulta não veio do ORM.
+    duration: duração em segundos (disponível em after).
+    rows: tuplas retornadas, ou afetadas para commit (disponível em after).
+    error: exceção disparada, se houver (disponível em after).
+    """
+
+    __slots__ = ('operation', 'sql', 'fingerprint', 'arity', 'caller',
+                 'started', 'duration', 'rows', 'error')
+
+    def __init__(self, operation, sql, params):
+        self.operation = operation
+        self.sql = sql
+        self.fingerprint = fingerprint(sql)
+        self.arity = len(params)
+        self.caller = _tabela_caller()
+        self.duration = None
+        self.rows = None
+        self.error = None
+        self.started = time.perf_counter()
+
+    def __repr__(self):
+        return (f'QueryEvent({self.operation!r}, {self.fingerprint!r}, '
+                f'caller={self.caller!r}, duration={self.duration!r}, '
+                f'rows={self.rows!r})')
+
+
+def instrument(hook):
+    """Registra um gancho de instrumentação das consultas SQL.
+
+    O gancho é um objeto com os métodos before(event) e after(event),
+    chamados antes e depois de cada consulta feita por Database.query,
+    Database.stream, Database.commit e Database.unsafe_commit, onde
+    event é um QueryEvent. Sem ganchos registrados, nada é medido.
+
+    Veja o módulo instrumentacao.py.
+    """
+    _query_hooks.append(hook)
+    return hook
+
+
+def remove_instrument(hook):
+    """Remove um gancho registrado em instrument."""
+    if hook in _query_hooks:
+        _query_hooks.remove(hook)
+
+
+_FINGERPRINT_RULES = [
+    (re.compile(r"'(?:[^'\\]|\\.|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?+)'),
+    (re.compile(r'\(\?\+\)(?:\s*,\s*\(\?\+\))+'), '(?+)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """Normaliza uma consulta SQL para agrupar consultas equivalentes.
+
+    Literais e parâmetros viram '?' e listas de parâmetros de tamanhos
+    diferentes, como os blocos de IN (...), viram '(?+)'.
+
+    Ex.:
+    >>> fingerprint("SELECT * FROM livro WHERE isbn IN (%s, %s, %s)")
+    'SELECT * FROM livro WHERE isbn IN (?+)'
+    """
+    for pattern, replacement in _FINGERPRINT_RULES:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def _tabela_caller():
+    """Encontra o método público de Tabela mais próximo na pilha."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        name = frame.f_code.co_name
+        if name[0] not in '_<' and frame.f_code.co_filename == __file__:
+            owner = frame.f_locals.get('cls') or frame.f_locals.get('self')
+            if isinstance(owner, type) and issubclass(owner, Tabela):
+                return f'{owner.__name__}.{name}'
+            if isinstance(owner, Tabela):
+                return f'{type(owner).__name__}.{name}'
+        frame = frame.f_back
+    return None
+
+
+def _before_query(operation, sql, params):
+    """Cria o QueryEvent e chama os ganchos, se houver algum."""
+    if not _query_hooks:
+        return None
+    event = QueryEvent(operation, sql, params)
+    for hook in list(_query_hooks):
+        hook.before(event)
+    return event
+
+
+def _after_query(event, rows=None, error=None):
+    """Completa o QueryEvent e chama os ganchos."""
+    if event is None:
+        return
+    event.duration = time.perf_counter() - event.started
+    event.rows = rows
+    event.error = error
+    for hook in list(_query_hooks):
+        hook.after(event)
+
+
+class ThreadConnection(object):
+
+    """Conexão fixa de uma thread durante uma Database.transaction.
+
+    Guardada num threading.local de Database. A conexão é retirada do
+    ConnectionPool no início da transação mais externa e devolvida ao
+    final dela. Se a thread terminar antes disso, o threading.local
+    descarta o objeto e o weakref.finalize devolve a conexão ao pool.
+    """
+
+    __slots__ = ('pool', 'conn', 'transaction_depth', '_finalizer',
+                 '__weakref__')
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = None
+        self.transaction_depth = 0
+        self._finalizer = None
+
+    def acquire(self):
+        """Retira uma conexão do pool para a transação da thread."""
+        self.conn = self.pool.acquire()
+        self._finalizer = weakref.finalize(self, self.pool.release, self.conn)
+        self._finalizer.atexit = False
+        return self.conn
+
+    def release(self):
+        """Devolve a conexão ao pool, desfazendo o que não foi confirmado."""
+        if self._finalizer is not None:
+            self._finalizer()
+        self.conn = self._finalizer = None
+
+
 class Database(object):
 
-    """Classe gerenciadora de conexão e consultas SQL"""
+    """Classe gerenciadora de conexão e consultas SQL
 
-    instance = None
+    As conexões com o SGBD são mantidas num ConnectionPool. Cada
+    chamada de query, commit e unsafe_commit retira uma conexão do pool
+    e a devolve ao final da operação (veja o método connection), então
+    threads de longa duração, como os workers de um ThreadPoolExecutor,
+    não retêm conexões entre uma operação e outra. O método checkout
+    permite retirar uma conexão para uso direto.
 
-    def __init__(self, database, user, password):
+    Dentro de uma Database.transaction, a thread fica com uma conexão
+    fixa até o final do bloco (veja ThreadConnection). As transações
+    são próprias de cada thread, então o ORM pode ser usado por várias
+    threads ao mesmo tempo.
+    """
+
+    instance = None
+    pool_size = 5
+    max_idle = 300
+    use_prepared = True
+    use_fulltext = True
+    max_prepared = 128  # por conexão
+    _instance_lock = threading.Lock()
+
+    def __init__(self, database, user, password,
+                 pool_size=None, max_idle=None):
         self.database = database
         self.user = user
         self.password = password
-        self.conn = mysql_driver.connect(user=user, password=password,
-                                         host='localhost',
-                                         database=database)
+        self.pool = ConnectionPool(self.new_connection,
+                                   size=pool_size or self.pool_size,
+                                   max_idle=max_idle or self.max_idle)
+        self._local = threading.local()
+        self._statements = weakref.WeakKeyDictionary()
+        self._statements_lock = threading.Lock()
+        self.statement_stats = {'prepared': 0, 'reused': 0}
+        self.missing_fulltext = set()  # tabelas sem os índices FULLTEXT
+        with self.pool.checkout():
+            pass  # conecta imediatamente, disparando erros de conexão
+
+    def new_connection(self):
+        """Abre uma nova conexão com o SGBD, utilizada pelo pool."""
+        return mysql_driver.connect(user=self.user, password=self.password,
+                                    host='localhost',
+                                    database=self.database)
+
+    @property
+    def _thread(self):
+        """ThreadConnection da thread atual."""
+        thread = getattr(self._local, 'connection', None)
+        if thread is None:
+            thread = self._local.connection = ThreadConnection(self.pool)
+        return thread
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Conexão para uma única operação, num bloco with.
+
+        Dentro de uma Database.transaction é a conexão fixa da transação.
+        Se ela cair no meio da transação, o erro do driver é propagado e
+        a transação é desfeita: a conexão nunca é trocada por outra, o
+        que faria as escritas seguintes ficarem fora da transação. Fora
+        de uma transação, a conexão é retirada do pool e devolvida ao
+        final do bloco.
+        """
+        conn = self._thread.conn
+        if conn is not None:
+            yield conn
+            return
+        with self.pool.checkout() as conn:
+            yield conn
+
+    def release_thread(self):
+        """Devolve ao pool a conexão fixa da thread atual, se houver.
+
+        Não deve ser chamado dentro de um bloco Database.transaction.
+        """
+        thread = getattr(self._local, 'connection', None)
+        if thread is not None:
+            if thread.transaction_depth > 0:
+                raise RuntimeError("Database.release_thread: transaction in progress")  # noqa
+            thread.release()
+
+    @classmethod
+    @contextlib.contextmanager
+    def transaction(cls):
+        """Agrupa várias escritas numa única transação (unidade de trabalho).
+
+        Dentro do bloco with, os métodos commit e unsafe_commit apenas
+        executam as consultas, sem fazer commit. Ao final do bloco é feito
+        um único commit para todas as escritas. Se uma exceção ocorrer,
+        inclusive um erro do SGBD numa das escritas, é feito um rollback
+        de tudo e a exceção é propagada.
+
+        Transações aninhadas são incorporadas à transação mais externa.
+        A conexão da transação fica fixa na thread até o final do bloco.
+
+        Ex.:
+        >>> with Database.transaction():
+        ...     usuario.insert()
+        ...     Telefones.insert_many(telefones)
+        ...     aluno.insert()
+        """
+        db = cls.connect()
+        thread = db._thread
+        if thread.transaction_depth == 0:
+            thread.acquire()
+        conn = thread.conn
+        thread.transaction_depth += 1
+        try:
+            yield db
+        except BaseException:
+            thread.transaction_depth -= 1
+            if thread.transaction_depth == 0:
+                thread.release()  # o pool desfaz a transação
+                notify_write(None, 'rollback')
+            raise
+        else:
+            thread.transaction_depth -= 1
+            if thread.transaction_depth == 0:
+                try:
+                    conn.commit()
+                except BaseException:
+                    notify_write(None, 'rollback')
+                    raise
+                finally:
+                    thread.release()
+
+    @property
+    def in_transaction(self):
+        """Verifica se a thread atual abriu uma Database.transaction."""
+        return self._thread.transaction_depth > 0
+
+    def checkout(self, timeout=None):
+        """Retira uma conexão adicional do pool num bloco with.
+
+        Ex.:
+
+        >>> db = Database.connect()
+        >>> with db.checkout() as conn:
+        ...     cursor = conn.cursor()
+        """
+        return self.pool.checkout(timeout)
 
     @classmethod
     def connect(cls):
@@ -58,7 +653,9 @@ class Database(object):
         Um Design Pattern de OO bem conhecido chamado de Singleton.
         """
         if not cls.instance:
-            cls.instance = Database('equipe385145', 'root', 'root')
+            with cls._instance_lock:
+                if not cls.instance:
+                    cls.instance = Database('equipe385145', 'root', 'root')
         return cls.instance
 
     @classmethod
@@ -80,54 +677,193 @@ class Database(object):
         finally:
             return status
 
-    def query(self, sql, params=()):
+    def _open_cursor(self, conn, sql, prepared=False):
+        """Abre um cursor na conexão conn para executar sql.
+
+        Com prepared=True, é utilizado um cursor de prepared statement
+        guardado por conexão e por consulta. Como o cursor só reaproveita
+        a consulta já preparada no servidor quando recebe o mesmo objeto
+        string, é retornado também o sql que deve ser executado.
+
+        Retorna a tupla (cursor, sql, owned), onde owned indica se o
+        cursor deve ser fechado após o uso.
+        """
+        if not (prepared and self.use_prepared):
+            return conn.cursor(), sql, True
+        with self._statements_lock:
+            statements = self._statements.get(conn)
+            if statements is None:
+                statements = collections.OrderedDict()
+                self._statements[conn] = statements
+        if sql in statements:
+            statements.move_to_end(sql)
+            self.statement_stats['reused'] += 1
+            sql, cursor = statements[sql]
+        else:
+            cursor = conn.cursor(prepared=True)
+            statements[sql] = (sql, cursor)
+            self.statement_stats['prepared'] += 1
+            if len(statements) > self.max_prepared:
+                _, (_, old_cursor) = statements.popitem(last=False)
+                self._close_cursor(old_cursor)
+        return cursor, sql, False
+
+    def _forget_statement(self, conn, sql):
+        """Descarta o prepared statement de sql após um erro de execução."""
+        statements = self._statements.get(conn, {})
+        if sql in statements:
+            self._close_cursor(statements.pop(sql)[1])
+
+    @staticmethod
+    def _close_cursor(cursor):
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+    def query(self, sql, params=(), stream=False, batch_size=500,
+              prepared=False):
         """Realiza uma consulta SQL no banco de dados sem fazer commit.
 
         Ideal para consultas não-modificáveis como SELECT.
-        """
-        cursor = self.conn.cursor()
-        cursor.execute(sql, params)
-        for result in cursor:
-            yield result
-        cursor.close()
 
-    def commit(self, sql, params=()):
+        O resultado é lido por inteiro e a conexão é devolvida ao pool
+        antes de a primeira tupla ser gerada, então outras consultas
+        podem ser feitas durante a iteração.
+
+        Com stream=True, a consulta é feita com um cursor não-bufferizado
+        numa conexão própria retirada do pool e as tuplas são lidas do
+        servidor em lotes de batch_size via fetchmany. Assim o consumo de
+        memória se mantém constante independente do tamanho do resultado.
+
+        Com prepared=True, a consulta é executada como prepared statement
+        no servidor, que é reaproveitado nas próximas execuções da mesma
+        consulta. Utilizado pelas consultas geradas pela classe Tabela.
+        """
+        if stream:
+            yield from self.stream(sql, params, batch_size)
+            return
+        event = _before_query('query', sql, params)
+        with self.connection() as conn:
+            cursor, sql, owned = self._open_cursor(conn, sql, prepared)
+            try:
+                cursor.execute(sql, params)
+                results = cursor.fetchall()
+            except Exception as e:
+                if not owned:
+                    self._forget_statement(conn, sql)
+                _after_query(event, 0, e)
+                raise
+            finally:
+                if owned:
+                    cursor.close()
+        _after_query(event, len(results))
+        yield from results
+
+    def query_with_headers(self, sql, params=()):
+        """Realiza uma consulta e retorna (nomes das colunas, tuplas).
+
+        Utilizado para exibir consultas arbitrárias como tabelas, como
+        as views em views.imprimir_consulta.
+        """
+        event = _before_query('query', sql, params)
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+                headers = [k[0] for k in cursor.description]
+            except Exception as e:
+                _after_query(event, 0, e)
+                raise
+            finally:
+                cursor.close()
+        _after_query(event, len(rows))
+        return headers, rows
+
+    def stream(self, sql, params=(), batch_size=500):
+        """Itera sobre o resultado de uma consulta em lotes de batch_size.
+
+        Veja o método query com stream=True.
+        """
+        event = _before_query('stream', sql, params)
+        count = 0
+        with self.checkout() as conn:
+            cursor = conn.cursor(buffered=False)
+            try:
+                cursor.execute(sql, params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    count += len(rows)
+                    yield from rows
+                _after_query(event, count)
+            except Exception as e:
+                _after_query(event, count, e)
+                raise
+            finally:
+                try:
+                    cursor.close()
+                except Exception:
+                    # iteração interrompida com tuplas não lidas:
+                    # a conexão será descartada pelo pool no release
+                    pass
+
+    def commit(self, sql, params=(), prepared=False):
         """Realiza uma consulta SQL seguida de commit.
 
         Ideal para consultas como DELETE, UPDETE e INSERT.
         Após a execução da consulta um commit é feito.
         Se uma exceção ocorrer, é exibida o seu conteúdo no terminal
-        e é feito um rollback.
+        e é feito um rollback (ao devolver a conexão ao pool).
 
         O método retorna True se tudo ocorre bem, do contrário False.
+
+        Dentro de um bloco Database.transaction o commit é adiado para o
+        final do bloco e exceções são propagadas, para que a transação
+        inteira seja desfeita.
+
+        Com prepared=True, a consulta é executada como prepared statement
+        (veja o método query).
         """
-        cursor = self.conn.cursor()
+        if self.in_transaction:
+            self.unsafe_commit(sql, params, prepared)
+            return True
         status = None
         try:
-            cursor.execute(sql, params)
-            self.conn.commit()
+            self.unsafe_commit(sql, params, prepared)
             status = True
         except Exception as e:
             err_name = e.__class__.__name__
             print(f"Warning: Database.commit: {err_name}: {e}")
-            self.conn.rollback()
             status = False
-        finally:
-            cursor.close()
 
         return status
 
-    def unsafe_commit(self, sql, params=()):
+    def unsafe_commit(self, sql, params=(), prepared=False):
         """Semelhante ao método commit no entando permite a exceção ser disparada
 
         Esse método é utilizado para demonstrar o funcionamento do uso
         de triggers como é o caso da Tabela Aluno que utiliza uma
         inserção com unsafe_commit.
         """
-        cursor = self.conn.cursor()
-        status = cursor.execute(sql, params)
-        self.conn.commit()
-        cursor.close()
+        event = _before_query('commit', sql, params)
+        with self.connection() as conn:
+            cursor, sql, owned = self._open_cursor(conn, sql, prepared)
+            try:
+                status = cursor.execute(sql, params)
+                if not self.in_transaction:
+                    conn.commit()
+                _after_query(event, cursor.rowcount)
+            except Exception as e:
+                if not owned:
+                    self._forget_statement(conn, sql)
+                _after_query(event, 0, e)
+                raise
+            finally:
+                if owned:
+                    cursor.close()
         return status
 
     def first_result(self, sql, params=()):
@@ -141,26 +877,508 @@ class Database(object):
         return None
 
     def close(self):
-        """Fecha a conexão com o banco de dados"""
-        self.conn.close()
+        """Fecha as conexões com o banco de dados"""
+        self.release_thread()
+        self.pool.close()
+
+
+class Relation(object):
+
+    """Relacionamento entre duas tabelas para carregamento antecipado.
+
+    Descreve como encontrar os objetos da tabela alvo (target) a partir
+    de um objeto da tabela dona do relacionamento:
+
+    - local_key: coluna da tabela dona;
+    - target_key: coluna da tabela alvo comparada com local_key;
+    - through: para relacionamentos N:N, uma tupla com o nome da classe
+      associativa e suas colunas que referenciam a tabela dona e a alvo;
+    - many: se True o relacionamento resulta numa lista, do contrário
+      num único objeto (ou None);
+    - search_column: coluna da tabela alvo usada quando o relacionamento
+      é passado como atributo de busca em Tabela.search.
+
+    As classes são referenciadas pelo nome, pois podem ser declaradas
+    depois da classe dona do relacionamento.
+
+    Ex.: os autores de um livro, via tabela autor_livro
+    >>> Relation('Autor', 'isbn', 'cpf',
+    ...          through=('AutorLivro', 'livro_isbn', 'autor_cpf'))
+    """
+
+    def __init__(self, target, local_key, target_key, through=None,
+                 many=True, search_column=None):
+        self.target = target
+        self.local_key = local_key
+        self.target_key = target_key
+        self.through = through
+        self.many = many
+        self.search_column = search_column
+
+    def search_predicate(self):
+        """Gera o predicado SQL de busca por substring no relacionamento.
+
+        Ex.: para a categoria de um livro
+        cod_categoria IN (SELECT cod_categoria FROM categoria
+                          WHERE descricao LIKE %s)
+        """
+        target = self.target_class
+        if self.through is None:
+            subquery = (f"SELECT {self.target_key} FROM {target._table} "
+                        f"WHERE {self.search_column} LIKE %s")
+        else:
+            assoc_name, assoc_local, assoc_target = self.through
+            assoc = globals()[assoc_name]
+            subquery = (f"SELECT a.{assoc_local} FROM {assoc._table} a "
+                        f"JOIN {target._table} t "
+                        f"ON t.{self.target_key} = a.{assoc_target} "
+                        f"WHERE t.{self.search_column} LIKE %s")
+        return f"{self.local_key} IN ({subquery})"
+
+    @property
+    def target_class(self):
+        return globals()[self.target]
 
+    def load(self, parents):
+        """Carrega os objetos relacionados a uma lista de objetos donos.
 
-class Tabela(metaclass=abc.ABCMeta):
+        É feita uma única consulta (dividida em blocos de IN (...)) para
+        todos os donos, invés de uma consulta por dono.
+
+        Retorna um dicionário {str(valor de local_key): resultado}.
+        """
+        target = self.target_class
+        keys = list({str(getattr(p, self.local_key)): getattr(p, self.local_key)  # noqa
+                     for p in parents
+                     if getattr(p, self.local_key) is not None}.values())
+        groups = collections.defaultdict(list)
+        if (not self.many and self.through is None and
+                [self.target_key] == target._primary_key):
+            # busca pela chave-primária: aproveita o identity_map
+            for key, instance in target.select_many(keys).items():
+                groups[str(key)].append(instance)
+        elif self.through is None:
+            for instance in target._select_in(self.target_key, keys):
+                groups[str(getattr(instance, self.target_key))].append(instance)  # noqa
+        else:
+            for key, instance in self._load_through(target, keys):
+                groups[str(key)].append(instance)
+
+        if self.many:
+            return groups
+        return {k: v[0] for k, v in groups.items()}
+
+    def _load_through(self, target, keys):
+        """Carrega os objetos alvo via JOIN com a tabela associativa."""
+        assoc_name, assoc_local, assoc_target = self.through
+        assoc = globals()[assoc_name]
+        projection, indexes = target._projection()
+        columns = ', '.join(f't.{c}' for c in projection)
+
+        for chunk in Tabela._in_batches(keys):
+            def build():
+                params = ', '.join(['%s' for _ in range(len(chunk))])
+                return (f"SELECT a.{assoc_local}, {columns} "
+                        f"FROM {assoc._table} a "
+                        f"JOIN {target._table} t "
+                        f"ON t.{self.target_key} = a.{assoc_target} "
+                        f"WHERE a.{assoc_local} IN ({params})")
+
+            key = ('through', assoc._table, assoc_local, len(chunk))
+            sql = target._sql(key, build)
+            conn = Database.connect()
+            for row in conn.query(sql, tuple(chunk), prepared=True):
+                yield row[0], target._from_row(row[1:], indexes)
+
+
+class Deferred(object):
+
+    """Marcador dos valores de colunas ainda não carregadas do banco."""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return '<deferred>'
+
+
+DEFERRED = Deferred()
+
+
+class Column(object):
+
+    """Descritor de acesso a uma coluna de um objeto Tabela.
+
+    Os valores de um objeto são guardados numa única tupla (_values),
+    normalmente a própria tupla lida do cursor. Na primeira alteração é
+    feita a cópia-na-escrita: a tupla original passa a ser a cópia
+    antiga (_old, usada por update) e os valores viram uma lista.
+
+    Colunas não carregadas pela consulta (veja Tabela._projection) são
+    lidas do banco de dados no primeiro acesso.
+    """
+
+    __slots__ = ('name', 'index')
+
+    def __init__(self, name, index):
+        self.name = name
+        self.index = index
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = instance._values[self.index]
+        if value is DEFERRED:
+            owner.undefer([instance])
+            value = instance._values[self.index]
+        return value
+
+    def __set__(self, instance, value):
+        values = instance._values
+        if instance._old is None:
+            instance._old = values
+        if isinstance(values, tuple):
+            values = instance._values = list(values)
+        values[self.index] = value
+
+
+class TabelaMeta(abc.ABCMeta):
+
+    """Metaclasse que gera a representação compacta de cada Tabela.
+
+    Para cada classe filha são gerados __slots__ vazios (as instâncias
+    não possuem __dict__) e um descritor Column por coluna de _columns.
+    """
+
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        namespace.setdefault('__slots__', ())
+        for index, column in enumerate(namespace.get('_columns', ())):
+            namespace.setdefault(column, Column(column, index))
+        return super().__new__(mcs, name, bases, namespace, **kwargs)
+
+
+class Tabela(metaclass=TabelaMeta):
 
     """Classe abstrata para ser a BASE de herança
     nas implementações de cada Tabela especializada.
 
     Provê métodos básicos para seleção, inserção, remoção e
     atualização.
+
+    Os objetos são compactos: os valores das colunas ficam numa tupla
+    e não há __dict__ por instância (veja Column e TabelaMeta).
+    Portanto, atributos que não são colunas não podem ser criados
+    nas instâncias.
     """
 
+    __slots__ = ('_values', '_old', '_prefetched')
+
     # Para serem redefinidas quando a herança for feita
     _table = None
     _columns = []
     _primary_key = []
+    _relations = {}
+    _fulltext = ()  # colunas com índice FULLTEXT próprio
+    _deferred = ()  # colunas não carregadas por padrão nas seleções
+    _search_index = None  # índice em memória, veja o módulo indice.py
+    in_chunk_size = 512
+    search_limit = 50
+
+    def __init_subclass__(cls, **kwargs):
+        """Cria o cache de consultas SQL próprio de cada subclasse."""
+        super().__init_subclass__(**kwargs)
+        cls._sql_cache = {}
+        cls._sql_stats = {'hits': 0, 'misses': 0}
+        cls._projections = {}
+
+    @classmethod
+    def _sql(cls, key, build):
+        """Retorna a consulta SQL identificada por key, gerada por build().
+
+        key identifica a operação e as colunas envolvidas, por exemplo:
+        ('select', ('isbn',)). Na primeira chamada a consulta é gerada e
+        guardada no cache da classe; nas seguintes, o mesmo objeto string
+        é reaproveitado, o que também permite reaproveitar o prepared
+        statement já preparado no servidor (veja Database.query).
+        """
+        sql = cls._sql_cache.get(key)
+        if sql is None:
+            cls._sql_stats['misses'] += 1
+            sql = cls._sql_cache[key] = build()
+        else:
+            cls._sql_stats['hits'] += 1
+        return sql
+
+    @classmethod
+    def sql_stats(cls):
+        """Retorna as estatísticas do cache de consultas SQL da classe.
+
+        Ex.:
+        >>> Livro.sql_stats()
+        {'hits': 41, 'misses': 3, 'hit_rate': 0.93, 'cached': 3}
+        """
+        hits = cls._sql_stats['hits']
+        misses = cls._sql_stats['misses']
+        total = hits + misses
+        return {'hits': hits,
+                'misses': misses,
+                'hit_rate': round(hits / total, 2) if total else 0.0,
+                'cached': len(cls._sql_cache)}
+
+    @classmethod
+    def _projection(cls, columns=None):
+        """Retorna as colunas a serem selecionadas e suas posições.
+
+        Sem columns, são selecionadas todas as colunas exceto as de
+        _deferred. Com columns, apenas as colunas passadas, sempre
+        acrescidas da chave-primária. As demais colunas ficam marcadas
+        como DEFERRED e são carregadas no primeiro acesso.
+
+        Retorna (colunas, posições), onde posições é None quando todas
+        as colunas são selecionadas.
+
+        Ex.:
+        >>> Usuario._projection(['nome'])
+        (('matricula', 'nome'), (0, 3))
+        """
+        key = tuple(columns) if columns is not None else None
+        projection = cls._projections.get(key)
+        if projection is not None:
+            return projection
+
+        if columns is None:
+            wanted = set(cls._columns) - set(cls._deferred)
+        else:
+            unknown = [c for c in columns if c not in cls._columns]
+            if unknown:
+                raise ValueError(f'{cls.__name__}: unknown columns {unknown!r}')  # noqa
+            wanted = set(columns) | set(cls._primary_key)
+        selected = tuple(c for c in cls._columns if c in wanted)
+        if len(selected) == len(cls._columns):
+            indexes = None
+        else:
+            indexes = tuple(cls._columns.index(c) for c in selected)
+        projection = cls._projections[key] = (selected, indexes)
+        return projection
+
+    @classmethod
+    def _from_row(cls, row, indexes):
+        """Constrói um objeto a partir de uma tupla, completa ou projetada.
+
+        indexes são as posições das colunas da tupla, como retornadas
+        por _projection, ou None para uma tupla com todas as colunas.
+        """
+        if indexes is None:
+            return cls(*row)
+        values = [DEFERRED] * len(cls._columns)
+        for index, value in zip(indexes, row):
+            values[index] = value
+        return cls(*values)
+
+    @classmethod
+    def undefer(cls, instances):
+        """Carrega as colunas ainda não carregadas de vários objetos.
+
+        É feita uma única consulta (dividida em blocos de IN (...)) pela
+        chave-primária de todos os objetos, selecionando apenas as
+        colunas que faltam. Normalmente não é necessário chamar esse
+        método: as colunas são carregadas no primeiro acesso.
+        """
+        primary_key = cls._primary_key
+        composite = len(primary_key) > 1
+
+        def pk_of(instance):
+            values = tuple(instance._values[cls._columns.index(k)]
+                           for k in primary_key)
+            return str(values if composite else values[0])
+
+        pending = {}
+        missing = set()
+        for instance in instances:
+            deferred = [c for c, v in zip(cls._columns, instance._values)
+                        if v is DEFERRED]
+            if deferred:
+                pending.setdefault(pk_of(instance), []).append(instance)
+                missing.update(deferred)
+        if not pending:
+            return instances
+
+        column = primary_key if composite else primary_key[0]
+        keys = []
+        for group in pending.values():
+            pk = tuple(getattr(group[0], k) for k in primary_key)
+            keys.append(pk if composite else pk[0])
+        for loaded in cls._select_in(column, keys, columns=sorted(missing)):
+            for instance in pending.pop(pk_of(loaded), ()):
+                instance._fill(loaded)
+        if pending:
+            raise LookupError(f'{cls.__name__}: rows not found {list(pending)!r}')  # noqa
+        return instances
+
+    def _fill(self, other):
+        """Preenche as colunas DEFERRED com os valores de outro objeto."""
+        values = list(self._values)
+        old = list(self._old) if self._old is not None else None
+        for index, value in enumerate(values):
+            if value is DEFERRED:
+                values[index] = other._values[index]
+            if old is not None and old[index] is DEFERRED:
+                old[index] = other._values[index]
+        self._values = values if self._old is not None else tuple(values)
+        self._old = tuple(old) if old is not None else None
+
+    @staticmethod
+    def _in_batches(values, chunk_size=None):
+        """Divide valores em blocos para cláusulas IN (...).
+
+        Os blocos têm tamanhos potências de 2 (até chunk_size), o último
+        completado com repetições do seu último valor. Assim poucas
+        variações de consulta são geradas, aproveitando o cache de SQL
+        e os prepared statements.
+        """
+        chunk_size = chunk_size or Tabela.in_chunk_size
+        values = list(values)
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start:start + chunk_size]
+            size = 1
+            while size < len(chunk):
+                size *= 2
+            yield chunk + [chunk[-1]] * (size - len(chunk))
+
+    @classmethod
+    def _select_in(cls, column, values, columns=None):
+        """Seleciona as tuplas onde column está entre os valores passados.
+
+        column pode ser uma lista de colunas, ex.: ['matricula', 'isbn'];
+        nesse caso cada valor é uma tupla e a comparação é feita por
+        row-value: (matricula, isbn) IN ((%s, %s), ...).
+
+        columns restringe as colunas selecionadas (veja _projection).
+        """
+        conn = Database.connect()
+        for sql, params, indexes in cls._select_in_sql(column, values, columns):
+            for row in conn.query(sql, params, prepared=True):
+                yield cls._from_row(row, indexes)
+
+    @classmethod
+    def _select_in_sql(cls, column, values, columns=None):
+        """Gera as consultas de _select_in, uma por bloco de valores.
+
+        Produz tuplas (sql, parâmetros, posições das colunas).
+        """
+        table = cls._table
+        columns, indexes = cls._projection(columns)
+        composite = isinstance(column, (list, tuple))
+        if composite:
+            column = tuple(column)
+            left = '(' + ', '.join(column) + ')'
+            item = '(' + ', '.join(['%s' for _ in column]) + ')'
+        else:
+            left, item = column, '%s'
+
+        for chunk in cls._in_batches(values):
+            def build():
+                params = ', '.join([item for _ in range(len(chunk))])
+                return (f"SELECT {','.join(columns)} FROM {table} "
+                        f"WHERE {left} IN ({params})")
+
+            sql = cls._sql(('select_in', column, columns, len(chunk)), build)
+            if composite:
+                params = tuple(v for value in chunk for v in value)
+            else:
+                params = tuple(chunk)
+            yield sql, params, indexes
+
+    @classmethod
+    def select_many(cls, pks):
+        """Realiza a consulta de várias chaves-primárias de uma só vez.
+
+        As chaves são consultadas em blocos com WHERE pk IN (...), ou
+        (a, b) IN ((...), ...) para chaves compostas como a de Emprestimo,
+        invés de uma consulta por chave.
+
+        Retorna um dicionário {chave-primária: objeto}, onde a chave é um
+        valor simples para chaves de uma coluna e uma tupla para chaves
+        compostas, com os valores como retornados pelo banco de dados.
+        Chaves não encontradas não aparecem no dicionário.
+
+        Dentro de um bloco identity_map, as chaves já carregadas não são
+        consultadas novamente.
+
+        Ex.:
+        >>> Usuario.select_many([394192, 385145])
+        {394192: Usuario(...), 385145: Usuario(...)}
+        """
+        primary_key = cls._primary_key
+        composite = len(primary_key) > 1
+
+        def pk_of(instance):
+            values = tuple(getattr(instance, k) for k in primary_key)
+            return values if composite else values[0]
+
+        imap = getattr(_local, 'identity_map', None)
+        result = {}
+        missing = {}
+        for pk in pks:
+            key = IdentityMap.key(cls._table, pk)
+            if key in missing:
+                continue
+            instance = imap.get(cls._table, pk) if imap is not None else None
+            if instance is None:
+                missing[key] = tuple(pk) if composite else pk
+            else:
+                result[pk_of(instance)] = instance
+
+        column = primary_key if composite else primary_key[0]
+        for instance in cls._select_in(column, missing.values()):
+            pk = pk_of(instance)
+            result[pk] = instance
+            if imap is not None:
+                imap.put(cls._table, pk, instance)
+        return result
+
+    @classmethod
+    def prefetch(cls, instances, *names):
+        """Carrega antecipadamente relacionamentos de vários objetos.
+
+        Para cada nome de relacionamento (veja _relations) é feita uma
+        única consulta para todos os objetos, evitando o problema de
+        N+1 consultas ao acessar, por exemplo, livro.autores para cada
+        livro de uma lista. Os resultados ficam guardados nos objetos e
+        são retornados pelo método related.
+
+        Ex.:
+        >>> livros = Livro.select_all()
+        >>> Livro.prefetch(livros, 'autores', 'categoria')
+        """
+        instances = [i for i in instances if i is not None]
+        if not instances:
+            return instances
+        for name in names:
+            relation = cls._relations[name]
+            loaded = relation.load(instances)
+            default = [] if relation.many else None
+            for instance in instances:
+                key = str(getattr(instance, relation.local_key))
+                if instance._prefetched is None:
+                    instance._prefetched = {}
+                instance._prefetched[name] = loaded.get(key, default)
+        return instances
+
+    def related(self, name):
+        """Retorna os objetos de um relacionamento (veja _relations).
+
+        Se o relacionamento foi carregado via prefetch, o resultado
+        guardado é retornado. Do contrário é feita a consulta.
+        """
+        prefetched = self._prefetched
+        if prefetched is not None and name in prefetched:
+            return prefetched[name]
+        relation = self._relations[name]
+        loaded = relation.load([self])
+        default = [] if relation.many else None
+        return loaded.get(str(getattr(self, relation.local_key)), default)
 
     def __init__(self, *args):
-        self.old = {}  # used for update
         expects = len(self._columns)
         got = len(args)
         if expects != got:
@@ -169,14 +1387,27 @@ class Tabela(metaclass=abc.ABCMeta):
             err = f'{cls} expects {expects} arguments, got {got}. Args: {a!r}'
             raise TypeError(err)
 
-        for k, v in zip(self._columns, args):
-            setattr(self, k, v)
-            self.old[k] = v
+        self._values = args
+        self._old = None  # criada na primeira alteração, usada por update
+        self._prefetched = None
+
+    @property
+    def old(self):
+        """Valores das colunas como lidos do banco de dados (ou da última
+        escrita), antes das alterações feitas no objeto."""
+        values = self._values if self._old is None else self._old
+        return dict(zip(self._columns, values))
+
+    def _reset_old(self):
+        """Marca os valores atuais como os valores salvos no banco."""
+        self._values = tuple(self._values)
+        self._old = None
 
     def __repr__(self):
         """Método interno para representação do objeto no REPL."""
         cls_name = self.__class__.__name__
-        values_format = [f'{k}={v!r}' for k, v in self.items()]
+        values_format = [f'{k}={v!r}'
+                         for k, v in zip(self._columns, self._values)]
         attributes = ', '.join(values_format)
         return f'{cls_name}({attributes})'
 
@@ -188,14 +1419,17 @@ class Tabela(metaclass=abc.ABCMeta):
         return '\n'.join(attrs)
 
     def __iter__(self):
-        """Método para o objeto suportar iteração sobre ele."""
-        for k in self._columns:
-            if k in vars(self):
-                yield getattr(self, k)
+        """Método para o objeto suportar iteração sobre ele.
+
+        As colunas ainda não carregadas são carregadas antes.
+        """
+        if any(v is DEFERRED for v in self._values):
+            type(self).undefer([self])
+        return iter(self._values)
 
     def items(self):
         """Método retorna todos os atributos do objeto como (atributo, valor)"""
-        return list(zip(self._columns, iter(self)))
+        return list(zip(self._columns, self))
 
     def insert(self, unsafe=False):
         """Realiza uma inserção no banco de dados.
@@ -203,34 +1437,128 @@ class Tabela(metaclass=abc.ABCMeta):
         Se unsafe=True, utiliza Database.unsafe_commit invés de Database.commit.
         """
         conn = Database.connect()
-        table = self._table
         columns, values = zip(*self.items())
-        params = ', '.join(['%s' for _ in range(len(columns))])
-        sql = f"INSERT INTO {table} ({','.join(columns)}) VALUES ({params})"
+        sql = self._insert_sql(columns)
         if unsafe:
-            return conn.unsafe_commit(sql, tuple(values))
+            status = conn.unsafe_commit(sql, tuple(values), prepared=True)
+            status = True if status is None else status
         else:
-            return conn.commit(sql, tuple(values))
+            status = conn.commit(sql, tuple(values), prepared=True)
+        if status:
+            notify_write(type(self), 'insert', [self])
+            self._reset_old()
+        return status
 
     @classmethod
-    def select(cls, pk, unpack=True):
+    def _insert_sql(cls, columns):
+        """Gera o INSERT de uma tupla com as colunas passadas."""
+        def build():
+            params = ', '.join(['%s' for _ in range(len(columns))])
+            return f"INSERT INTO {cls._table} ({','.join(columns)}) VALUES ({params})"  # noqa
+
+        return cls._sql(('insert', tuple(columns)), build)
+
+    @classmethod
+    def insert_many(cls, instances, chunk_size=500, upsert=False):
+        """Realiza a inserção de várias instâncias em lote.
+
+        As instâncias são divididas em blocos de chunk_size e cada bloco
+        é inserido com um único INSERT de múltiplas tuplas
+        (VALUES (...), (...), ...) seguido de um único commit.
+
+        Se upsert=True, tuplas com chave-primária já existente são
+        atualizadas via ON DUPLICATE KEY UPDATE invés de causar erro.
+
+        Retorna a lista de blocos (listas de instâncias) que falharam.
+        Uma lista vazia significa que todas as inserções foram feitas.
+        Dentro de um bloco Database.transaction, a primeira falha
+        dispara BulkInsertError (com o bloco em failures), para que a
+        transação inteira seja desfeita.
+
+        Ex.:
+        >>> Telefones.insert_many([Telefones(394192, '88999990000'),
+        ...                        Telefones(394192, '88988880000')])
+        []
+        """
+        conn = Database.connect()
+        table = cls._table
+        columns = cls._columns
+        instances = list(instances)
+        row = '(' + ', '.join(['%s' for _ in range(len(columns))]) + ')'
+        if upsert:
+            update_columns = [c for c in columns
+                              if c not in cls._primary_key] or columns
+            on_duplicate = ", ".join(map("{0}=VALUES({0})".format,
+                                         update_columns))
+        failures = []
+        for start in range(0, len(instances), chunk_size):
+            chunk = instances[start:start + chunk_size]
+
+            def build():
+                values = ', '.join([row for _ in range(len(chunk))])
+                sql = f"INSERT INTO {table} ({','.join(columns)}) VALUES {values}"  # noqa
+                if upsert:
+                    sql += f" ON DUPLICATE KEY UPDATE {on_duplicate}"
+                return sql
+
+            sql = cls._sql(('insert_many', len(chunk), upsert), build)
+            params = tuple(v for instance in chunk
+                           for _, v in instance.items())
+            try:
+                conn.unsafe_commit(sql, params, prepared=True)
+            except Exception as e:
+                if conn.in_transaction:
+                    raise BulkInsertError(
+                        [chunk], msg=f'{table}: {e}',
+                        errno=getattr(e, 'errno', None)) from e
+                err_name = e.__class__.__name__
+                print(f"Warning: Tabela.insert_many: {err_name}: {e}")
+                failures.append(chunk)
+                continue
+            notify_write(cls, 'insert', chunk)
+            for instance in chunk:
+                instance._reset_old()
+        return failures
+
+    @classmethod
+    def select(cls, pk, unpack=True, load=(), columns=None):
         """Realiza uma consulta pela chave-primária no banco de dados.
 
         Por padrão, é assumido que a seleção é pela chave primária e
         só irá retornar um resultado com unpack=True. Do contrário, o
         resultado é uma lista de objetos que representa a tabela da Classe.
+
+        Dentro de um bloco identity_map, seleções pela chave-primária
+        completa são servidas pelo mapa de identidade quando possível.
+
+        load é uma lista de relacionamentos a serem carregados
+        antecipadamente (veja o método prefetch).
+
+        columns restringe as colunas selecionadas; por padrão, todas
+        exceto as de _deferred (veja o método _projection). As colunas
+        não selecionadas são carregadas no primeiro acesso.
         """
         not_scalar = any(isinstance(pk, t) for t in [list, tuple])
         keys = len(pk) if not_scalar else 1
         conn = Database.connect()
         table = cls._table
         where_columns = cls._columns[0:keys]
-        columns = cls._columns
-        where = " AND ".join(map("{}=%s".format, where_columns))
-        sql = f"SELECT {','.join(columns)} FROM {table} WHERE {where}"
-        params = pk if not_scalar else (pk,)
-        result = list(conn.query(sql, params))
-        instances = [cls(*tuple(r)) for r in result]
+        params = tuple(pk) if not_scalar else (pk,)
+
+        imap = getattr(_local, 'identity_map', None)
+        cacheable = imap is not None and where_columns == cls._primary_key
+        if cacheable:
+            instance = imap.get(table, params)
+            if instance is not None:
+                cls.prefetch([instance], *load)
+                return instance if unpack else [instance]
+
+        sql, indexes = cls._select_sql(where_columns, columns)
+        result = list(conn.query(sql, params, prepared=True))
+        instances = [cls._from_row(r, indexes) for r in result]
+        if cacheable and instances:
+            imap.put(table, params, instances[0])
+        cls.prefetch(instances, *load)
         if not result and unpack:
             return None
         elif unpack:
@@ -238,7 +1566,30 @@ class Tabela(metaclass=abc.ABCMeta):
         return instances
 
     @classmethod
-    def filter(cls, pk=None, **kwargs):
+    def _select_sql(cls, where_columns, columns=None):
+        """Gera o SELECT ... WHERE c1=%s AND c2=%s ... das colunas passadas.
+
+        Retorna (sql, posições das colunas), veja o método _projection.
+        """
+        where_columns = tuple(where_columns)
+        columns, indexes = cls._projection(columns)
+
+        def build():
+            where = " AND ".join(map("{}=%s".format, where_columns))
+            return f"SELECT {','.join(columns)} FROM {cls._table} WHERE {where}"  # noqa
+
+        return cls._sql(('select', where_columns, columns), build), indexes
+
+    @classmethod
+    def _select_all_sql(cls, columns=None):
+        """Gera o SELECT de todas as tuplas da tabela."""
+        columns, indexes = cls._projection(columns)
+        sql = cls._sql(('select_all', columns),
+                       lambda: f"SELECT {','.join(columns)} FROM {cls._table}")  # noqa
+        return sql, indexes
+
+    @classmethod
+    def filter(cls, pk=None, load=(), columns=None, **kwargs):
         """Realiza uma seleção por outros atributos ou pela primary-key.
 
         Sempre retorna uma lista de objetos, diferentemente do método
@@ -249,41 +1600,113 @@ class Tabela(metaclass=abc.ABCMeta):
 
         A consulta interna será gerada como um AND entre diferentes os
         atributos passados.
+
+        load é uma lista de relacionamentos a serem carregados
+        antecipadamente (veja o método prefetch).
+        Ex.: Livro.filter(ano=2018, load=['autores', 'categoria'])
+
+        columns restringe as colunas selecionadas, como no método select.
+        Ex.: Usuario.filter(tipo='ALUNO', columns=['matricula', 'nome'])
         """
         if pk is not None:
-            return cls.select(pk, unpack=False)
+            return cls.select(pk, unpack=False, load=load, columns=columns)
         elif len(kwargs) > 0:
             conn = Database.connect()
-            columns = cls._columns
             where_columns, values = zip(*kwargs.items())
-            where = " AND ".join(map("{}=%s".format, where_columns))
-            sql = f"SELECT {','.join(columns)} FROM {cls._table} WHERE {where}"
-            return [cls(*r) for r in conn.query(sql, values)]
+            sql, indexes = cls._select_sql(where_columns, columns)
+            rows = conn.query(sql, values, prepared=True)
+            instances = [cls._from_row(r, indexes) for r in rows]
+            return cls.prefetch(instances, *load)
         else:
             raise ValueError("Database.filter: must have at least 1 arg, got 0.")  # noqa
 
     @classmethod
-    def select_all(cls):
-        """Seleciona todas as tuplas da tabela que representa a classe"""
+    def select_all(cls, load=(), columns=None):
+        """Seleciona todas as tuplas da tabela que representa a classe
+
+        load é uma lista de relacionamentos a serem carregados
+        antecipadamente (veja o método prefetch).
+
+        columns restringe as colunas selecionadas, como no método select.
+        """
         conn = Database.connect()
-        table = cls._table
-        columns = cls._columns
-        sql = f"SELECT {','.join(columns)} FROM {table}"
+        sql, indexes = cls._select_all_sql(columns)
         result = conn.query(sql)
         if not result:
             return None
-        return [cls(*row) for row in result]
+        instances = [cls._from_row(row, indexes) for row in result]
+        return cls.prefetch(instances, *load)
 
     @classmethod
-    def search(cls, string, attrs=()):
+    def select_page(cls, start, count, columns=None):
+        """Seleciona até count tuplas a partir da posição start (0 é a
+        primeira), em ordem de chave-primária.
+
+        Usado para exibir uma tabela página a página (veja
+        term.Paginador) sem manter um cursor aberto entre as páginas.
+
+        Ex.:
+        >>> Livro.select_page(20, 20)  # segunda página de 20 livros
+
+        columns restringe as colunas selecionadas, como no método select.
+        """
+        conn = Database.connect()
+        columns, indexes = cls._projection(columns)
+
+        def build():
+            return (f"SELECT {','.join(columns)} FROM {cls._table} "
+                    f"ORDER BY {','.join(cls._primary_key)} "
+                    "LIMIT %s OFFSET %s")
+
+        sql = cls._sql(('select_page', columns), build)
+        return [cls._from_row(row, indexes)
+                for row in conn.query(sql, (count, start))]
+
+    @classmethod
+    def iter_all(cls, batch_size=500, columns=None):
+        """Itera sobre todas as tuplas da tabela sem carregá-las na memória.
+
+        Diferente de select_all, as tuplas são lidas do servidor em lotes
+        de batch_size e cada objeto é construído sob demanda.
+
+        Ex.:
+        >>> for emprestimo in Emprestimo.iter_all(batch_size=1000):
+        ...     print(emprestimo.isbn)
+
+        columns restringe as colunas selecionadas, como no método select.
+        """
+        conn = Database.connect()
+        sql, indexes = cls._select_all_sql(columns)
+        for row in conn.query(sql, stream=True, batch_size=batch_size):
+            yield cls._from_row(row, indexes)
+
+    @classmethod
+    def search(cls, string, attrs=(), limit=None):
         """Sistema de busca genérico por atributos e substrings.
         Retorna uma lista de candidatos possíveis dada a string passada.
         attrs deve ser uma sequência de strings com o nome das colunas
-        de determinada tabela a serem usadas na pesquisa.
+        de determinada tabela a serem usadas na pesquisa. Também podem
+        ser passados nomes de relacionamentos que possuam search_column,
+        como a 'categoria' de um Livro.
+
+        A busca por substrings é feita pelo próprio SGBD, com no máximo
+        limit resultados. Colunas com índice FULLTEXT (veja _fulltext)
+        são pesquisadas primeiro com MATCH ... AGAINST, cujos resultados
+        vêm antes na lista. A lista é completada com a busca por
+        LIKE '%string%', que encontra também trechos no meio de palavras
+        e colunas sem índice FULLTEXT. Se o banco não possuir os índices
+        FULLTEXT, apenas LIKE é utilizado.
+
+        Se a classe possuir um índice de busca em memória ativo (veja o
+        módulo indice.py), a busca é respondida por ele, ordenada por
+        relevância e sem consultas ao SGBD.
         Ex.:
         >>> Usuario.search('manoel', ['nome'])
         [Usuario(matricula='394192', nome='Manoel Vilela', ...)]
         """
+        if cls._search_index is not None:
+            return cls._search_index.search(string, attrs, limit)
+
         # procura por chave
         row = cls.select(string)
         if row:
@@ -299,51 +1722,243 @@ class Tabela(metaclass=abc.ABCMeta):
                 return rows
 
         # procura por substrings para cada atributo passado
-        rows = cls.select_all()
+        limit = limit or cls.search_limit
+        db = Database.connect()
         candidates = []
-        string = string.lower()
-        for r in rows:
-            for attr in attrs:
-                attr_value = str(getattr(r, attr))
-                if string in attr_value.lower():
-                    candidates.append(r)
-                    break
+        if cls._fulltext_enabled(db):
+            try:
+                candidates = cls._search_substring(string, attrs, limit, True)
+            except DatabaseError as e:
+                cls._fulltext_error(db, e)
+        if len(candidates) < limit:
+            more = cls._search_substring(string, attrs,
+                                         limit + len(candidates), False)
+            candidates = cls._merge_search(candidates, more, limit)
+        return candidates
 
+    @classmethod
+    def _fulltext_enabled(cls, db):
+        """Verifica se a busca com MATCH ... AGAINST pode ser usada em db."""
+        return db.use_fulltext and cls._table not in db.missing_fulltext
+
+    @classmethod
+    def _fulltext_error(cls, db, error):
+        """Trata um erro da busca FULLTEXT.
+
+        Se o banco não possui os índices FULLTEXT da tabela (ex.: criado
+        por uma versão antiga de povoar.sql), a tabela é marcada em
+        db.missing_fulltext e as próximas buscas usam apenas LIKE. Os
+        demais erros são propagados.
+        """
+        if error.errno != ER_FT_MATCHING_KEY_NOT_FOUND:
+            raise error
+        db.missing_fulltext.add(cls._table)
+
+    @classmethod
+    def _merge_search(cls, candidates, more, limit):
+        """Completa candidates com os objetos de more ainda não presentes,
+        pela chave-primária, até limit resultados."""
+        def pk_of(instance):
+            return tuple(getattr(instance, k) for k in cls._primary_key)
+
+        found = {pk_of(c) for c in candidates}
+        candidates = list(candidates)
+        for candidate in more:
+            if len(candidates) >= limit:
+                break
+            if pk_of(candidate) not in found:
+                found.add(pk_of(candidate))
+                candidates.append(candidate)
         return candidates
 
+    @classmethod
+    def _search_substring(cls, string, attrs, limit, fulltext):
+        """Busca por substring com LIKE ou, se fulltext, MATCH ... AGAINST.
+
+        Com fulltext=True, apenas as colunas com índice FULLTEXT são
+        pesquisadas; se não houver nenhuma, ou se a string não tiver
+        palavras com pelo menos 3 letras, nada é retornado.
+        """
+        query = cls._search_sql(string, attrs, limit, fulltext)
+        if query is None:
+            return []
+        sql, params, indexes = query
+        conn = Database.connect()
+        rows = conn.query(sql, params, prepared=True)
+        return [cls._from_row(row, indexes) for row in rows]
+
+    @classmethod
+    def _search_sql(cls, string, attrs, limit, fulltext, columns=None):
+        """Gera a consulta de _search_substring.
+
+        columns restringe as colunas selecionadas (veja _projection).
+
+        Retorna (sql, parâmetros, posições das colunas), ou None se não
+        há o que pesquisar.
+        """
+        like = '%' + (string.replace('\\', '\\\\')
+                      .replace('%', '\\%')
+                      .replace('_', '\\_')) + '%'
+        words = [w.strip('+-<>()~*"@') for w in string.split()]
+        words = ' '.join(f'+{w}*' for w in words if len(w) >= 3)
+        predicates = []
+        params = []
+        for attr in attrs:
+            if fulltext:
+                if attr in cls._fulltext and words:
+                    predicates.append(f"MATCH({attr}) AGAINST (%s IN BOOLEAN MODE)")  # noqa
+                    params.append(words)
+            elif attr in cls._columns:
+                predicates.append(f"{attr} LIKE %s")
+                params.append(like)
+            elif getattr(cls._relations.get(attr), 'search_column', None):
+                predicates.append(cls._relations[attr].search_predicate())
+                params.append(like)
+        if not predicates:
+            return None
+        columns, indexes = cls._projection(columns)
+
+        def build():
+            where = ' OR '.join(predicates)
+            return f"SELECT {','.join(columns)} FROM {cls._table} WHERE {where} LIMIT %s"  # noqa
+
+        sql = cls._sql(('search', tuple(predicates), columns), build)
+        return sql, tuple(params) + (limit,), indexes
+
     def delete(self):
         """Deleta a tupla que representa a própria instância do objeto."""
         conn = Database.connect()
-        table = self._table
-        primary_key = self._primary_key
-        primary_key_value = tuple(getattr(self, k) for k in primary_key)
-        where = " AND ".join(map("{}=%s".format, primary_key))
-        sql = f"DELETE FROM {table} WHERE {where}"
-        return conn.commit(sql, primary_key_value)
+        primary_key_value = tuple(getattr(self, k) for k in self._primary_key)
+        status = conn.commit(self._delete_sql(), primary_key_value,
+                             prepared=True)
+        if status:
+            notify_write(type(self), 'delete', [self])
+        return status
+
+    @classmethod
+    def _delete_sql(cls):
+        """Gera o DELETE de uma tupla pela chave-primária."""
+        def build():
+            where = " AND ".join(map("{}=%s".format, cls._primary_key))
+            return f"DELETE FROM {cls._table} WHERE {where}"
+
+        return cls._sql(('delete',), build)
 
     def update(self):
         """Atualiza a tupla a partir da instância do objeto e suas alterações.
 
-        Durante a construção do objeto, no método __init__ é salvo uma variável
-        self.old como atributo do objeto. Essa variável é utilizada para ser
-        consultada os valores iniciais do objeto. Isso é necessário quando,
+        Na primeira alteração de um objeto é guardada uma cópia dos seus
+        valores iniciais, acessível por self.old. Essa cópia é utilizada
+        para ser consultada os valores iniciais do objeto. Isso é necessário quando,
         por exemplo, o usuário deseja atualizar a chave primária de um objeto.
 
         Como os próprios atributos do objeto são utilizados para gerar
         a consulta UPDATE na cláusula WHERE, o meio para assegurar que
         o valor correto associado a chave primária é o que está no
         banco de dados, é salvando essa cópia no self.old
+
+        Apenas as colunas alteradas (veja o método dirty) são escritas na
+        cláusula SET. Se nenhuma coluna foi alterada, nenhuma consulta é
+        feita e o método retorna True. Após a atualização, self.old passa
+        a refletir os novos valores.
         """
         conn = Database.connect()
+        columns = tuple(self.dirty())
+        if not columns:
+            return True
+        sql, params = self._update_sql(columns)
+        status = conn.commit(sql, params, prepared=True)
+        if status:
+            notify_write(type(self), 'update', [self])
+            self._reset_old()
+        return status
+
+    def _update_sql(self, columns):
+        """Gera o UPDATE das colunas passadas e seus parâmetros."""
         table = self._table
-        columns, values = zip(*self.items())
         primary_key = self._primary_key
+        values = tuple(getattr(self, k) for k in columns)
         primary_key_value = tuple(self.old[k] for k in primary_key)
-        set_stmt = ", ".join(map("{}=%s".format, columns))
-        where = " AND ".join(map("{}=%s".format, primary_key))
-        sql = f'UPDATE {table} SET {set_stmt} WHERE {where}'
-        params = values + primary_key_value
-        return conn.commit(sql, params)
+
+        def build():
+            set_stmt = ", ".join(map("{}=%s".format, columns))
+            where = " AND ".join(map("{}=%s".format, primary_key))
+            return f'UPDATE {table} SET {set_stmt} WHERE {where}'
+
+        sql = self._sql(('update', columns), build)
+        return sql, values + primary_key_value
+
+    def dirty(self):
+        """Retorna a lista de colunas alteradas em relação a self.old."""
+        if self._old is None:
+            return []
+        return [k for k, old, new in zip(self._columns, self._old, self._values)
+                if old != new]
+
+    @classmethod
+    def update_many(cls, instances, chunk_size=200):
+        """Atualiza várias instâncias em lote, escrevendo só o que mudou.
+
+        As instâncias são agrupadas pelo conjunto de colunas alteradas
+        (veja o método dirty) e cada grupo é atualizado em blocos de
+        chunk_size com um único UPDATE, no formato:
+
+        UPDATE t SET c = CASE WHEN pk=%s THEN %s ... END WHERE pk IN (...)
+
+        Instâncias sem alterações são ignoradas. Instâncias que alteram a
+        chave-primária são atualizadas individualmente com o método update.
+
+        Retorna a lista de blocos (listas de instâncias) que falharam.
+        """
+        conn = Database.connect()
+        table = cls._table
+        primary_key = cls._primary_key
+        match = " AND ".join(map("{}=%s".format, primary_key))
+        if len(primary_key) > 1:
+            left = '(' + ', '.join(primary_key) + ')'
+            item = '(' + ', '.join(['%s' for _ in primary_key]) + ')'
+        else:
+            left, item = primary_key[0], '%s'
+
+        groups = collections.OrderedDict()
+        failures = []
+        for instance in instances:
+            columns = tuple(instance.dirty())
+            if not columns:
+                continue
+            if any(k in primary_key for k in columns):
+                if not instance.update():
+                    failures.append([instance])
+                continue
+            groups.setdefault(columns, []).append(instance)
+
+        for columns, group in groups.items():
+            for start in range(0, len(group), chunk_size):
+                chunk = group[start:start + chunk_size]
+
+                def build():
+                    cases = ' '.join([f'WHEN {match} THEN %s'
+                                      for _ in range(len(chunk))])
+                    set_stmt = ', '.join(f'{c} = CASE {cases} END'
+                                         for c in columns)
+                    keys = ', '.join([item for _ in range(len(chunk))])
+                    return f'UPDATE {table} SET {set_stmt} WHERE {left} IN ({keys})'  # noqa
+
+                sql = cls._sql(('update_many', columns, len(chunk)), build)
+                params = []
+                for c in columns:
+                    for instance in chunk:
+                        params.extend(instance.old[k] for k in primary_key)
+                        params.append(getattr(instance, c))
+                for instance in chunk:
+                    params.extend(instance.old[k] for k in primary_key)
+                if conn.commit(sql, tuple(params), prepared=True):
+                    notify_write(cls, 'update', chunk)
+                    for instance in chunk:
+                        instance._reset_old()
+                else:
+                    failures.append(chunk)
+        return failures
 
 
 class Usuario(Tabela):
@@ -352,6 +1967,13 @@ class Usuario(Tabela):
     _columns = ['matricula', 'nickname', 'senha_hash',
                 'nome', 'endereco', 'tipo', 'permissao']
     _primary_key = ['matricula']
+    _fulltext = ('nome',)
+    _deferred = ('senha_hash', 'endereco')
+    _relations = {
+        'telefones': Relation('Telefones', 'matricula', 'matricula'),
+        'emprestimos': Relation('Emprestimo', 'matricula', 'matricula'),
+        'reservas': Relation('Reserva', 'matricula', 'matricula'),
+    }
 
     def mudar_senha(self, nova_senha):
         """Realiza a mudança de senha de um objeto usuário.
@@ -390,17 +2012,89 @@ class Usuario(Tabela):
     @property
     def telefones(self):
         """Recupera os telefones do usuário."""
-        return Telefones.filter(self.matricula)
+        return self.related('telefones')
 
     @property
     def emprestimos(self):
         """Recupera os empréstimos do usuário."""
-        return Emprestimo.filter(self.matricula)
+        return self.related('emprestimos')
 
     @property
     def reservas(self):
         """Recupera as reservas do usuário"""
-        return Reserva.filter(self.matricula)
+        return self.related('reservas')
+
+    @classmethod
+    def perfil(cls, matricula):
+        """Carrega numa única consulta o usuário, a especialização e o curso.
+
+        A especialização (Aluno, Professor ou Funcionario) e o curso são
+        lidos por LEFT JOIN, invés das consultas feitas por extra e
+        nome_curso.
+
+        Retorna (usuario, extra, curso), com None nas partes que não
+        existem.
+        """
+        subtipos = (Aluno, Professor, Funcionario)
+        tabelas = (cls,) + subtipos + (Curso,)
+
+        def build():
+            columns = ', '.join(f'{t._table}.{c}'
+                                for t in tabelas for c in t._columns)
+            return (f"SELECT {columns} FROM usuario "
+                    "LEFT JOIN aluno ON aluno.matricula = usuario.matricula "
+                    "LEFT JOIN professor "
+                    "ON professor.mat_siape = usuario.matricula "
+                    "LEFT JOIN funcionario "
+                    "ON funcionario.matricula = usuario.matricula "
+                    "LEFT JOIN curso ON curso.cod_curso = "
+                    "COALESCE(aluno.cod_curso, professor.cod_curso) "
+                    "WHERE usuario.matricula = %s")
+
+        sql = cls._sql(('perfil',), build)
+        conn = Database.connect()
+        rows = list(conn.query(sql, (matricula,), prepared=True))
+        if not rows:
+            return None, None, None
+        usuario, *extras, curso = _split_row(rows[0], tabelas)
+        extra = dict(zip(('aluno', 'professor', 'funcionario'), extras))
+        return usuario, extra.get(usuario.tipo), curso
+
+    @classmethod
+    def circulacao(cls, matricula):
+        """Carrega numa única consulta os empréstimos e as reservas do
+        usuário, com os respectivos livros (veja o método related).
+
+        Os dois conjuntos vêm de um UNION ALL, com uma coluna que indica
+        a origem de cada tupla ('e' ou 'r'); as colunas da outra tabela
+        vêm nulas.
+
+        Retorna (emprestimos, reservas).
+        """
+        tabelas = (Emprestimo, Reserva, Livro)
+
+        def build():
+            def select(kind, alias, table):
+                columns = [f'{alias}.{c}' if t is table else 'NULL'
+                           for t in tabelas[:2] for c in t._columns]
+                columns += [f'l.{c}' for c in Livro._columns]
+                return (f"SELECT '{kind}', {', '.join(columns)} "
+                        f"FROM {table._table} {alias} "
+                        f"LEFT JOIN livro l ON l.isbn = {alias}.isbn "
+                        f"WHERE {alias}.matricula = %s")
+            return (select('e', 'e', Emprestimo) + " UNION ALL " +
+                    select('r', 'r', Reserva))
+
+        sql = cls._sql(('circulacao',), build)
+        conn = Database.connect()
+        emprestimos, reservas = [], []
+        for kind, *row in conn.query(sql, (matricula, matricula),
+                                     prepared=True):
+            emprestimo, reserva, livro = _split_row(row, tabelas)
+            instance = emprestimo if kind == 'e' else reserva
+            instance._prefetched = {'livro': livro}
+            (emprestimos if kind == 'e' else reservas).append(instance)
+        return emprestimos, reservas
 
 
 class Aluno(Tabela):
@@ -455,44 +2149,96 @@ class Livro(Tabela):
     _columns = ['isbn', 'titulo', 'ano', 'editora',
                 'qt_copias', 'cod_categoria']
     _primary_key = ['isbn']
+    _fulltext = ('titulo', 'editora')
+    _relations = {
+        'autores': Relation('Autor', 'isbn', 'cpf',
+                            through=('AutorLivro', 'livro_isbn', 'autor_cpf'),
+                            search_column='nome'),
+        'categoria': Relation('Categoria', 'cod_categoria', 'cod_categoria',
+                              many=False, search_column='descricao'),
+        'emprestimos': Relation('Emprestimo', 'isbn', 'isbn'),
+        'reservas': Relation('Reserva', 'isbn', 'isbn'),
+    }
 
     @property
     def autores(self):
         """Consulta os autores de um determinado livro"""
-        autor_livro = AutorLivro.filter(livro_isbn=self.isbn)
-        return list(map(lambda x: Autor.select(x.autor_cpf), autor_livro))
+        return self.related('autores')
 
     @property
     def categoria(self):
         """Consulta a descrição da categoria de um determinado livro."""
-        cat = Categoria.select(self.cod_categoria)
+        cat = self.related('categoria')
         return cat.descricao
 
     @property
     def emprestimos(self):
         """Consulta os empréstimos associados a um determinado livro."""
-        return Emprestimo.filter(isbn=self.isbn)
+        return self.related('emprestimos')
 
     @property
     def reservas(self):
         """Consulta as reservas associadas a um determinado livro."""
-        return Reserva.filter(isbn=self.isbn)
+        return self.related('reservas')
 
     @property
     def disponiveis(self):
-        """Computa a quantidade de livros disponíveis na biblioteca."""
-        return self.qt_copias - len(self.emprestimos)
+        """Computa a quantidade de livros disponíveis na biblioteca.
+
+        Os empréstimos são contados pelo SGBD com COUNT(*), sem carregar
+        as tuplas de empréstimo.
+        """
+        conn = Database.connect()
+        sql = Emprestimo._sql(('count', 'isbn'), lambda: (
+            "SELECT COUNT(*) FROM emprestimo WHERE isbn=%s"))
+        emprestados = list(conn.query(sql, (self.isbn,), prepared=True))[0][0]
+        return self.qt_copias - emprestados
+
+    @classmethod
+    def disponibilidade(cls, isbns):
+        """Computa a quantidade disponível de vários livros de uma só vez.
+
+        É feita uma única consulta com GROUP BY (dividida em blocos de
+        IN (...)) para toda a lista, invés de uma consulta por livro.
+
+        Retorna um dicionário {isbn: disponíveis}.
+
+        Ex.:
+        >>> livros = Livro.search('banco', ['titulo'])
+        >>> Livro.disponibilidade([l.isbn for l in livros])
+        {'9788576082675': 2, '9788535211078': 0}
+        """
+        conn = Database.connect()
+        result = {}
+        for chunk in cls._in_batches(dict.fromkeys(isbns)):
+            def build():
+                params = ', '.join(['%s' for _ in range(len(chunk))])
+                return ("SELECT l.isbn, l.qt_copias - COUNT(e.isbn) "
+                        "FROM livro l "
+                        "LEFT JOIN emprestimo e ON e.isbn = l.isbn "
+                        f"WHERE l.isbn IN ({params}) "
+                        "GROUP BY l.isbn, l.qt_copias")
+
+            sql = cls._sql(('disponibilidade', len(chunk)), build)
+            for isbn, disponiveis in conn.query(sql, tuple(chunk),
+                                                prepared=True):
+                result[isbn] = int(disponiveis)
+        return result
 
 
 class Reserva(Tabela):
     _table = 'reserva'
     _columns = ['matricula', 'isbn', 'data_de_reserva', 'data_contemplado']
-    _primary_key = ['matricula']
+    _primary_key = ['matricula', 'isbn']
+
+    _relations = {
+        'livro': Relation('Livro', 'isbn', 'isbn', many=False),
+    }
 
     @property
     def livro(self):
         """Seleciona o livro a partir da reserva."""
-        return Livro.select(self.isbn)
+        return self.related('livro')
 
 
 class Emprestimo(Tabela):
@@ -500,16 +2246,72 @@ class Emprestimo(Tabela):
     _columns = ['matricula', 'isbn', 'data_de_emprestimo', 'data_de_devolucao']
     _primary_key = ['matricula', 'isbn']
 
+    _relations = {
+        'livro': Relation('Livro', 'isbn', 'isbn', many=False),
+    }
+
     @property
     def livro(self):
         """Seleciona o livro a partir do empréstimo."""
-        return Livro.select(self.isbn)
+        return self.related('livro')
 
     @property
     def vencido(self):
         """Verifica se o empréstimo está vencido."""
         return datetime.now().date() > self.data_de_devolucao
 
+    @classmethod
+    def elegibilidade(cls, matricula, isbn, hoje=None):
+        """Computa numa única consulta os dados para liberar um empréstimo.
+
+        Cada regra de check.emprestimo é uma subconsulta escalar sobre o
+        usuário e o livro, invés de carregar os empréstimos, a tupla da
+        especialização (ISA) e as reservas como objetos.
+
+        Retorna um dicionário com as chaves tipo, disponiveis, extra,
+        emprestimos, mesmo_livro, vencidos, reservas e contemplada, ou
+        None se o usuário ou o livro não existem.
+        """
+        def build():
+            return (
+                "SELECT u.tipo, "
+                "l.qt_copias - (SELECT COUNT(*) FROM emprestimo e "
+                "               WHERE e.isbn = l.isbn), "
+                "CASE u.tipo "
+                "  WHEN 'aluno' THEN EXISTS (SELECT 1 FROM aluno x "
+                "    WHERE x.matricula = u.matricula) "
+                "  WHEN 'professor' THEN EXISTS (SELECT 1 FROM professor x "
+                "    WHERE x.mat_siape = u.matricula) "
+                "  WHEN 'funcionario' THEN EXISTS (SELECT 1 FROM funcionario x "  # noqa
+                "    WHERE x.matricula = u.matricula) "
+                "  ELSE 0 END, "
+                "(SELECT COUNT(*) FROM emprestimo e "
+                " WHERE e.matricula = u.matricula), "
+                "EXISTS (SELECT 1 FROM emprestimo e "
+                "        WHERE e.matricula = u.matricula AND e.isbn = l.isbn), "  # noqa
+                "(SELECT COUNT(*) FROM emprestimo e "
+                " WHERE e.matricula = u.matricula "
+                " AND e.data_de_devolucao < %s), "
+                "(SELECT COUNT(*) FROM reserva r WHERE r.isbn = l.isbn), "
+                "EXISTS (SELECT 1 FROM reserva r "
+                "        WHERE r.matricula = u.matricula AND r.isbn = l.isbn "
+                "        AND r.data_contemplado IS NOT NULL) "
+                "FROM usuario u, livro l "
+                "WHERE u.matricula = %s AND l.isbn = %s")
+
+        hoje = hoje or datetime.now().date()
+        sql = cls._sql(('elegibilidade',), build)
+        conn = Database.connect()
+        rows = list(conn.query(sql, (hoje, matricula, isbn), prepared=True))
+        if not rows:
+            return None
+        tipo, *contagens = rows[0]
+        chaves = ('disponiveis', 'extra', 'emprestimos', 'mesmo_livro',
+                  'vencidos', 'reservas', 'contemplada')
+        resultado = dict(zip(chaves, (int(c) for c in contagens)))
+        resultado['tipo'] = tipo
+        return resultado
+
 
 class Telefones(Tabela):
     _table = 'telefones'
@@ -521,12 +2323,16 @@ class Autor(Tabela):
     _table = 'autor'
     _columns = ['cpf', 'nome', 'nacionalidade']
     _primary_key = ['cpf']
+    _fulltext = ('nome',)
+    _relations = {
+        'livros': Relation('Livro', 'cpf', 'isbn',
+                           through=('AutorLivro', 'autor_cpf', 'livro_isbn')),
+    }
 
     @property
     def livros(self):
         """Recupera os livros associados a um determinado Autor."""
-        autor_livro = AutorLivro.filter(self.cpf)
-        return [Livro.select(k.livro_isbn) for k in autor_livro]
+        return self.related('livros')
 
 
 class AutorLivro(Tabela):
@@ -539,27 +2345,34 @@ class Curso(Tabela):
     _table = 'curso'
     _columns = ['cod_curso', 'nome_curso']
     _primary_key = ['cod_curso']
+    _relations = {
+        'professores': Relation('Professor', 'cod_curso', 'cod_curso'),
+        'alunos': Relation('Aluno', 'cod_curso', 'cod_curso'),
+    }
 
     @property
     def professores(self):
         """Recupera os professores associado a uma determinada curso."""
-        return Professor.filter(cod_curso=self.cod_curso)
+        return self.related('professores')
 
     @property
     def alunos(self):
         """Recupera os alunos associado a um determinado aluno."""
-        return Aluno.filter(cod_curso=self.cod_curso)
+        return self.related('alunos')
 
 
 class Categoria(Tabela):
     _table = 'categoria'
     _columns = ['cod_categoria', 'descricao']
     _primary_key = ['cod_categoria']
+    _relations = {
+        'livros': Relation('Livro', 'cod_categoria', 'cod_categoria'),
+    }
 
     @property
     def livros(self):
         """Recupera os livros associados a uma determinada categoria"""
-        return Livro.filter(cod_categoria=self.cod_categoria)
+        return self.related('livros')
 
 
 tabelas_todas = [Usuario, Aluno, Funcionario, Professor, Curso, Telefones,
@@ -569,6 +2382,23 @@ tabelas_sem_isa = [Usuario, Curso, Telefones,
                    Emprestimo, Reserva, Categoria, Livro, AutorLivro, Autor]
 
 
+def _split_row(row, tabelas):
+    """Divide uma tupla de um JOIN em objetos das tabelas passadas.
+
+    As colunas de cada tabela aparecem em sequência, na ordem de
+    _columns. Tabelas sem tupla correspondente (LEFT JOIN com a
+    chave-primária nula) resultam em None.
+    """
+    instances = []
+    start = 0
+    for tabela in tabelas:
+        values = row[start:start + len(tabela._columns)]
+        start += len(tabela._columns)
+        pk = [values[tabela._columns.index(k)] for k in tabela._primary_key]
+        instances.append(None if None in pk else tabela(*values))
+    return instances
+
+
 def senha_hash(senha):
     """Computa o hash da senha a partir do algoritmo de hashing SHA256."""
     return hashlib.sha256(senha.strip('\n').encode('utf-8')).hexdigest()
@@ -582,15 +2412,16 @@ def login(nome_usuario, senha):
     nome_usuario: pode ser matricula ou nickname.
     senha: string para ser computada após pelo hash utilizado no sistema.
 
-    Retorna uma instância da classe Usuario.
+    Retorna uma instância da classe Usuario, lida na mesma consulta que
+    verifica a senha.
     """
     conn = Database.connect()
-    sql = ("SELECT matricula FROM usuario "
-           "WHERE (nickname=%s OR matricula=%s) and senha_hash=%s")
+    columns, indexes = Usuario._projection()
+    sql = Usuario._sql(('login',), lambda: (
+        f"SELECT {', '.join(columns)} FROM usuario "
+        "WHERE (nickname=%s OR matricula=%s) and senha_hash=%s"))
     params = (nome_usuario, nome_usuario, senha_hash(senha))
     result = conn.first_result(sql, params)
     if result is None:
         return None
-    matricula = result[0]
-    usuario = Usuario.select(matricula)
-    return usuario
+    return Usuario._from_row(result, indexes)
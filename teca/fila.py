@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Mecanismo da fila de reservas.
+
+Faz a fila de reservas de todos os livros andar de uma só vez, com
+consultas baseadas em conjuntos dentro de uma única transação, invés de
+uma consulta por livro:
+
+1. As reservas contempladas anteriormente são apagadas;
+2. As reservas pendentes são numeradas por livro, em ordem de data de
+   reserva, com a window function ROW_NUMBER(). As que estão dentro da
+   quantidade de exemplares disponíveis de cada livro são contempladas
+   com um único UPDATE.
+
+Pode ser executado como tarefa agendada (ex.: via cron):
+
+    $ python -m teca.fila
+"""
+
+import sys
+from datetime import datetime
+from teca import database
+from teca import materializacao
+
+
+SQL_APAGAR_CONTEMPLADAS = ("DELETE FROM reserva "
+                           "WHERE data_contemplado IS NOT NULL")
+
+SQL_CONTEMPLAR = (
+    "UPDATE reserva "
+    "SET data_contemplado = %s "
+    "WHERE (matricula, isbn) IN ("
+    "  SELECT matricula, isbn FROM ("
+    "    SELECT r.matricula, r.isbn, "
+    "      ROW_NUMBER() OVER (PARTITION BY r.isbn "
+    "                         ORDER BY r.data_de_reserva, r.matricula) "
+    "        AS posicao, "
+    "      l.qt_copias - COALESCE(e.emprestados, 0) AS disponiveis "
+    "    FROM reserva r "
+    "    JOIN livro l ON l.isbn = r.isbn "
+    "    LEFT JOIN (SELECT isbn, COUNT(*) AS emprestados "
+    "               FROM emprestimo GROUP BY isbn) e ON e.isbn = r.isbn "
+    "    WHERE r.data_contemplado IS NULL"
+    "  ) fila "
+    "  WHERE fila.posicao <= fila.disponiveis"
+    ")")
+
+SQL_CONTEMPLADAS = ("SELECT isbn, COUNT(*) FROM reserva "
+                    "WHERE data_contemplado = %s "
+                    "GROUP BY isbn")
+
+
+def andar(agora=None):
+    """Faz a fila de reservas de todos os livros andar.
+
+    Todas as etapas são feitas numa única transação: se algo falhar,
+    nada é alterado. As funções de database.on_write (cache de consultas,
+    tabelas de resumo) são notificadas dentro da mesma transação.
+
+    Retorna um dicionário {isbn: quantidade de reservas contempladas}.
+    """
+    conn = database.Database.connect()
+    agora = agora or datetime.now().replace(microsecond=0)
+    with database.Database.transaction():
+        conn.commit(SQL_APAGAR_CONTEMPLADAS)
+        conn.commit(SQL_CONTEMPLAR, (agora,))
+        database.notify_write(database.Reserva, 'update')
+        contempladas = {isbn: int(n) for isbn, n in
+                        conn.query(SQL_CONTEMPLADAS, (agora,))}
+    return contempladas
+
+
+def imprimir_relatorio(contempladas):
+    """Imprime quantas reservas foram contempladas para cada livro."""
+    for isbn, n in sorted(contempladas.items()):
+        print(f"{isbn}: {n} reserva(s) contemplada(s)")
+    total = sum(contempladas.values())
+    print(f"Total: {total} reserva(s) em {len(contempladas)} livro(s).")
+
+
+def main():
+    """Executa a fila de reservas como tarefa agendada."""
+    if not database.Database.try_connect():
+        print("Erro: Banco de dados não disponível para acesso! ")
+        sys.exit(1)
+    conn = database.Database.connect()
+    if materializacao.HABILITADO:
+        materializacao.ativar()  # mantém resumo_reserva_livro atualizado
+    try:
+        imprimir_relatorio(andar())
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
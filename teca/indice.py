@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Índice de busca em memória para livros e usuários.
+
+As buscas interativas de term.selecionar_livro e term.selecionar_usuario
+são feitas a cada pesquisa digitada. Com o índice ativo, Tabela.search é
+respondido a partir da memória, sem ida ao SGBD.
+
+O índice é invertido por trigramas: cada campo pesquisável é normalizado
+(minúsculas e sem acentos, para que 'geronimo' encontre 'Gerônimo') e
+quebrado em sequências de 3 letras. Os resultados são ordenados pela
+fração de trigramas da pesquisa presentes no campo, com prioridade para
+campos que contêm a pesquisa inteira como substring.
+
+O índice é construído uma vez (veja a função ativar) e mantido atualizado
+incrementalmente pelas escritas do ORM (database.on_write). Como ele
+guarda todos os livros e usuários na memória, é opcional: é ativado ao
+iniciar o programa com a variável de ambiente TECA_INDICE=1, ou
+chamando ativar().
+
+Ex.:
+
+>>> from teca import indice
+>>> indice.ativar()
+>>> database.Livro.search('banco de dados', ['titulo', 'autores'])
+[Livro(isbn='9788576082675', titulo='Sistemas de Banco de Dados', ...)]
+"""
+
+import collections
+import os
+import threading
+import unicodedata
+from teca import database
+
+
+HABILITADO = os.environ.get('TECA_INDICE') == '1'
+
+
+def normalizar(texto):
+    """Converte um texto para minúsculas e remove seus acentos."""
+    texto = unicodedata.normalize('NFKD', str(texto))
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def trigramas(texto):
+    """Computa o conjunto de trigramas das palavras de um texto normalizado.
+
+    Ex.: trigramas('ana') == {'  a', ' an', 'ana', 'na '}
+    """
+    grams = set()
+    for palavra in texto.split():
+        padded = f'  {palavra} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def copia(objeto):
+    """Cópia de um objeto indexado, com os relacionamentos carregados.
+
+    As buscas retornam cópias para que alterações feitas pelo chamador
+    (ex.: admin.admin_alterar) não alterem o índice sem reindexação.
+    """
+    novo = type(objeto)(*objeto._values)
+    if objeto._prefetched is not None:
+        novo._prefetched = dict(objeto._prefetched)
+    return novo
+
+
+class SearchIndex(object):
+
+    """Índice invertido de trigramas sobre os objetos de uma Tabela.
+
+    Parâmetros
+    ----------
+    tabela: classe filha de database.Tabela a ser indexada.
+    campos: dicionário {atributo: função(objeto) -> texto} com os
+    atributos pesquisáveis, que podem incluir relacionamentos.
+    relacoes: relacionamentos carregados via prefetch na indexação.
+    dependencias: dicionário {classe: coluna} de tabelas cujas escritas
+    afetam o texto indexado; a coluna aponta para a chave do objeto
+    indexado, ou None se as tuplas afetadas não são conhecidas.
+    """
+
+    similaridade_minima = 0.6
+    batch_size = 500
+
+    def __init__(self, tabela, campos, relacoes=(), dependencias=None):
+        self.tabela = tabela
+        self.campos = campos
+        self.relacoes = relacoes
+        self.dependencias = dependencias or {}
+        self.documentos = {}  # chave -> objeto
+        self.textos = {}  # chave -> {atributo: texto normalizado}
+        self.postings = collections.defaultdict(set)  # (atributo, trigrama)
+        self.construido = False
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _chave(pk):
+        """Normaliza uma chave-primária (valor ou tupla) como string."""
+        valores = pk if isinstance(pk, tuple) else (pk,)
+        return normalizar(' '.join(str(v) for v in valores))
+
+    def pk(self, objeto, antiga=False):
+        """Chave-primária de um objeto, opcionalmente antes da alteração."""
+        colunas = self.tabela._primary_key
+        if antiga:
+            valores = tuple(objeto.old.get(k) for k in colunas)
+        else:
+            valores = tuple(getattr(objeto, k) for k in colunas)
+        return valores if len(valores) > 1 else valores[0]
+
+    def chave(self, objeto, antiga=False):
+        """Chave normalizada de um objeto indexado."""
+        return self._chave(self.pk(objeto, antiga))
+
+    def construir(self):
+        """(Re)constrói o índice lendo toda a tabela em lotes."""
+        with self._lock:
+            self.documentos.clear()
+            self.textos.clear()
+            self.postings.clear()
+            lote = []
+            for objeto in self.tabela.iter_all(batch_size=self.batch_size):
+                lote.append(objeto)
+                if len(lote) >= self.batch_size:
+                    self.adicionar(lote)
+                    lote = []
+            self.adicionar(lote)
+            self.construido = True
+
+    def adicionar(self, objetos):
+        """Indexa (ou reindexa) uma lista de objetos."""
+        objetos = self.tabela.prefetch(objetos, *self.relacoes)
+        with self._lock:
+            for objeto in objetos:
+                chave = self.chave(objeto)
+                self.remover(chave)
+                textos = {campo: normalizar(extrair(objeto))
+                          for campo, extrair in self.campos.items()}
+                for campo, texto in textos.items():
+                    for gram in trigramas(texto):
+                        self.postings[(campo, gram)].add(chave)
+                self.documentos[chave] = objeto
+                self.textos[chave] = textos
+
+    def remover(self, chave):
+        """Remove um objeto do índice pela sua chave normalizada."""
+        with self._lock:
+            textos = self.textos.pop(chave, None)
+            self.documentos.pop(chave, None)
+            if textos is None:
+                return
+            for campo, texto in textos.items():
+                for gram in trigramas(texto):
+                    chaves = self.postings.get((campo, gram))
+                    if chaves is not None:
+                        chaves.discard(chave)
+                        if not chaves:
+                            del self.postings[(campo, gram)]
+
+    def recarregar(self, pks):
+        """Relê do SGBD e reindexa os objetos das chaves passadas."""
+        pks = list(pks)
+        encontrados = self.tabela.select_many(pks)
+        with self._lock:
+            for pk in pks:
+                self.remover(self._chave(pk))
+            self.adicionar(list(encontrados.values()))
+
+    def on_write(self, tabela, operacao, objetos):
+        """Mantém o índice atualizado após uma escrita do ORM."""
+        if not self.construido:
+            return
+        if tabela is None:
+            # rollback: as escritas já aplicadas ao índice foram desfeitas
+            self.construido = False
+        elif tabela is self.tabela and objetos:
+            with self._lock:
+                for objeto in objetos:
+                    self.remover(self.chave(objeto, antiga=True))
+                    self.remover(self.chave(objeto))
+            if operacao != 'delete':
+                self.recarregar([self.pk(o) for o in objetos])
+        elif tabela is self.tabela or tabela in self.dependencias:
+            coluna = self.dependencias.get(tabela)
+            if coluna is None or not objetos:
+                self.construido = False  # reconstruído na próxima busca
+            else:
+                chaves = {getattr(o, coluna) for o in objetos}
+                chaves |= {o.old.get(coluna) for o in objetos} - {None}
+                self.recarregar(chaves)
+
+    def search(self, string, attrs=(), limit=None):
+        """Busca por chave ou por similaridade nos atributos passados.
+
+        Segue a mesma interface de Tabela.search: se a string for uma
+        chave-primária, apenas o objeto correspondente é retornado. Do
+        contrário, os objetos são ordenados por relevância. São
+        retornadas cópias dos objetos indexados (veja a função copia).
+        """
+        if not self.construido:
+            self.construir()
+        limit = limit or self.tabela.search_limit
+        consulta = normalizar(string).strip()
+        if not consulta:
+            return []
+        with self._lock:
+            if consulta in self.documentos:
+                return [copia(self.documentos[consulta])]
+
+            grams = trigramas(consulta)
+            pontos = {}
+            for campo in (a for a in attrs if a in self.campos):
+                contagem = collections.Counter()
+                for gram in grams:
+                    contagem.update(self.postings.get((campo, gram), ()))
+                for chave, n in contagem.items():
+                    texto = self.textos[chave][campo]
+                    score = n / len(grams)
+                    if consulta in texto:
+                        score += 1.0 if texto == consulta else 0.5
+                    elif score < self.similaridade_minima:
+                        continue
+                    pontos[chave] = max(pontos.get(chave, 0), score)
+
+            ranking = sorted(pontos, key=lambda k: (-pontos[k], k))
+            return [copia(self.documentos[k]) for k in ranking[:limit]]
+
+
+def _autores(livro):
+    return ' '.join(a.nome for a in livro.related('autores'))
+
+
+def _categoria(livro):
+    categoria = livro.related('categoria')
+    return categoria.descricao if categoria else ''
+
+
+def indice_livros():
+    """Cria o índice de livros: título, editora, ano, categoria e autores."""
+    return SearchIndex(database.Livro,
+                       {'titulo': lambda l: l.titulo,
+                        'editora': lambda l: l.editora,
+                        'ano': lambda l: l.ano,
+                        'categoria': _categoria,
+                        'autores': _autores},
+                       relacoes=('categoria', 'autores'),
+                       dependencias={database.AutorLivro: 'livro_isbn',
+                                     database.Autor: None,
+                                     database.Categoria: None})
+
+
+def indice_usuarios():
+    """Cria o índice de usuários: nome, nickname e matrícula."""
+    return SearchIndex(database.Usuario,
+                       {'nome': lambda u: u.nome,
+                        'nickname': lambda u: u.nickname or '',
+                        'matricula': lambda u: u.matricula})
+
+
+def ativar():
+    """Constrói os índices de livros e usuários e os associa às tabelas.
+
+    A partir daí, Livro.search e Usuario.search são respondidos pelo
+    índice, que é atualizado a cada escrita feita pelo ORM.
+    """
+    for indice in (indice_livros(), indice_usuarios()):
+        indice.construir()
+        database.on_write(indice.on_write)
+        indice.tabela._search_index = indice
+
+
+def desativar():
+    """Desassocia os índices, voltando às buscas feitas pelo SGBD."""
+    for tabela in (database.Livro, database.Usuario):
+        indice = tabela._search_index
+        if indice is not None:
+            database.remove_write_listener(indice.on_write)
+            tabela._search_index = None
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Instrumentação das consultas SQL feitas ao SGBD.
+
+Utiliza os ganchos de database.instrument, chamados antes e depois de
+cada consulta com um database.QueryEvent: consulta normalizada
+(fingerprint), quantidade de parâmetros, duração, tuplas retornadas e
+o método de Tabela que originou a consulta.
+
+São providos dois ganchos:
+
+- Estatisticas: agrega as consultas por fingerprint;
+- DetectorNmais1: avisa quando a mesma consulta é repetida mais de
+  `limite` vezes dentro de uma mesma ação de menu, sintoma típico do
+  problema de N+1 consultas (ex.: um select por item de uma lista).
+
+As ações de menu são delimitadas pelo bloco with acao(nome). A
+instrumentação é ativada ao definir a variável de ambiente
+TECA_INSTRUMENTACAO=1, ou chamando ativar().
+
+Ex.:
+
+>>> from teca import instrumentacao
+>>> instrumentacao.ativar(limite=5)
+>>> with instrumentacao.acao('Consultar livros'):
+...     for livro in database.Livro.select_all():
+...         livro.autores
+Aviso: possível N+1 em 'Consultar livros': 6x via Livro.related
+    SELECT a.livro_isbn, t.cpf, t.nome, t.nacionalidade FROM autor_livro a ...
+>>> instrumentacao.relatorio()
+"""
+
+import collections
+import contextlib
+import os
+import threading
+from tabulate import tabulate
+from teca import database
+
+
+HABILITADO = os.environ.get('TECA_INSTRUMENTACAO') == '1'
+
+
+class Estatisticas(object):
+
+    """Gancho que agrega as consultas executadas por fingerprint."""
+
+    def __init__(self):
+        self.consultas = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def before(self, evento):
+        pass
+
+    def after(self, evento):
+        with self._lock:
+            item = self.consultas.get(evento.fingerprint)
+            if item is None:
+                item = self.consultas[evento.fingerprint] = {
+                    'vezes': 0, 'tempo': 0.0, 'maximo': 0.0,
+                    'tuplas': 0, 'erros': 0, 'origens': set()}
+            item['vezes'] += 1
+            item['tempo'] += evento.duration
+            item['maximo'] = max(item['maximo'], evento.duration)
+            item['tuplas'] += evento.rows or 0
+            item['erros'] += evento.error is not None
+            if evento.caller:
+                item['origens'].add(evento.caller)
+
+    @property
+    def total(self):
+        """Quantidade total de consultas executadas."""
+        return sum(item['vezes'] for item in self.consultas.values())
+
+    def limpar(self):
+        with self._lock:
+            self.consultas.clear()
+
+    def linhas(self, n=None):
+        """Consultas ordenadas pelo tempo total, das mais custosas."""
+        ordem = sorted(self.consultas.items(),
+                       key=lambda kv: -kv[1]['tempo'])
+        return ordem[:n] if n else ordem
+
+
+class DetectorNmais1(object):
+
+    """Gancho que detecta consultas repetidas dentro de uma ação de menu.
+
+    Cada thread possui a sua ação corrente (veja o método acao). Quando
+    uma mesma fingerprint é executada mais de `limite` vezes dentro da
+    ação, um aviso é exibido uma única vez, com o método de Tabela que
+    originou as consultas. Os avisos ficam guardados em `avisos`.
+    """
+
+    def __init__(self, limite=5):
+        self.limite = limite
+        self.avisos = []
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def acao(self, nome):
+        """Delimita uma ação de menu; as contagens começam do zero."""
+        anterior = getattr(self._local, 'acao', None)
+        self._local.acao = (nome, collections.Counter(), set())
+        try:
+            yield
+        finally:
+            self._local.acao = anterior
+
+    def before(self, evento):
+        pass
+
+    def after(self, evento):
+        acao = getattr(self._local, 'acao', None)
+        if acao is None:
+            return
+        nome, contagem, avisados = acao
+        contagem[evento.fingerprint] += 1
+        vezes = contagem[evento.fingerprint]
+        if vezes > self.limite and evento.fingerprint not in avisados:
+            avisados.add(evento.fingerprint)
+            self.avisos.append((nome, evento.fingerprint, evento.caller))
+            origem = f' via {evento.caller}' if evento.caller else ''
+            print(f"Aviso: possível N+1 em {nome!r}: {vezes}x{origem}")
+            print(f"    {evento.fingerprint[:120]}")
+
+
+estatisticas = None
+detector = None
+
+
+def ativar(limite=5):
+    """Registra os ganchos de estatísticas e de detecção de N+1."""
+    global estatisticas, detector
+    desativar()
+    estatisticas = database.instrument(Estatisticas())
+    detector = database.instrument(DetectorNmais1(limite))
+
+
+def desativar():
+    """Remove os ganchos registrados por ativar."""
+    global estatisticas, detector
+    for gancho in (estatisticas, detector):
+        if gancho is not None:
+            database.remove_instrument(gancho)
+    estatisticas = detector = None
+
+
+def acao(nome):
+    """Delimita uma ação de menu para o detector de N+1, se ativo."""
+    if detector is None:
+        return contextlib.nullcontext()
+    return detector.acao(nome)
+
+
+def relatorio(n=20):
+    """Exibe as n consultas mais custosas registradas até o momento."""
+    if estatisticas is None:
+        print('Instrumentação desativada.')
+        return
+    linhas = []
+    for fingerprint, item in estatisticas.linhas(n):
+        media = item['tempo'] / item['vezes']
+        linhas.append([item['vezes'], f"{item['tempo'] * 1000:.1f}",
+                       f"{media * 1000:.2f}", f"{item['maximo'] * 1000:.2f}",
+                       item['tuplas'], ', '.join(sorted(item['origens'])),
+                       fingerprint[:80]])
+    headers = ['vezes', 'total ms', 'média ms', 'máx ms', 'tuplas',
+               'origem', 'consulta']
+    print(tabulate(linhas, headers, 'psql'))
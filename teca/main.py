@@ -13,22 +13,29 @@ from teca import cadastro
 from teca.usuario import tela_usuario
 from teca.admin import tela_admin
 from teca.bibliotecario import tela_bibliotecario
+from teca.sessao import Sessao
 from teca import term
 from teca import views
+from teca import indice
+from teca import instrumentacao
+from teca import cache
+from teca import materializacao
+from teca import bootstrap
 import sys
 import getpass
 
 
-def login_informacao(usuario):
+def login_informacao(sessao):
     """Tela de exibição de dados do usuário após o login."""
+    usuario = sessao.usuario
     print('Login efetuado como: ')
     print('Nome: ', usuario.nome.upper())
     print('Permissão: ', usuario.permissao.upper())
     print('Tipo de usuário: ', usuario.tipo.upper())
     if usuario.tipo in ('aluno', 'professor'):
-        extra = usuario.extra
-        if extra:
-            print('Curso: ', extra.nome_curso.upper())
+        curso = sessao.curso
+        if curso:
+            print('Curso: ', curso.nome_curso.upper())
 
 
 def tela_login():
@@ -39,26 +46,41 @@ def tela_login():
         senha = getpass.getpass(prompt='> Senha: ')
         usuario = database.login(nickname, senha)
         if usuario:
-            login_informacao(usuario)
-            if usuario.permissao == 'administrador':
-                tela_admin()
-            elif usuario.permissao == 'bibliotecario':
-                tela_bibliotecario()
-            elif usuario.permissao == 'usuario':
-                tela_usuario(usuario.matricula)
+            with Sessao(usuario) as sessao:
+                login_informacao(sessao)
+                if usuario.permissao == 'administrador':
+                    tela_admin()
+                elif usuario.permissao == 'bibliotecario':
+                    tela_bibliotecario()
+                elif usuario.permissao == 'usuario':
+                    tela_usuario(sessao)
             break
         else:
             print("Usuário ou senha inválidos! Tente novamente.")
 
 
 def main():
-    """Tela inicial do sistema."""
+    """Tela inicial do sistema.
+
+    Com o subcomando bootstrap (teca bootstrap), cria o esquema e carrega
+    os dados iniciais (veja teca.bootstrap).
+    """
+    if sys.argv[1:2] == ['bootstrap']:
+        sys.exit(bootstrap.main(sys.argv[2:]))
     # ------------LOGIN INICIAL-----------------
     status = database.Database.try_connect()
     if not status:
         print("Erro: Banco de dados não disponível para acesso! ")
         sys.exit(1)
     conn = database.Database.connect()
+    if indice.HABILITADO:
+        indice.ativar()
+    if cache.HABILITADO:
+        cache.ativar()
+    if materializacao.HABILITADO:
+        materializacao.ativar()
+    if instrumentacao.HABILITADO:
+        instrumentacao.ativar()
     print("Seja bem-vindo a TECA! Pressione Ctrl-C para interromper a tela.")
     while True:
         opcoes = {
@@ -84,6 +106,10 @@ def main():
                 break
         except (KeyboardInterrupt, EOFError):
             print('\nOperação cancelada!')
+    if instrumentacao.HABILITADO:
+        instrumentacao.relatorio()
+        if cache.consultas is not None:
+            print('Cache de consultas:', cache.consultas.estatisticas())
     print("Saindo? Adeus então.")
     conn.close()
 
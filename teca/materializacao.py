@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Tabelas de resumo (views materializadas) mantidas incrementalmente.
+
+As views view_livro_autores e view_reserva_livro refazem junções,
+GROUP_CONCAT e ORDER BY sobre todo o acervo a cada leitura. Este módulo
+mantém o resultado delas em tabelas de resumo (veja modelo/povoar.sql):
+
+- resumo_livro_autores: (isbn, titulo, autores), uma tupla por livro
+  com autores, com os nomes em ordem e separados por vírgula;
+- resumo_reserva_livro: (matricula, isbn, titulo, nome_usuario,
+  data_de_reserva, data_contemplado), uma tupla por reserva.
+
+As tabelas são atualizadas pelas escritas do ORM (database.on_write):
+apenas as tuplas dos livros, usuários e reservas afetados são
+recalculadas. Escritas sem as tuplas afetadas (ex.: a fila de reservas,
+em teca.fila) fazem o resumo correspondente ser reconstruído inteiro.
+Escritas feitas fora do ORM (ex.: pelo cliente do MySQL) não são vistas:
+para esses casos há a reconstrução completa e o verificador.
+
+Os resumos são mantidos ao iniciar o programa (ou a fila de reservas)
+com a variável de ambiente TECA_MATERIALIZACAO=1, ou chamando ativar().
+Todos os processos que escrevem no banco devem ativá-los; do contrário,
+reconstrua os resumos antes de voltar a lê-los.
+
+Ex.:
+
+    $ python -m teca.materializacao verificar
+    $ python -m teca.materializacao reconstruir
+"""
+
+import argparse
+import itertools
+import os
+import sys
+from mysql.connector import DatabaseError
+from teca import database
+
+
+HABILITADO = os.environ.get('TECA_MATERIALIZACAO') == '1'
+
+
+class ResumoLivroAutores(database.Tabela):
+    _table = 'resumo_livro_autores'
+    _columns = ['isbn', 'titulo', 'autores']
+    _primary_key = ['isbn']
+    _origem = {'isbn': 'l.isbn'}
+
+    @classmethod
+    def calcular(cls, where='', params=()):
+        """Computa as tuplas do resumo a partir das tabelas do acervo."""
+        conn = database.Database.connect()
+        sql = ("SELECT l.isbn, l.titulo, a.nome "
+               "FROM autor_livro al "
+               "JOIN livro l ON l.isbn = al.livro_isbn "
+               "JOIN autor a ON a.cpf = al.autor_cpf "
+               f"{where} ORDER BY l.isbn, a.nome")
+        linhas = conn.query(sql, params)
+        return [cls(isbn, titulo, ', '.join(nome for _, _, nome in grupo))
+                for (isbn, titulo), grupo in itertools.groupby(
+                    linhas, key=lambda linha: linha[:2])]
+
+
+class ResumoReservaLivro(database.Tabela):
+    _table = 'resumo_reserva_livro'
+    _columns = ['matricula', 'isbn', 'titulo', 'nome_usuario',
+                'data_de_reserva', 'data_contemplado']
+    _primary_key = ['matricula', 'isbn']
+    _origem = {'matricula': 'r.matricula', 'isbn': 'r.isbn'}
+
+    @classmethod
+    def calcular(cls, where='', params=()):
+        """Computa as tuplas do resumo a partir das tabelas do acervo."""
+        conn = database.Database.connect()
+        sql = ("SELECT r.matricula, r.isbn, l.titulo, u.nome, "
+               "r.data_de_reserva, r.data_contemplado "
+               "FROM reserva r "
+               "JOIN livro l ON l.isbn = r.isbn "
+               "JOIN usuario u ON u.matricula = r.matricula "
+               f"{where}")
+        return [cls(*linha) for linha in conn.query(sql, params)]
+
+
+RESUMOS = (ResumoLivroAutores, ResumoReservaLivro)
+
+_ativa = False
+desatualizada = False  # uma sincronização falhou desde a reconstrução
+
+# consultas lidas por views.py no lugar das views
+SQL_LIVRO_AUTORES = ('SELECT titulo, autores FROM resumo_livro_autores '
+                     'ORDER BY titulo')
+COLUNAS_RESERVA_LIVRO = ('isbn, titulo, nome_usuario, data_de_reserva, '
+                         'data_contemplado')
+
+
+def _in(colunas, valores):
+    """Cláusula IN (...) para uma coluna ou várias (row-value)."""
+    if len(colunas) == 1:
+        marcadores = ', '.join(['%s'] * len(valores))
+        return f'{colunas[0]} IN ({marcadores})', tuple(valores)
+    tupla = '(' + ', '.join(['%s'] * len(colunas)) + ')'
+    marcadores = ', '.join([tupla] * len(valores))
+    params = tuple(v for valor in valores for v in valor)
+    return f"({', '.join(colunas)}) IN ({marcadores})", params
+
+
+def recalcular(resumo, colunas, valores):
+    """Recalcula as tuplas do resumo onde colunas estão entre os valores.
+
+    Ex.:
+    >>> recalcular(ResumoLivroAutores, ['isbn'], ['9788576082675'])
+    >>> recalcular(ResumoReservaLivro, ['matricula', 'isbn'],
+    ...            [(394192, '9788576082675')])
+    """
+    conn = database.Database.connect()
+    valores = [v for v in dict.fromkeys(valores) if v is not None]
+    origem = [resumo._origem[c] for c in colunas]
+    with database.Database.transaction():
+        for chunk in database.Tabela._in_batches(valores):
+            filtro, params = _in(colunas, chunk)
+            conn.commit(f'DELETE FROM {resumo._table} WHERE {filtro}', params)
+            database.notify_write(resumo, 'delete')
+            filtro, params = _in(origem, chunk)
+            linhas = resumo.calcular(f'WHERE {filtro}', params)
+            if linhas:
+                resumo.insert_many(linhas)
+
+
+def reconstruir(resumos=RESUMOS):
+    """Reconstrói as tabelas de resumo inteiras.
+
+    Retorna {tabela: quantidade de tuplas}.
+    """
+    global desatualizada
+    conn = database.Database.connect()
+    quantidades = {}
+    with database.Database.transaction():
+        for resumo in resumos:
+            conn.commit(f'DELETE FROM {resumo._table}')
+            database.notify_write(resumo, 'delete')
+            linhas = resumo.calcular()
+            resumo.insert_many(linhas)
+            quantidades[resumo._table] = len(linhas)
+    if set(resumos) == set(RESUMOS):
+        desatualizada = False
+    return quantidades
+
+
+def verificar(resumos=RESUMOS):
+    """Compara as tabelas de resumo com o resultado recalculado.
+
+    Retorna {tabela: {'faltando': [...], 'sobrando': [...],
+    'divergentes': [...]}}, com as chaves-primárias das tuplas
+    inconsistentes. Listas vazias significam resumo consistente.
+    """
+    resultado = {}
+    for resumo in resumos:
+        esperado = {o._values[:len(resumo._primary_key)]: o._values
+                    for o in resumo.calcular()}
+        atual = {o._values[:len(resumo._primary_key)]: o._values
+                 for o in resumo.select_all()}
+        resultado[resumo._table] = {
+            'faltando': sorted(esperado.keys() - atual.keys()),
+            'sobrando': sorted(atual.keys() - esperado.keys()),
+            'divergentes': sorted(k for k in esperado.keys() & atual.keys()
+                                  if esperado[k] != atual[k]),
+        }
+    return resultado
+
+
+def _chaves(objetos, *colunas):
+    """Valores (atuais e antigos) das colunas dos objetos escritos."""
+    chaves = set()
+    for objeto in objetos:
+        for valores in ([getattr(objeto, c) for c in colunas],
+                        [objeto.old.get(c) for c in colunas]):
+            if None not in valores:
+                chaves.add(valores[0] if len(colunas) == 1
+                           else tuple(valores))
+    return chaves
+
+
+def _autores_livros(cpfs):
+    conn = database.Database.connect()
+    isbns = set()
+    for chunk in database.Tabela._in_batches(cpfs):
+        filtro, params = _in(['autor_cpf'], chunk)
+        sql = f'SELECT livro_isbn FROM autor_livro WHERE {filtro}'
+        isbns.update(isbn for (isbn,) in conn.query(sql, params))
+    return isbns
+
+
+def sincronizar(tabela, operacao, objetos):
+    """Atualiza as tabelas de resumo após uma escrita do ORM."""
+    if tabela is database.Livro:
+        if not objetos:
+            reconstruir()
+            return
+        isbns = _chaves(objetos, 'isbn')
+        recalcular(ResumoLivroAutores, ['isbn'], isbns)
+        recalcular(ResumoReservaLivro, ['isbn'], isbns)
+    elif tabela is database.AutorLivro:
+        if not objetos:
+            reconstruir([ResumoLivroAutores])
+        else:
+            recalcular(ResumoLivroAutores, ['isbn'],
+                       _chaves(objetos, 'livro_isbn'))
+    elif tabela is database.Autor:
+        if not objetos or operacao == 'delete':
+            # os vínculos em autor_livro já foram apagados em cascata
+            reconstruir([ResumoLivroAutores])
+        else:
+            recalcular(ResumoLivroAutores, ['isbn'],
+                       _autores_livros(_chaves(objetos, 'cpf')))
+    elif tabela is database.Usuario:
+        if not objetos:
+            reconstruir([ResumoReservaLivro])
+        else:
+            recalcular(ResumoReservaLivro, ['matricula'],
+                       _chaves(objetos, 'matricula'))
+    elif tabela is database.Reserva:
+        if not objetos:
+            reconstruir([ResumoReservaLivro])
+        else:
+            recalcular(ResumoReservaLivro, ['matricula', 'isbn'],
+                       _chaves(objetos, 'matricula', 'isbn'))
+
+
+def on_write(tabela, operacao, objetos):
+    """Gancho de database.on_write que mantém os resumos sincronizados.
+
+    Dentro de uma Database.transaction, as escritas nos resumos fazem
+    parte da mesma transação e são desfeitas junto com ela (rollback).
+    Uma falha na sincronização é propagada, para que a transação seja
+    desfeita inteira: do contrário, o commit externo gravaria o resumo
+    pela metade (ex.: apagado e não recalculado).
+
+    Fora de uma transação, a escrita original já foi confirmada e o
+    recálculo, feito numa transação própria, é desfeito por inteiro: o
+    resumo é marcado como desatualizado e um aviso é exibido.
+    """
+    global desatualizada
+    if tabela is None or tabela in RESUMOS:
+        return
+    try:
+        sincronizar(tabela, operacao, objetos)
+    except DatabaseError as e:
+        if database.Database.connect().in_transaction:
+            raise
+        desatualizada = True
+        print(f"Aviso: materializacao: {e}. "
+              "Execute: python -m teca.materializacao reconstruir")
+
+
+def ativar():
+    """Passa a manter os resumos, se as tabelas existem no esquema.
+
+    Retorna True se os resumos foram ativados.
+    """
+    global _ativa
+    desativar()
+    conn = database.Database.connect()
+    try:
+        for resumo in RESUMOS:
+            list(conn.query(f'SELECT 1 FROM {resumo._table} LIMIT 1'))
+    except DatabaseError as e:
+        print(f"Aviso: tabelas de resumo indisponíveis ({e}).")
+        return False
+    database.on_write(on_write)
+    _ativa = True
+    return True
+
+
+def desativar():
+    """Deixa de manter os resumos; as views voltam a ser lidas."""
+    global _ativa
+    database.remove_write_listener(on_write)
+    _ativa = False
+
+
+def ativa():
+    """Verifica se os resumos estão sendo mantidos (e podem ser lidos)."""
+    return _ativa and not desatualizada
+
+
+def origem(view):
+    """Tabela a ser lida para uma view: o resumo, se ativo, ou a view."""
+    resumos = {'view_livro_autores': ResumoLivroAutores,
+               'view_reserva_livro': ResumoReservaLivro}
+    return resumos[view]._table if ativa() else view
+
+
+def main(argv=None):
+    """Linha de comando: reconstrução e verificação dos resumos."""
+    parser = argparse.ArgumentParser(prog='python -m teca.materializacao',
+                                     description=__doc__.split('\n')[0])
+    parser.add_argument('comando', choices=['verificar', 'reconstruir'])
+    args = parser.parse_args(argv)
+    if not database.Database.try_connect():
+        print("Erro: Banco de dados não disponível para acesso! ")
+        return 1
+    conn = database.Database.connect()
+    try:
+        if args.comando == 'reconstruir':
+            for tabela, n in reconstruir().items():
+                print(f'{tabela}: {n} tupla(s)')
+            return 0
+        inconsistente = False
+        for tabela, problemas in verificar().items():
+            for tipo, chaves in problemas.items():
+                if chaves:
+                    inconsistente = True
+                    print(f'{tabela}: {len(chaves)} tupla(s) {tipo}: '
+                          f'{chaves[:5]}')
+        print('Resumos inconsistentes.' if inconsistente
+              else 'Resumos consistentes.')
+        return 1 if inconsistente else 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Sessão de login: estado do usuário logado mantido em memória.
+
+No login são carregados numa única consulta o usuário, a sua
+especialização (Aluno, Professor ou Funcionario) e o curso (veja
+database.Usuario.perfil). Para usuários com permissão 'usuario', os
+empréstimos e as reservas, com os respectivos livros, são carregados em
+outra consulta (database.Usuario.circulacao); administradores e
+bibliotecários, que não os utilizam, só os carregam se forem acessados.
+As telas consultam a sessão invés de refazer as consultas a cada volta
+do menu.
+
+A sessão escuta as escritas do ORM (database.on_write) e marca como
+desatualizadas apenas as partes afetadas: um novo empréstimo do usuário
+recarrega os empréstimos, uma reserva contemplada pela fila recarrega as
+reservas, e assim por diante. Cada parte é recarregada no próximo acesso,
+junto com as demais partes do seu grupo (veja GRUPOS), na mesma consulta.
+
+Ex.:
+
+>>> usuario = database.login('Samuel', '1234')
+>>> with Sessao(usuario) as sessao:
+...     sessao.extra.livros_max
+...     [e.livro.titulo for e in sessao.emprestimos]
+"""
+
+from teca import database
+
+
+SUBTIPOS = (database.Aluno, database.Professor, database.Funcionario)
+
+PARTES = ('usuario', 'extra', 'curso', 'emprestimos', 'reservas')
+
+# partes carregadas juntas, numa única consulta
+PERFIL = ('usuario', 'extra', 'curso')
+CIRCULACAO = ('emprestimos', 'reservas')
+GRUPOS = {parte: grupo for grupo in (PERFIL, CIRCULACAO) for parte in grupo}
+
+
+class Sessao(object):
+
+    """Estado do usuário logado, atualizado a partir das escritas do ORM.
+
+    Atributos (carregados sob demanda quando desatualizados)
+    ---------
+    usuario: database.Usuario logado, ou None se foi apagado.
+    extra: objeto da especialização (Aluno, Professor ou Funcionario).
+    curso: database.Curso de alunos e professores, ou None.
+    emprestimos: empréstimos do usuário, com o livro carregado.
+    reservas: reservas do usuário, com o livro carregado.
+    """
+
+    def __init__(self, usuario):
+        self.matricula = usuario.matricula
+        self._partes = {'usuario': usuario}
+        self._desatualizadas = set(PARTES) - {'usuario'}
+        self.recargas = dict.fromkeys(PARTES, 0)
+        self.aberta = False
+
+    def abrir(self):
+        """Carrega o perfil (e a circulação, para a permissão 'usuario') e
+        passa a escutar as escritas do ORM."""
+        self._carregar('extra')
+        usuario = self.usuario
+        if usuario is not None and usuario.permissao == 'usuario':
+            self._carregar('emprestimos')
+        database.on_write(self.on_write)
+        self.aberta = True
+        return self
+
+    def fechar(self):
+        """Deixa de escutar as escritas do ORM."""
+        database.remove_write_listener(self.on_write)
+        self.aberta = False
+
+    def __enter__(self):
+        return self.abrir()
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def _carregar(self, parte):
+        """Carrega uma parte e as demais do seu grupo numa só consulta."""
+        grupo = GRUPOS[parte]
+        self._desatualizadas.difference_update(grupo)
+        for p in grupo:
+            self.recargas[p] += 1
+        if grupo is PERFIL:
+            valores = database.Usuario.perfil(self.matricula)
+        else:
+            valores = database.Usuario.circulacao(self.matricula)
+        self._partes.update(zip(grupo, valores))
+        return self._partes[parte]
+
+    def _parte(self, parte):
+        if parte in self._desatualizadas or parte not in self._partes:
+            return self._carregar(parte)
+        return self._partes[parte]
+
+    @property
+    def usuario(self):
+        return self._parte('usuario')
+
+    @property
+    def extra(self):
+        return self._parte('extra')
+
+    @property
+    def curso(self):
+        return self._parte('curso')
+
+    @property
+    def emprestimos(self):
+        return self._parte('emprestimos')
+
+    @property
+    def reservas(self):
+        return self._parte('reservas')
+
+    def invalidar(self, *partes):
+        """Marca partes da sessão para serem recarregadas (todas, sem args)."""
+        self._desatualizadas.update(partes or PARTES)
+
+    def _afeta(self, objetos, coluna):
+        """Verifica se alguma escrita envolve o usuário da sessão.
+
+        Uma lista vazia de objetos (tuplas desconhecidas) é considerada
+        como afetando a sessão.
+        """
+        if not objetos:
+            return True
+        return any(self.matricula in (getattr(o, coluna), o.old.get(coluna))
+                   for o in objetos)
+
+    def _livros(self):
+        return {e.isbn for e in self._partes.get('emprestimos') or ()} | \
+            {r.isbn for r in self._partes.get('reservas') or ()}
+
+    def on_write(self, tabela, operacao, objetos):
+        """Marca como desatualizadas as partes afetadas por uma escrita."""
+        if tabela is None:
+            self.invalidar()
+        elif tabela is database.Usuario:
+            if self._afeta(objetos, 'matricula'):
+                self.invalidar('usuario', 'extra', 'curso')
+        elif tabela in SUBTIPOS:
+            coluna = tabela._primary_key[0]
+            if self._afeta(objetos, coluna):
+                self.invalidar('extra', 'curso')
+        elif tabela is database.Curso:
+            cod_curso = getattr(self._partes.get('extra'), 'cod_curso', None)
+            if not objetos or cod_curso in {o.cod_curso for o in objetos}:
+                self.invalidar('curso')
+        elif tabela is database.Emprestimo:
+            if self._afeta(objetos, 'matricula'):
+                self.invalidar('emprestimos')
+        elif tabela is database.Reserva:
+            if self._afeta(objetos, 'matricula'):
+                self.invalidar('reservas')
+        elif tabela is database.Livro:
+            isbns = {o.isbn for o in objetos} | \
+                {o.old.get('isbn') for o in objetos}
+            if not objetos or isbns & self._livros():
+                self.invalidar('emprestimos', 'reservas')
@@ -3,14 +3,181 @@
 
 """Módulo para operações comuns de entrada/saída no terminal.
 
-Utiliza a biblioteca de formatação de tabelas, a tabulate além da
-interface de comunicação de banco de dados, a database.py.
+Utiliza a interface de comunicação de banco de dados, a database.py.
+As tabelas são exibidas página a página pelo Paginador, que lê as
+tuplas de cada página sob demanda.
 """
 
-from tabulate import tabulate
+import collections
+import numbers
+import sys
 from teca import database
 
 
+LINHAS_POR_PAGINA = 20
+LINHAS_AMOSTRA = 100  # tuplas usadas para calcular as larguras
+LINHAS_POR_BLOCO = 1000  # tuplas por leitura na saída não interativa
+LARGURA_MAXIMA = 50
+PAGINAS_EM_CACHE = 5
+
+
+def _texto(valor):
+    return '' if valor is None else str(valor).replace('\n', ' ')
+
+
+class Paginador(object):
+
+    """Exibe tuplas página a página, lidas sob demanda de uma fonte.
+
+    Diferente de tabulate, as tuplas não são carregadas todas na memória
+    antes da exibição: as larguras das colunas são fixadas a partir das
+    primeiras LINHAS_AMOSTRA tuplas (textos maiores são cortados) e cada
+    página é lida da fonte quando exibida, numa consulta limitada (ex.:
+    com LIMIT e OFFSET). Nenhum cursor fica aberto enquanto o usuário
+    escolhe a próxima página. As últimas páginas lidas ficam num cache
+    limitado.
+
+    Parâmetros
+    ----------
+    headers: nomes das colunas.
+    fonte: função fonte(inicio, quantidade) que retorna até quantidade
+    tuplas a partir da posição inicio (a partir de 0), ex.:
+    lambda inicio, quantidade: database.Livro.select_page(inicio,
+    quantidade).
+    larguras: larguras fixas das colunas, se conhecidas.
+
+    Ex.:
+    >>> Paginador(database.Livro._columns,
+    ...           lambda i, n: map(list, database.Livro.select_page(i, n))
+    ...           ).exibir()
+    """
+
+    def __init__(self, headers, fonte, larguras=None,
+                 tamanho=LINHAS_POR_PAGINA, paginas_em_cache=PAGINAS_EM_CACHE):
+        self.headers = [str(h) for h in headers]
+        self.fonte = fonte
+        self.larguras = larguras
+        self.tamanho = tamanho
+        self.paginas_em_cache = paginas_em_cache
+        self.paginas = collections.OrderedDict()  # número -> tuplas
+        self.ultima = None  # número da última página, quando conhecido
+
+    def _ler(self, inicio, quantidade):
+        return [list(linha) for linha in self.fonte(inicio, quantidade)]
+
+    def _amostrar(self):
+        """Fixa as larguras das colunas a partir das primeiras tuplas."""
+        amostra = self._ler(0, max(LINHAS_AMOSTRA, self.tamanho + 1))
+        self.larguras = [
+            min(LARGURA_MAXIMA,
+                max([len(h)] + [len(_texto(linha[i])) for linha in amostra]))
+            for i, h in enumerate(self.headers)]
+        self._guardar(0, amostra)
+
+    def _guardar(self, n, linhas):
+        """Guarda a página n das tuplas lidas a partir do seu início.
+
+        Uma tupla além da página indica que ela não é a última.
+        """
+        if len(linhas) <= self.tamanho:
+            self.ultima = n
+        self.paginas[n] = linhas[:self.tamanho]
+        while len(self.paginas) > self.paginas_em_cache:
+            self.paginas.popitem(last=False)
+        return self.paginas[n]
+
+    def pagina(self, n):
+        """Retorna as tuplas da página n (a partir de 0)."""
+        if self.larguras is None:
+            self._amostrar()
+        if n in self.paginas:
+            self.paginas.move_to_end(n)
+            return self.paginas[n]
+        return self._guardar(n, self._ler(n * self.tamanho,
+                                          self.tamanho + 1))
+
+    def _celula(self, valor, largura):
+        texto = _texto(valor)
+        if len(texto) > largura:
+            texto = texto[:largura - 1] + '…'
+        if isinstance(valor, numbers.Number) and not isinstance(valor, bool):
+            return texto.rjust(largura)
+        return texto.ljust(largura)
+
+    def _borda(self, canto='+'):
+        return canto + '+'.join('-' * (w + 2) for w in self.larguras) + canto
+
+    def _linha(self, valores, celula=None):
+        celula = celula or self._celula
+        return '| ' + ' | '.join(celula(v, w) for v, w in
+                                 zip(valores, self.larguras)) + ' |'
+
+    def _cabecalho(self):
+        return [self._borda(),
+                self._linha(self.headers, lambda h, w: h[:w].ljust(w)),
+                self._borda('|')]
+
+    def imprimir_pagina(self, n):
+        """Imprime a página n como uma tabela."""
+        linhas = self.pagina(n)
+        print('\n'.join(self._cabecalho() +
+                        [self._linha(linha) for linha in linhas] +
+                        [self._borda()]))
+
+    def exibir(self, interativo=None):
+        """Exibe as páginas com navegação: [n] próxima, [p] anterior e
+        [q] sair.
+
+        Sem terminal interativo (ex.: saída redirecionada), todas as
+        tuplas são impressas numa única tabela, lidas em blocos de
+        LINHAS_POR_BLOCO (não há espera pelo usuário entre as leituras).
+        """
+        if interativo is None:
+            interativo = sys.stdin.isatty() and sys.stdout.isatty()
+        if not interativo:
+            self.pagina(0)
+            print('\n'.join(self._cabecalho()))
+            inicio = 0
+            while True:
+                linhas = self._ler(inicio, LINHAS_POR_BLOCO)
+                for linha in linhas:
+                    print(self._linha(linha))
+                if len(linhas) < LINHAS_POR_BLOCO:
+                    break
+                inicio += len(linhas)
+            print(self._borda())
+            return
+
+        n = 0
+        while True:
+            self.imprimir_pagina(n)
+            if self.ultima == 0:
+                return
+            total = f' de {self.ultima + 1}' if self.ultima is not None else ''  # noqa
+            try:
+                op = input(f'Página {n + 1}{total}. '
+                           '[n] próxima, [p] anterior, [q] sair: ')
+            except EOFError:
+                op = 'q'
+            op = op.strip().lower() or 'n'
+            if op == 'q':
+                return
+            elif op == 'p':
+                n = max(n - 1, 0)
+            elif op == 'n':
+                if n == self.ultima:
+                    print('Última página.')
+                else:
+                    n += 1
+            else:
+                print('Opção inválida')
+
+
+def paginar(headers, fonte, larguras=None, interativo=None):
+    """Cria um Paginador e exibe as tuplas (veja Paginador)."""
+    Paginador(headers, fonte, larguras).exibir(interativo)
+
+
 def sumario_emprestimo(e):
     """Exibi um empréstimo feito no sistema."""
     return f'{e.isbn} / {e.livro.titulo} / {e.data_de_emprestimo}'
@@ -21,9 +188,15 @@ def sumario_reserva(r):
     return f'{r.isbn} / {r.livro.titulo} / {r.data_de_reserva}'
 
 
-def sumario_livro(l):
-    """Exibe os atributos de um livro da biblioteca."""
-    return f'{l.isbn} / {l.titulo} / {l.editora} / {l.ano} / {l.categoria} / {l.disponiveis}'
+def sumario_livro(l, disponiveis=None):
+    """Exibe os atributos de um livro da biblioteca.
+
+    A quantidade de disponíveis pode ser passada já calculada, por
+    exemplo via database.Livro.disponibilidade.
+    """
+    if disponiveis is None:
+        disponiveis = l.disponiveis
+    return f'{l.isbn} / {l.titulo} / {l.editora} / {l.ano} / {l.categoria} / {disponiveis}'
 
 
 def sumario_usuario(u):
@@ -32,14 +205,19 @@ def sumario_usuario(u):
 
 
 def imprimir_tabela(tabela):
-    """Imprime todas as tuplas da tabela"""
-    tuples = tabela.select_all()
-    if tabela == database.Usuario:
-        for u in tuples:
-            u.senha_hash = '***SECRET***'
+    """Imprime todas as tuplas da tabela, página a página.
+
+    Cada página é lida do SGBD numa consulta própria (veja
+    Tabela.select_page).
+    """
+    def tuplas(inicio, quantidade):
+        for objeto in tabela.select_page(inicio, quantidade,
+                                         columns=tabela._columns):
+            if tabela == database.Usuario:
+                objeto.senha_hash = '***SECRET***'
+            yield list(objeto)
 
-    rows = [list(row) for row in tuples]
-    print(tabulate(rows, tabela._columns, 'psql'))
+    paginar(tabela._columns, tuplas)
 
 
 def menu_enumeracao(opcoes):
@@ -65,10 +243,20 @@ def menu_enumeracao(opcoes):
 
 
 def imprimir_livros(livros):
-    """Realiza a listagem e impressão dos livros disponíveis."""
-    rows = [list(l) + [l.disponiveis] for l in livros]
+    """Realiza a listagem e impressão dos livros disponíveis.
+
+    A disponibilidade é consultada apenas para os livros de cada página,
+    à medida que as páginas são exibidas.
+    """
+    livros = list(livros)
+
+    def tuplas(inicio, quantidade):
+        bloco = livros[inicio:inicio + quantidade]
+        disponiveis = database.Livro.disponibilidade([l.isbn for l in bloco])
+        return [list(l) + [disponiveis.get(l.isbn)] for l in bloco]
+
     headers = database.Livro._columns + ['disponíveis']
-    print(tabulate(rows, headers, 'psql'))
+    paginar(headers, tuplas)
 
 
 def selecionar_usuario():
@@ -92,11 +280,13 @@ def selecionar_livro():
     query = input("Pesquise por isbn, título, editora, categoria ou ano: ")
     livros = database.Livro.search(query, ['titulo', 'editora',
                                            'ano', 'categoria'])
+    database.Livro.prefetch(livros, 'categoria')
     if not livros:
         print("Nenhum livro encontrado!")
         return selecionar_livro()
+    disponiveis = database.Livro.disponibilidade([l.isbn for l in livros])
     livros_map = {str(idx+1): u for idx, u in enumerate(livros)}
-    livros_enum = {k: sumario_livro(l)
+    livros_enum = {k: sumario_livro(l, disponiveis.get(l.isbn))
                    for k, l in livros_map.items()}
     print("== LIVROS")
     print("   isbn / titulo / editora / ano / categoria / disponíveis")
@@ -9,6 +9,7 @@ SQL, como também importações de módulos criados pela nossa equipe.
 
 from teca import database
 from teca import term
+from teca import instrumentacao
 from datetime import datetime
 from tabulate import tabulate
 from teca.term import selecionar_livro
@@ -60,13 +61,13 @@ def consultar_livros():
         imprimir_livros(livros)
 
 
-def consultar_emprestimos(usuario):
+def consultar_emprestimos(sessao):
     """Mostra os empréstimos feitos por título,ISBN,data de empréstimo e devolução."""
-    emprestimos = usuario.emprestimos
+    emprestimos = sessao.emprestimos
     print("== EMPRESTIMOS")
     for e in emprestimos:
         print("==============")
-        livro = database.Livro.select(e.isbn)
+        livro = e.livro
         data_de_emprestimo = e.data_de_emprestimo.strftime("%d/%m/%Y")
         data_de_devolucao = e.data_de_devolucao.strftime("%d/%m/%Y")
         print("Título: ", livro.titulo)
@@ -76,13 +77,13 @@ def consultar_emprestimos(usuario):
     print("==============")
 
 
-def consultar_reservas(usuario):
+def consultar_reservas(sessao):
     """Faz a consulta de reservas por meio de listagem."""
-    reservas = usuario.reservas
+    reservas = sessao.reservas
     print("== RESERVAS")
     for e in reservas:
         print("==============")
-        livro = database.Livro.select(e.isbn)
+        livro = e.livro
         data_de_reserva = e.data_de_reserva.strftime("%d/%m/%Y")
         print("Título: ", livro.titulo)
         print("ISBN: ", livro.isbn)
@@ -118,10 +119,10 @@ def realizar_reserva(usuario):
         print("Reserva não pôde ser efetuada!")
 
 
-def excluir_cadastro(usuario):
+def excluir_cadastro(sessao):
     """Realiza a exclusão do usuário caso ele não tenha nenhum empréstimo."""
-    if len(usuario.emprestimos) == 0:
-        ok = usuario.delete()
+    if len(sessao.emprestimos) == 0:
+        ok = sessao.usuario.delete()
         if ok:
             print("Usuário deletado! Adeus!!!")
         return ok
@@ -130,11 +131,15 @@ def excluir_cadastro(usuario):
     return False
 
 
-def tela_usuario(mat):
-    """Tela inicial após o login do nível usuário comum."""
+def tela_usuario(sessao):
+    """Tela inicial após o login do nível usuário comum.
+
+    Os dados do usuário vêm da sessão de login (veja teca.sessao), que
+    só os relê do SGBD quando uma escrita os altera.
+    """
     print("== TELA DE USUÁRIO ==")
     while True:
-        usuario = database.Usuario.select(mat)
+        usuario = sessao.usuario
         opcoes = {
             '1': 'Consultar livros',
             '2': 'Consultar empréstimos',
@@ -146,21 +151,23 @@ def tela_usuario(mat):
 
         opcao = term.menu_enumeracao(opcoes)
         try:
-            if opcao == '1':
-                consultar_livros()
-            elif opcao == '2':
-                consultar_emprestimos(usuario)
-            elif opcao == '3':
-                consultar_reservas(usuario)
-            elif opcao == '4':
-                realizar_reserva(usuario)
-            elif opcao == '5':
-                status = excluir_cadastro(usuario)
-                if status:
+            with database.identity_map(), \
+                    instrumentacao.acao(opcoes.get(opcao, opcao)):
+                if opcao == '1':
+                    consultar_livros()
+                elif opcao == '2':
+                    consultar_emprestimos(sessao)
+                elif opcao == '3':
+                    consultar_reservas(sessao)
+                elif opcao == '4':
+                    realizar_reserva(usuario)
+                elif opcao == '5':
+                    status = excluir_cadastro(sessao)
+                    if status:
+                        break
+                elif opcao == '0':
                     break
-            elif opcao == '0':
-                break
-            else:
-                print("Opção inválida!")
+                else:
+                    print("Opção inválida!")
         except KeyboardInterrupt:
             print("\nOperação interrompida!")
@@ -6,21 +6,19 @@
 
 
 from teca import term
-from teca import database
-from tabulate import tabulate
+from teca import instrumentacao
+from teca import cache
+from teca import materializacao
 
 
 def imprimir_consulta(sql, params=()):
-    """Recebe uma consulta SQL e gera uma string formatada como tabela"""
-    db = database.Database.connect()
-    rows = []
-    cursor = db.conn.cursor()
-    cursor.execute(sql, params)
-    for result in cursor:
-        rows.append(result)
-    headers = [k[0] for k in cursor.description]
-    cursor.close()
-    print(tabulate(rows, headers, 'psql'))
+    """Recebe uma consulta SQL e a exibe como tabela, página a página.
+
+    Cada página é lida do SGBD com LIMIT e OFFSET, ou do cache de
+    consultas, se ativo (veja cache.iterar), e exibida por term.Paginador.
+    """
+    headers, fonte = cache.iterar(sql, params)
+    term.paginar(headers, fonte)
 
 
 def view_livro_ano():
@@ -80,15 +78,17 @@ def view_reserva_livro():
     """Lista a reserva por livro, com nome de usuários e reservas.
 
     É possível optar para filtar por livro. Do contrário todas as reservas
-    serão exibidas.
+    serão exibidas. Com a materialização ativa, é lida a tabela de resumo
+    (veja teca.materializacao).
     """
-    sql = 'SELECT * FROM view_reserva_livro'
+    origem = materializacao.origem('view_reserva_livro')
+    sql = f'SELECT {materializacao.COLUNAS_RESERVA_LIVRO} FROM {origem}'
     ask = input('Deseja filtrar por livro? (y/N) ')
     params = ()
     if ask.lower() == 'y':
         print('Livros com reservas')
         livros = ('SELECT DISTINCT(isbn), titulo '
-                  'FROM view_reserva_livro '
+                  f'FROM {origem} '
                   'ORDER BY titulo')
         imprimir_consulta(livros)
         key = input('titulo ou isbn: ')
@@ -96,12 +96,19 @@ def view_reserva_livro():
         where = " WHERE isbn LIKE %s OR titulo LIKE %s"
         params = (key, key)
         sql += where
+    sql += ' ORDER BY titulo, data_de_reserva'
     imprimir_consulta(sql, params)
 
 
 def view_livro_autores():
-    """Utiliza o método imprimir_consulta que busca no MySQL a view."""
-    imprimir_consulta('SELECT * FROM view_livro_autores')
+    """Utiliza o método imprimir_consulta que busca no MySQL a view.
+
+    Com a materialização ativa, é lida a tabela de resumo.
+    """
+    if materializacao.ativa():
+        imprimir_consulta(materializacao.SQL_LIVRO_AUTORES)
+    else:
+        imprimir_consulta('SELECT * FROM view_livro_autores')
 
 
 def tela_views():
@@ -125,22 +132,23 @@ def tela_views():
             break
 
         try:
-            if op == '1':
-                view_livro_ano()
-            elif op == '2':
-                view_livro_categoria()
-            elif op == '3':
-                view_livro_editora()
-            elif op == '4':
-                view_livro_autores()
-            elif op == '5':
-                view_professor_curso()
-            elif op == '6':
-                view_reserva_livro()
-            elif op == '0':
-                break
-            else:
-                print('Não implementado!')
+            with instrumentacao.acao(opcoes.get(op, op)):
+                if op == '1':
+                    view_livro_ano()
+                elif op == '2':
+                    view_livro_categoria()
+                elif op == '3':
+                    view_livro_editora()
+                elif op == '4':
+                    view_livro_autores()
+                elif op == '5':
+                    view_professor_curso()
+                elif op == '6':
+                    view_reserva_livro()
+                elif op == '0':
+                    break
+                else:
+                    print('Não implementado!')
 
             input("Pressione enter para continuar...")
         except KeyboardInterrupt:
@@ -0,0 +1,29 @@
+"""Fixtures dos testes: um banco SQLite no lugar do MySQL.
+
+Veja teca.benchmark.SQLiteDatabase. Cada teste recebe um arquivo novo,
+com o esquema criado e vazio, definido como Database padrão.
+"""
+
+import os
+import pytest
+from teca import benchmark
+from teca import database
+
+
+@pytest.fixture
+def banco():
+    db = benchmark.SQLiteDatabase.criar()
+    try:
+        yield db
+    finally:
+        db.close()
+        database.Database.instance = None
+        os.remove(db.database)
+
+
+@pytest.fixture
+def acervo(banco):
+    """Banco povoado com um acervo sintético pequeno."""
+    dados = benchmark.gerar(usuarios=60, livros=80, autores=20)
+    benchmark.povoar(dados)
+    return dict(dados)
@@ -0,0 +1,177 @@
+"""Testes da interface assíncrona (teca.assincrono) sobre o SQLite."""
+
+import asyncio
+import threading
+import pytest
+from teca import assincrono
+from teca import benchmark
+from teca import database
+from teca import indice
+
+
+class ContadorSincrono(object):
+
+    """Conta as consultas feitas pela interface síncrona (bloqueante)."""
+
+    def __init__(self):
+        self.total = 0
+
+    def before(self, evento):
+        pass
+
+    def after(self, evento):
+        self.total += 1
+
+
+@pytest.fixture
+def adb(acervo, banco):
+    db = assincrono.AsyncDatabase(
+        banco.database, None, None, pool_size=8,
+        factory=lambda: benchmark.ConexaoSQLite(banco.database))
+    db.use_fulltext = False
+    assincrono.AsyncDatabase.instance = db
+    try:
+        yield db
+    finally:
+        asyncio.run(db.close())
+        assincrono.AsyncDatabase.instance = None
+
+
+def _sem_consultas_bloqueantes(objetos):
+    contador = database.instrument(ContadorSincrono())
+    try:
+        for objeto in objetos:
+            objeto.senha_hash, objeto.endereco
+    finally:
+        database.remove_instrument(contador)
+    return contador.total == 0
+
+
+def test_search_carrega_todas_as_colunas(acervo, adb):
+    usuario = acervo[database.Usuario][5]
+    sobrenome = usuario.nome.split()[-1]
+    por_chave = asyncio.run(assincrono.Usuario.search(str(usuario.matricula),
+                                                      ['nome']))
+    por_trecho = asyncio.run(assincrono.Usuario.search(sobrenome, ['nome']))
+    assert usuario.matricula in {u.matricula for u in por_trecho}
+    assert _sem_consultas_bloqueantes(por_chave + por_trecho)
+
+
+def test_search_pelo_indice_carrega_colunas_adiadas(acervo, adb):
+    indice.ativar()
+    try:
+        usuario = acervo[database.Usuario][3]
+        encontrados = asyncio.run(assincrono.Usuario.search(
+            usuario.nome.split()[0], ['nome']))
+    finally:
+        indice.desativar()
+    assert encontrados
+    assert _sem_consultas_bloqueantes(encontrados)
+
+
+def test_buscas_concorrentes(acervo, adb):
+    livros = acervo[database.Livro]
+    palavras = [l.titulo.split()[0] for l in livros[:50]] * 4
+
+    async def buscar():
+        return await asyncio.gather(*[
+            assincrono.Livro.search(p, ['titulo', 'categoria'])
+            for p in palavras])
+
+    resultados = asyncio.run(buscar())
+    assert adb.pool.created <= adb.pool_size
+    for palavra, encontrados in zip(palavras, resultados):
+        esperados = database.Livro.search(palavra, ['titulo', 'categoria'])
+        assert [l.isbn for l in encontrados] == [l.isbn for l in esperados]
+
+
+def test_transacao_desfeita(acervo, adb):
+    telefone = database.Telefones(100002, '85912345678')
+
+    async def inserir():
+        async with adb.transaction():
+            await assincrono.Telefones.insert(telefone)
+            raise RuntimeError('desfaz')
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(inserir())
+    assert asyncio.run(assincrono.Telefones.filter(numero='85912345678')) == []
+    assert asyncio.run(assincrono.Telefones.insert(telefone))
+    assert len(database.Telefones.filter(numero='85912345678')) == 1
+
+
+class Ouvinte(object):
+
+    """Registra as notificações de database.on_write e onde rodaram."""
+
+    def __init__(self):
+        self.recebidas = []
+
+    def __call__(self, tabela, operacao, objetos):
+        visiveis = [database.Telefones.select((o.matricula, o.numero))
+                    for o in objetos] if tabela is database.Telefones else []
+        self.recebidas.append((tabela, operacao, threading.get_ident(),
+                               [v is not None for v in visiveis]))
+
+
+@pytest.fixture
+def ouvinte():
+    ouvinte = database.on_write(Ouvinte())
+    try:
+        yield ouvinte
+    finally:
+        database.remove_write_listener(ouvinte)
+
+
+def test_escrita_em_transacao_desfeita_nao_notifica(acervo, adb, ouvinte):
+    telefone = database.Telefones(100002, '85912345670')
+
+    async def inserir():
+        async with adb.transaction():
+            await assincrono.Telefones.insert(telefone)
+            assert ouvinte.recebidas == []
+            raise RuntimeError('desfaz')
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(inserir())
+    assert ouvinte.recebidas == []
+
+
+def test_notifica_apos_commit_fora_do_event_loop(acervo, adb, ouvinte):
+    telefone = database.Telefones(100002, '85912345671')
+    usuario = database.Usuario.select(acervo[database.Usuario][0].matricula)
+    nome = usuario.nome
+
+    async def escrever():
+        async with adb.transaction():
+            await assincrono.Telefones.insert(telefone)
+            usuario.nome = 'Nome Assíncrono'
+            await assincrono.Usuario.update(usuario)
+            assert ouvinte.recebidas == []
+        return threading.get_ident()
+
+    thread_do_loop = asyncio.run(escrever())
+    (tabela, operacao, thread, visiveis), atualizacao = ouvinte.recebidas
+    assert (tabela, operacao, visiveis) == \
+        (database.Telefones, 'insert', [True])
+    assert thread != thread_do_loop
+    assert atualizacao[:2] == (database.Usuario, 'update')
+    assert usuario.dirty() == []
+
+
+def test_indice_atualizado_apos_commit(acervo, adb):
+    indice.ativar()
+    try:
+        matricula = acervo[database.Usuario][2].matricula
+        usuario = database.Usuario.select(matricula)
+
+        async def renomear():
+            async with adb.transaction():
+                usuario.nome = 'Zacarias Quintino'
+                await assincrono.Usuario.update(usuario)
+
+        asyncio.run(renomear())
+        encontrados = database.Usuario.search('Zacarias Quintino', ['nome'])
+        assert [u.matricula for u in encontrados] == [usuario.matricula]
+    finally:
+        indice.desativar()
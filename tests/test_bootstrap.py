@@ -0,0 +1,82 @@
+"""Testes da classificação das instruções de modelo/povoar.sql."""
+
+from mysql.connector import DatabaseError
+from teca import bootstrap
+from teca import cache
+
+VIEWS = sorted(v for v in cache.DEPENDENCIAS if v.startswith('view_'))
+
+
+def _nome_view(instrucao):
+    return bootstrap.REGEX_CREATE_VIEW.sub('', instrucao).split()[0].strip('`')
+
+
+def test_etapas_emite_todas_as_views():
+    etapas = bootstrap.etapas()
+    assert sorted(map(_nome_view, etapas['views'])) == VIEWS
+    assert len(VIEWS) == 6
+
+
+def test_classificar_view_com_algoritmo_e_definer():
+    instrucao = ('CREATE\n OR REPLACE ALGORITHM = UNDEFINED\n'
+                 'DEFINER = `root`@`localhost`\nSQL SECURITY DEFINER\n'
+                 'VIEW `view_professor_curso` AS SELECT 1')
+    assert bootstrap.classificar(instrucao) == 'views'
+    assert bootstrap.classificar('CREATE OR REPLACE VIEW v AS SELECT 1') \
+        == 'views'
+    assert bootstrap.classificar('DROP VIEW IF EXISTS `v`') is None
+
+
+def test_classificar_gatilhos():
+    etapas = bootstrap.etapas()
+    assert len(etapas['gatilhos']) == 6
+    assert bootstrap.classificar(
+        'CREATE DEFINER = CURRENT_USER TRIGGER trg_1 BEFORE INSERT ON aluno '
+        'FOR EACH ROW BEGIN END') == 'gatilhos'
+
+
+class SGBDGatilhos(object):
+
+    """Executa apenas CREATE/DROP TRIGGER, como o MySQL, e CREATE VIEW."""
+
+    ER_TRG_ALREADY_EXISTS = 1359
+
+    def __init__(self):
+        self.gatilhos = set()
+        self.executadas = []
+
+    def executar(self, sql, params=(), ignorar=()):
+        self.executadas.append(sql)
+        criar = bootstrap.REGEX_CREATE_TRIGGER.match(sql)
+        apagar = bootstrap.REGEX_DROP_TRIGGER.match(sql)
+        if criar:
+            if criar.group(1) in self.gatilhos:
+                raise DatabaseError(msg='Trigger already exists',
+                                    errno=self.ER_TRG_ALREADY_EXISTS)
+            self.gatilhos.add(criar.group(1))
+        elif apagar:
+            self.gatilhos.discard(apagar.group(1))
+
+    def commit(self):
+        pass
+
+
+def test_gatilhos_apagados_antes_de_criados():
+    sgbd = SGBDGatilhos()
+    executor = bootstrap.Bootstrap.__new__(bootstrap.Bootstrap)
+    executor.etapas = bootstrap.etapas()
+    executor.executar = sgbd.executar
+    executor.conn = sgbd
+    for _ in range(2):
+        executor.criar_views_gatilhos()
+    assert sgbd.gatilhos == {'trg_1', 'trg_2', 'trg_3'}
+
+    vistos = []
+    for sql in executor.etapas['gatilhos']:
+        apagar = bootstrap.REGEX_DROP_TRIGGER.match(sql)
+        if apagar:
+            vistos.append(apagar.group(1))
+        else:
+            assert bootstrap.REGEX_CREATE_TRIGGER.match(sql).group(1) == \
+                vistos[-1]
+    assert sorted(vistos) == ['trg_1', 'trg_2', 'trg_3']
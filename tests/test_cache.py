@@ -0,0 +1,78 @@
+"""Testes do cache de consultas das views (teca.cache)."""
+
+import pytest
+from teca import cache
+from teca import database
+
+
+class Relogio(object):
+
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+
+@pytest.fixture
+def consultas(acervo):
+    consultas = cache.CacheConsultas(relogio=Relogio())
+    database.on_write(consultas.on_write)
+    try:
+        yield consultas
+    finally:
+        database.remove_write_listener(consultas.on_write)
+
+
+SQL = 'SELECT * FROM view_livro_ano'
+
+
+def test_dependencias():
+    assert cache.dependencias('SELECT * FROM view_livro_autores') == \
+        {'livro', 'autor', 'autor_livro'}
+    assert cache.dependencias('SELECT * FROM desconhecida') is None
+    assert cache.ttl('SELECT * FROM view_livro_autores '
+                     'JOIN view_reserva_livro') == 30
+
+
+def test_acerto_e_expiracao(consultas):
+    resultado = consultas.consultar(SQL)
+    assert consultas.consultar(SQL) is resultado
+    consultas.relogio.agora = cache.TTL['view_livro_ano']
+    assert consultas.consultar(SQL) is not resultado
+    estatisticas = consultas.estatisticas()
+    assert (estatisticas['acertos'], estatisticas['faltas'],
+            estatisticas['expiracoes']) == (1, 2, 1)
+
+
+def test_escrita_invalida_apenas_dependentes(consultas, acervo):
+    outra = 'SELECT * FROM view_professor_curso'
+    consultas.consultar(SQL)
+    consultas.consultar(outra)
+    livro = database.Livro.select(acervo[database.Livro][0].isbn)
+    livro.ano = 1901
+    livro.update()
+    assert consultas.invalidacoes == 1
+    _, tuplas = consultas.consultar(SQL)
+    assert any(livro.titulo == t[0] and t[1] == 1901 for t in tuplas)
+    consultas.consultar(outra)
+    assert consultas.acertos == 1
+
+
+def test_rollback_limpa_o_cache(consultas):
+    consultas.consultar(SQL)
+    with pytest.raises(RuntimeError):
+        with database.Database.transaction():
+            raise RuntimeError
+    assert len(consultas) == 0
+
+
+def test_iterar_guarda_cada_pagina(consultas, monkeypatch):
+    monkeypatch.setattr(cache, 'consultas', consultas)
+    headers, tuplas = consultas.consultar(SQL)
+    headers_paginados, fonte = cache.iterar(SQL)
+    assert headers_paginados == headers
+    assert fonte(0, 10) + fonte(10, 1000) == tuplas
+    faltas = consultas.faltas
+    assert fonte(0, 10) == tuplas[:10]
+    assert consultas.faltas == faltas
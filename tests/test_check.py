@@ -0,0 +1,53 @@
+"""Testes da checagem de empréstimos (teca.check)."""
+
+from teca import check
+from teca import database
+
+
+def _emprestimo_por_objetos(usuario, livro):
+    """check.emprestimo anterior, carregando as relações como objetos."""
+    emprestimos = usuario.emprestimos
+    extra = usuario.extra
+    disponiveis = livro.disponiveis
+    if disponiveis <= 0:
+        return False, "indisponível"
+    elif extra is None:
+        return False, "corrompidos"
+    elif len(emprestimos) >= extra.livros_max:
+        return False, "limite"
+    elif any(livro.isbn == e.isbn for e in emprestimos):
+        return False, "exemplar"
+    elif any(e.vencido for e in emprestimos):
+        return False, "vencido"
+    elif (disponiveis - len(livro.reservas)) <= 0:
+        res = database.Reserva.filter(matricula=usuario.matricula,
+                                      isbn=livro.isbn)
+        if len(res) != 0 and res[0].data_contemplado is not None:
+            return True, "contemplada"
+        return False, "apenas para reservas"
+    return True, "Empréstimo ok"
+
+
+def test_emprestimo_igual_as_consultas_por_objeto(acervo):
+    emprestimos = acervo[database.Emprestimo]
+    livros = acervo[database.Livro]
+    isbns = {e.isbn for e in emprestimos} | \
+        {r.isbn for r in acervo[database.Reserva]}
+    livros = [l for l in livros if l.isbn in isbns][:15] + livros[:5]
+    motivos = set()
+    for usuario in acervo[database.Usuario]:
+        usuario = database.Usuario.select(usuario.matricula)
+        for livro in livros:
+            livro = database.Livro.select(livro.isbn)
+            status, motivo = _emprestimo_por_objetos(usuario, livro)
+            resultado = check.emprestimo(usuario, livro)
+            assert bool(resultado) == status
+            assert motivo in str(resultado)
+            motivos.add(motivo)
+    assert len(motivos) > 1
+
+
+def test_emprestimo_inexistente(acervo):
+    usuario = acervo[database.Usuario][0]
+    livro = database.Livro('0000000000000', 'Inexistente', 2000, 'x', 1, 1)
+    assert not check.emprestimo(usuario, livro)
@@ -0,0 +1,83 @@
+"""Teste de estresse do ORM usado por várias threads ao mesmo tempo.
+
+Usa o SQLite de teca.benchmark no lugar do MySQL, com um pool de
+conexões menor que a quantidade de threads.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from teca import database
+
+THREADS = 16
+RODADAS = 40
+
+
+def _trabalho(indice, usuarios):
+    erros = []
+    for rodada in range(RODADAS):
+        usuario = usuarios[(indice * RODADAS + rodada) % len(usuarios)]
+        lido = database.Usuario.select(usuario.matricula)
+        if lido is None or lido.nome != usuario.nome:
+            erros.append(('select', usuario.matricula, lido))
+        numero = f'8{indice:02d}{rodada:08d}'
+        if not database.Telefones(usuario.matricula, numero).insert():
+            erros.append(('commit', numero))
+        with database.Database.transaction():
+            for sufixo in '01':
+                database.Telefones(usuario.matricula,
+                                   f'9{indice:02d}{rodada:07d}{sufixo}').insert()
+    return erros
+
+
+def test_select_e_commit_em_varias_threads(acervo, banco):
+    banco.pool.timeout = 5
+    usuarios = acervo[database.Usuario]
+    antes = len(database.Telefones.select_all())
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        resultados = list(executor.map(_trabalho, range(THREADS),
+                                       [usuarios] * THREADS))
+        # os workers continuam vivos, mas não retêm conexões
+        assert banco.pool._in_use == 0
+    assert [e for erros in resultados for e in erros] == []
+    depois = len(database.Telefones.select_all())
+    assert depois - antes == THREADS * RODADAS * 3
+    assert len(banco.pool._idle) <= banco.pool.size
+
+
+def test_threads_ociosas_nao_esgotam_o_pool(acervo, banco):
+    banco.pool.timeout = 2
+    usuario = acervo[database.Usuario][0]
+    barreira = threading.Barrier(banco.pool.size * 2 + 1, timeout=10)
+    lidos = []
+
+    def ocioso():
+        lidos.append(database.Usuario.select(usuario.matricula))
+        barreira.wait()  # a thread segue viva sem usar o banco
+        barreira.wait()
+
+    threads = [threading.Thread(target=ocioso)
+               for _ in range(banco.pool.size * 2)]
+    for t in threads:
+        t.start()
+    barreira.wait()
+    try:
+        assert database.Usuario.select(usuario.matricula) is not None
+        assert len(lidos) == len(threads)
+    finally:
+        barreira.wait()
+        for t in threads:
+            t.join()
+
+
+def test_conexao_perdida_na_transacao_dispara_erro(acervo, banco):
+    usuario = acervo[database.Usuario][0]
+    antes = len(database.Telefones.filter(matricula=usuario.matricula))
+    with pytest.raises(Exception):
+        with database.Database.transaction() as db:
+            database.Telefones(usuario.matricula, '85900000001').insert()
+            db._thread.conn.conn.close()  # a conexão cai
+            database.Telefones(usuario.matricula, '85900000002').insert()
+    depois = len(database.Telefones.filter(matricula=usuario.matricula))
+    assert depois == antes
+    assert banco.pool._in_use == 0
@@ -0,0 +1,369 @@
+"""Testes do ORM de teca.database sobre o SQLite."""
+
+from datetime import datetime
+import pytest
+from teca import database
+
+
+def _telefones(n, matricula=100001):
+    return [database.Telefones(matricula, f'859{i:08d}') for i in range(n)]
+
+
+def test_insert_many_marca_objetos_como_salvos(acervo):
+    telefones = _telefones(3)
+    assert database.Telefones.insert_many(telefones) == []
+    assert all(t.dirty() == [] for t in telefones)
+    usuario = acervo[database.Usuario][0]
+    novo = database.Usuario(*[999999] + list(usuario)[1:])
+    novo.nickname = 'novo'
+    database.Usuario.insert_many([novo])
+    novo.nome = 'Outro Nome'
+    assert novo.dirty() == ['nome']
+
+
+def test_insert_many_reporta_falhas_fora_de_transacao(acervo):
+    database.Telefones.insert_many(_telefones(2))
+    repetidos = _telefones(4)
+    falhas = database.Telefones.insert_many(repetidos, chunk_size=2)
+    assert falhas == [repetidos[:2]]
+    assert len(database.Telefones.filter(matricula=100001)) == 4
+
+
+def test_insert_many_desfaz_a_transacao(acervo):
+    usuario = acervo[database.Usuario][0]
+    database.Telefones.insert_many(_telefones(2, usuario.matricula))
+    antes = database.Telefones.filter(matricula=usuario.matricula)
+    repetidos = _telefones(6, usuario.matricula)
+    with pytest.raises(database.BulkInsertError) as erro:
+        with database.Database.transaction():
+            usuario.nome = 'Não Salvo'
+            usuario.update()
+            database.Telefones.insert_many(repetidos[2:], chunk_size=2)
+            database.Telefones.insert_many(repetidos, chunk_size=2)
+    assert erro.value.failures == [repetidos[:2]]
+    salvos = database.Telefones.filter(matricula=usuario.matricula)
+    assert len(salvos) == len(antes)
+    assert database.Usuario.select(usuario.matricula).nome != 'Não Salvo'
+
+
+def _buscar_fulltext(monkeypatch, fulltext):
+    """Substitui a busca MATCH ... AGAINST, que o SQLite não possui."""
+    original = database.Tabela._search_substring.__func__
+
+    def search_substring(cls, string, attrs, limit, use_fulltext):
+        if use_fulltext:
+            return fulltext(cls)
+        return original(cls, string, attrs, limit, use_fulltext)
+
+    monkeypatch.setattr(database.Tabela, '_search_substring',
+                        classmethod(search_substring))
+    monkeypatch.setattr(database.Database.connect(), 'use_fulltext', True)
+
+
+def test_search_completa_fulltext_com_like(acervo, monkeypatch):
+    usuarios = acervo[database.Usuario]
+    alvo = usuarios[0]
+    trecho = alvo.nome.split()[0][1:4].lower()  # meio de palavra
+    esperados = {u.matricula for u in usuarios
+                 if trecho in u.nome.lower()}
+    outro = next(u for u in usuarios if u.matricula not in esperados)
+    _buscar_fulltext(monkeypatch, lambda cls: [cls.select(outro.matricula)])
+    encontrados = database.Usuario.search(trecho, ['nome'], limit=1000)
+    matriculas = [u.matricula for u in encontrados]
+    assert matriculas[0] == outro.matricula
+    assert set(matriculas[1:]) == esperados
+    assert len(matriculas) == len(set(matriculas))
+
+
+def test_search_sem_indice_fulltext_usa_like(acervo, monkeypatch):
+    chamadas = []
+
+    def sem_indice(cls):
+        chamadas.append(cls)
+        raise database.DatabaseError(
+            msg="Can't find FULLTEXT index matching the column list",
+            errno=database.ER_FT_MATCHING_KEY_NOT_FOUND)
+
+    _buscar_fulltext(monkeypatch, sem_indice)
+    livro = acervo[database.Livro][0]
+    palavra = livro.titulo.split()[0]
+    for _ in range(2):
+        encontrados = database.Livro.search(palavra, ['titulo'])
+        assert livro.isbn in {l.isbn for l in encontrados}
+    assert chamadas == [database.Livro]
+
+
+def test_tupla_compacta_e_copia_na_escrita(acervo):
+    usuario = database.Usuario.select(acervo[database.Usuario][0].matricula)
+    assert not hasattr(usuario, '__dict__')
+    assert isinstance(usuario._values, tuple) and usuario._old is None
+    nome = usuario.nome
+    usuario.nome = 'Outro Nome'
+    assert usuario.old['nome'] == nome
+    assert usuario.nome == 'Outro Nome'
+    usuario.update()
+    assert usuario._old is None
+    assert database.Usuario.select(usuario.matricula).nome == 'Outro Nome'
+
+
+class Consultas(object):
+
+    """Registra o SQL das consultas feitas durante um bloco with."""
+
+    def __init__(self):
+        self.sql = []
+        self.parametros = []
+
+    def before(self, evento):
+        pass
+
+    def after(self, evento):
+        self.sql.append(evento.sql)
+        self.parametros.append(evento.arity)
+
+    def __enter__(self):
+        database.instrument(self)
+        return self
+
+    def __exit__(self, *exc):
+        database.remove_instrument(self)
+
+    @property
+    def updates(self):
+        return [s for s in self.sql if s.startswith('UPDATE')]
+
+
+def _sql_externo(sql, params):
+    """Escrita feita fora do ORM, como por outro cliente."""
+    database.Database.connect().commit(sql, params)
+
+
+def test_update_escreve_apenas_colunas_alteradas(acervo):
+    usuario = database.Usuario.select(acervo[database.Usuario][0].matricula)
+    with Consultas() as consultas:
+        assert usuario.update()
+    assert consultas.sql == []
+
+    _sql_externo('UPDATE usuario SET endereco = %s WHERE matricula = %s',
+                 ('Rua Externa, 1', usuario.matricula))
+    usuario.nome = 'Nome Alterado'
+    with Consultas() as consultas:
+        assert usuario.update()
+    update, = consultas.updates
+    assert 'nome' in update and 'endereco' not in update
+    salvo = database.Usuario.select(usuario.matricula)
+    assert (salvo.nome, salvo.endereco) == ('Nome Alterado', 'Rua Externa, 1')
+
+
+def test_update_many_agrupa_por_colunas_alteradas(acervo):
+    matriculas = [u.matricula for u in acervo[database.Usuario][:7]]
+    usuarios = [database.Usuario.select(m) for m in matriculas]
+    _sql_externo('UPDATE usuario SET endereco = %s, nome = %s '
+                 'WHERE matricula = %s', ('Rua Externa, 2', 'Externo',
+                                         matriculas[0]))
+    for u in usuarios[:3]:
+        u.nickname = f'nick{u.matricula}'
+    for u in usuarios[3:5]:
+        u.nickname = f'outro{u.matricula}'
+        u.permissao = 'bibliotecario'
+    usuarios[5].permissao = 'administrador'
+    with Consultas() as consultas:
+        assert database.Usuario.update_many(usuarios, chunk_size=2) == []
+    # nickname: 2 blocos; nickname e permissao: 1; permissao: 1
+    assert len(consultas.updates) == 4
+    assert all('endereco' not in s and 'nome' not in s
+               for s in consultas.updates)
+    assert all(u.dirty() == [] for u in usuarios)
+    salvos = database.Usuario.select_many(matriculas)
+    for u in usuarios:
+        salvo = salvos[u.matricula]
+        assert (salvo.nickname, salvo.permissao) == (u.nickname, u.permissao)
+    assert (salvos[matriculas[0]].nome,
+            salvos[matriculas[0]].endereco) == ('Externo', 'Rua Externa, 2')
+
+
+def test_update_many_chave_composta(acervo):
+    reservas = acervo[database.Reserva][:4]
+    chaves = [(r.matricula, r.isbn) for r in reservas]
+    reservas = [database.Reserva.select(k) for k in chaves]
+    contemplado = datetime(2030, 1, 2, 3, 4, 5)
+    for r in reservas[:3]:
+        r.data_contemplado = contemplado
+    telefone = database.Telefones.filter(
+        matricula=acervo[database.Telefones][0].matricula)[0]
+    antigo = telefone.numero
+    telefone.numero = '85900001111'
+    with Consultas() as consultas:
+        assert database.Reserva.update_many(reservas) == []
+        assert database.Telefones.update_many([telefone]) == []
+    atualizacao, troca_de_chave = consultas.updates
+    assert atualizacao.count('CASE') == 1
+    assert 'WHERE (matricula, isbn) IN' in atualizacao
+    salvas = [database.Reserva.select(k) for k in chaves]
+    assert [str(r.data_contemplado) for r in salvas[:3]] == \
+        [str(contemplado)] * 3
+    assert salvas[3].data_contemplado == reservas[3].data_contemplado
+    assert 'CASE' not in troca_de_chave
+    assert database.Telefones.select((telefone.matricula, antigo)) is None
+    assert database.Telefones.select((telefone.matricula, '85900001111'))
+
+
+def test_identity_map_reaproveita_e_invalida(acervo):
+    matricula = acervo[database.Usuario][0].matricula
+    outro = acervo[database.Usuario][1].matricula
+    with database.identity_map() as mapa:
+        with Consultas() as consultas:
+            usuario = database.Usuario.select(matricula)
+            assert database.Usuario.select(str(matricula)) is usuario
+        assert len(consultas.sql) == 1 and mapa.hits == 1
+
+        usuario.nome = 'Nome Novo'
+        usuario.update()
+        with Consultas() as consultas:
+            relido = database.Usuario.select(matricula)
+        assert len(consultas.sql) == 1
+        assert relido is not usuario and relido.nome == 'Nome Novo'
+
+        telefone = acervo[database.Telefones][0]
+        chave = (telefone.matricula, telefone.numero)
+        database.Telefones.select(chave).delete()
+        assert database.Telefones.select(chave) is None
+
+        database.Usuario.select(outro)
+        database.notify_write(database.Usuario, 'update')  # SQL puro
+        assert mapa.get('usuario', outro) is None
+        database.Usuario.select(outro)
+        with pytest.raises(RuntimeError):
+            with database.Database.transaction():
+                raise RuntimeError
+        assert len(mapa) == 0
+
+    with Consultas() as consultas:
+        database.Usuario.select(matricula)
+        database.Usuario.select(matricula)
+    assert len(consultas.sql) == 2
+
+
+def test_prefetch_uma_consulta_por_relacionamento(acervo):
+    livros = database.Livro.select_all()
+    esperados = {l.isbn: ([a.cpf for a in l.related('autores')],
+                          l.related('categoria'))
+                 for l in database.Livro.select_all()}
+    with Consultas() as consultas:
+        database.Livro.prefetch(livros, 'autores', 'categoria')
+    assert len(consultas.sql) == 2
+    with Consultas() as consultas:
+        for livro in livros:
+            autores, categoria = esperados[livro.isbn]
+            assert sorted(a.cpf for a in livro.related('autores')) == \
+                sorted(autores)
+            assert (livro.related('categoria') and
+                    livro.related('categoria').cod_categoria) == \
+                (categoria and categoria.cod_categoria)
+    assert consultas.sql == []
+
+
+def test_prefetch_vazio_e_um_para_um(acervo):
+    emprestimos = database.Emprestimo.select_all()
+    database.Emprestimo.prefetch(emprestimos, 'livro')
+    assert all(e.related('livro').isbn == e.isbn for e in emprestimos)
+
+    com_telefone = {t.matricula for t in acervo[database.Telefones]}
+    usuarios = [database.Usuario(*u) for u in acervo[database.Usuario]]
+    sem_telefone = [u for u in usuarios if u.matricula not in com_telefone]
+    assert sem_telefone
+    usuarios.append(None)
+    database.Usuario.prefetch(usuarios, 'telefones')
+    with Consultas() as consultas:
+        assert all(u.related('telefones') == [] for u in sem_telefone)
+    assert consultas.sql == []
+    assert database.Usuario.prefetch([None], 'telefones') == []
+
+
+def test_select_many_chave_simples(acervo, monkeypatch):
+    matriculas = [u.matricula for u in acervo[database.Usuario][:5]]
+    with Consultas() as consultas:
+        encontrados = database.Usuario.select_many(
+            matriculas + [matriculas[0], 999999])
+    assert consultas.parametros == [8]  # 6 chaves distintas -> 8
+    assert sorted(encontrados) == sorted(matriculas)
+    assert all(encontrados[m].matricula == m for m in matriculas)
+    assert database.Usuario.select_many([]) == {}
+
+    monkeypatch.setattr(database.Tabela, 'in_chunk_size', 4)
+    with Consultas() as consultas:
+        encontrados = database.Usuario.select_many(matriculas)
+    assert consultas.parametros == [4, 1]
+    assert len(encontrados) == 5
+
+
+def test_select_many_chave_composta(acervo):
+    chaves = [(e.matricula, e.isbn) for e in acervo[database.Emprestimo][:3]]
+    with Consultas() as consultas:
+        encontrados = database.Emprestimo.select_many(
+            chaves + [(999999, '0000000000000')])
+    assert consultas.parametros == [8]  # 4 pares de valores
+    assert '(matricula, isbn) IN' in consultas.sql[0]
+    assert sorted(encontrados) == sorted(chaves)
+
+
+def test_select_many_no_identity_map(acervo):
+    matriculas = [u.matricula for u in acervo[database.Usuario][:4]]
+    with database.identity_map():
+        carregado = database.Usuario.select(matriculas[0])
+        with Consultas() as consultas:
+            encontrados = database.Usuario.select_many(matriculas)
+        assert consultas.parametros == [4]  # 3 chaves -> 4
+        assert encontrados[matriculas[0]] is carregado
+        with Consultas() as consultas:
+            database.Usuario.select_many(matriculas)
+        assert consultas.sql == []
+
+
+def test_colunas_adiadas_carregadas_no_primeiro_acesso(acervo):
+    matricula = acervo[database.Usuario][0].matricula
+    usuario = database.Usuario.select(matricula)
+    indice = database.Usuario._columns.index('senha_hash')
+    assert usuario._values[indice] is database.DEFERRED
+    with Consultas() as consultas:
+        senha_hash = usuario.senha_hash
+        usuario.endereco
+    assert len(consultas.sql) == 1
+    assert 'senha_hash' in consultas.sql[0] and 'nome' not in consultas.sql[0]
+    assert senha_hash == acervo[database.Usuario][0].senha_hash
+
+    with pytest.raises(ValueError):
+        database.Usuario.select(matricula, columns=['inexistente'])
+
+
+def test_undefer_em_lote(acervo):
+    usuarios = database.Usuario.select_all(columns=['nome'])
+    tipo = database.Usuario._columns.index('tipo')
+    assert all(u._values[tipo] is database.DEFERRED for u in usuarios)
+    with Consultas() as consultas:
+        database.Usuario.undefer(usuarios)
+    assert len(consultas.sql) == 1
+    with Consultas() as consultas:
+        for usuario, original in zip(sorted(usuarios,
+                                            key=lambda u: u.matricula),
+                                     sorted(acervo[database.Usuario],
+                                            key=lambda u: u.matricula)):
+            assert list(usuario) == list(original)
+    assert consultas.sql == []
+
+
+def test_alterar_coluna_adiada_sem_carregar(acervo):
+    matricula = acervo[database.Usuario][0].matricula
+    usuario = database.Usuario.select(matricula)
+    usuario.endereco = 'Rua Nova, 10'
+    assert usuario.dirty() == ['endereco']
+    with Consultas() as consultas:
+        assert usuario.update()
+    assert len(consultas.updates) == 1
+    assert database.Usuario.select(matricula).endereco == 'Rua Nova, 10'
+
+    removido = database.Usuario.select(acervo[database.Usuario][1].matricula)
+    _sql_externo('DELETE FROM usuario WHERE matricula = %s',
+                 (removido.matricula,))
+    with pytest.raises(LookupError):
+        removido.senha_hash
@@ -0,0 +1,33 @@
+"""Testes do índice de busca em memória (teca.indice)."""
+
+import pytest
+from teca import database
+from teca import indice
+
+
+@pytest.fixture
+def indices(acervo):
+    indice.ativar()
+    try:
+        yield acervo
+    finally:
+        indice.desativar()
+
+
+def test_search_retorna_copias(indices):
+    livro = indices[database.Livro][0]
+    encontrado, = database.Livro.search(livro.isbn, ['titulo'])
+    titulo = encontrado.titulo
+    encontrado.titulo = 'Alterado sem update'
+    de_novo, = database.Livro.search(livro.isbn, ['titulo'])
+    assert de_novo.titulo == titulo
+    assert de_novo is not encontrado
+
+
+def test_update_reindexa(indices):
+    usuario = indices[database.Usuario][1]
+    encontrado, = database.Usuario.search(str(usuario.matricula), ['nome'])
+    encontrado.nome = 'Zacarias Quintino'
+    encontrado.update()
+    nomes = [u.nome for u in database.Usuario.search('zacarias', ['nome'])]
+    assert nomes == ['Zacarias Quintino']
@@ -0,0 +1,39 @@
+"""Testes da instrumentação de consultas (teca.instrumentacao)."""
+
+import pytest
+from teca import database
+from teca import instrumentacao
+
+
+@pytest.fixture
+def instrumentado(acervo):
+    instrumentacao.ativar(limite=3)
+    try:
+        yield acervo
+    finally:
+        instrumentacao.desativar()
+
+
+def test_detecta_n_mais_1(instrumentado, capsys):
+    with instrumentacao.acao('Consultar livros'):
+        for livro in database.Livro.select_all()[:5]:
+            livro.related('autores')
+    nome, fingerprint, origem = instrumentacao.detector.avisos[0]
+    assert nome == 'Consultar livros' and origem == 'Livro.related'
+    assert 'possível N+1' in capsys.readouterr().out
+    assert len(instrumentacao.detector.avisos) == 1
+
+
+def test_prefetch_nao_gera_aviso(instrumentado):
+    with instrumentacao.acao('Consultar livros'):
+        livros = database.Livro.prefetch(database.Livro.select_all(),
+                                         'autores')
+        for livro in livros:
+            livro.related('autores')
+    assert instrumentacao.detector.avisos == []
+    assert instrumentacao.estatisticas.total > 0
+
+
+def test_acao_sem_instrumentacao():
+    with instrumentacao.acao('Qualquer'):
+        pass
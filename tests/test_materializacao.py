@@ -0,0 +1,109 @@
+"""Testes das tabelas de resumo (teca.materializacao)."""
+
+from datetime import datetime
+import pytest
+from mysql.connector import DatabaseError
+from teca import database
+from teca import fila
+from teca import materializacao
+
+
+CONSISTENTE = {'faltando': [], 'sobrando': [], 'divergentes': []}
+
+
+@pytest.fixture
+def resumos(acervo):
+    materializacao.reconstruir()
+    assert materializacao.ativar()
+    try:
+        yield acervo
+    finally:
+        materializacao.desativar()
+
+
+def _consistente():
+    return all(r == CONSISTENTE for r in materializacao.verificar().values())
+
+
+def test_reconstruir(acervo):
+    quantidades = materializacao.reconstruir()
+    assert quantidades['resumo_livro_autores'] == len(acervo[database.Livro])
+    assert quantidades['resumo_reserva_livro'] == \
+        len(acervo[database.Reserva])
+    assert _consistente()
+
+
+def test_escritas_do_orm_sincronizam(resumos):
+    livro = database.Livro.select(resumos[database.Livro][0].isbn)
+    livro.titulo = 'Título Novo'
+    livro.update()
+    vinculo = resumos[database.AutorLivro][0]
+    vinculo.delete()
+    autor = database.Autor.select(resumos[database.Autor][1].cpf)
+    autor.nome = 'Autor Renomeado'
+    autor.update()
+    usuario = database.Usuario.select(resumos[database.Reserva][0].matricula)
+    usuario.nome = 'Nome Novo'
+    usuario.update()
+    database.Reserva(usuario.matricula, livro.isbn,
+                     datetime.now().replace(microsecond=0), None).insert()
+    assert _consistente()
+    fila.andar()
+    assert _consistente()
+    assert materializacao.origem('view_reserva_livro') == \
+        'resumo_reserva_livro'
+
+
+def test_rollback_desfaz_o_resumo(resumos):
+    livro = database.Livro.select(resumos[database.Livro][0].isbn)
+    with pytest.raises(RuntimeError):
+        with database.Database.transaction():
+            livro.titulo = 'Desfeito'
+            livro.update()
+            raise RuntimeError
+    assert _consistente()
+    assert materializacao.ResumoLivroAutores.select(livro.isbn).titulo != \
+        'Desfeito'
+
+
+def test_verificar_aponta_divergencias(resumos):
+    livro = resumos[database.Livro][0]
+    materializacao.desativar()
+    database.Livro.select(livro.isbn).delete()
+    resultado = materializacao.verificar()
+    assert resultado['resumo_livro_autores']['sobrando'] == [(livro.isbn,)]
+    assert materializacao.origem('view_livro_autores') == 'view_livro_autores'
+
+
+def _falhar(*args, **kwargs):
+    raise DatabaseError(msg='falha no recálculo')
+
+
+def test_falha_no_recalculo_desfaz_a_transacao(resumos, monkeypatch):
+    livro = database.Livro.select(resumos[database.Livro][0].isbn)
+    titulo = livro.titulo
+    monkeypatch.setattr(materializacao.ResumoLivroAutores, 'calcular',
+                        classmethod(_falhar))
+    with pytest.raises(DatabaseError):
+        with database.Database.transaction():
+            livro.titulo = 'Não Salvo'
+            livro.update()
+    monkeypatch.undo()
+    assert database.Livro.select(livro.isbn).titulo == titulo
+    assert materializacao.ResumoLivroAutores.select(livro.isbn) is not None
+    assert _consistente()
+    assert materializacao.ativa()
+
+
+def test_falha_fora_de_transacao_marca_desatualizado(resumos, monkeypatch):
+    livro = database.Livro.select(resumos[database.Livro][0].isbn)
+    monkeypatch.setattr(materializacao.ResumoLivroAutores, 'calcular',
+                        classmethod(_falhar))
+    livro.titulo = 'Salvo'
+    assert livro.update()
+    monkeypatch.undo()
+    assert materializacao.ResumoLivroAutores.select(livro.isbn) is not None
+    assert not materializacao.ativa()
+    assert materializacao.origem('view_livro_autores') == 'view_livro_autores'
+    materializacao.reconstruir()
+    assert materializacao.ativa() and _consistente()
@@ -0,0 +1,86 @@
+"""Testes da sessão de login (teca.sessao)."""
+
+import datetime
+from teca import database
+from teca.sessao import Sessao
+
+
+class Contador(object):
+
+    def __init__(self):
+        self.total = 0
+
+    def before(self, evento):
+        pass
+
+    def after(self, evento):
+        self.total += 1
+
+
+def _contar(funcao):
+    contador = database.instrument(Contador())
+    try:
+        funcao()
+    finally:
+        database.remove_instrument(contador)
+    return contador.total
+
+
+def _usuario(acervo, permissao, tipo=None, com_emprestimos=False):
+    emprestimos = {e.matricula for e in acervo[database.Emprestimo]}
+    return next(u for u in acervo[database.Usuario]
+                if u.permissao == permissao and tipo in (None, u.tipo) and
+                (not com_emprestimos or u.matricula in emprestimos))
+
+
+def test_perfil_igual_as_consultas_separadas(acervo):
+    for tipo in ('aluno', 'professor', 'funcionario'):
+        esperado = _usuario(acervo, 'usuario', tipo)
+        usuario, extra, curso = database.Usuario.perfil(esperado.matricula)
+        assert list(usuario) == \
+            list(database.Usuario.select(usuario.matricula))
+        assert list(extra) == list(esperado.extra)
+        cod_curso = getattr(extra, 'cod_curso', None)
+        assert (curso and curso.cod_curso) == cod_curso
+
+
+def test_administrador_nao_carrega_circulacao(acervo):
+    administrador = _usuario(acervo, 'administrador')
+    sessao = Sessao(administrador)
+    assert _contar(sessao.abrir) == 1
+    try:
+        assert _contar(lambda: (sessao.usuario, sessao.extra,
+                                sessao.curso)) == 0
+        assert sessao.recargas['emprestimos'] == 0
+    finally:
+        sessao.fechar()
+
+
+def test_usuario_carrega_tudo_em_duas_consultas(acervo):
+    usuario = _usuario(acervo, 'usuario', com_emprestimos=True)
+    with Sessao(usuario) as sessao:
+        assert sessao.recargas == dict.fromkeys(sessao.recargas, 1)
+
+        def ler():
+            for emprestimo in sessao.emprestimos:
+                emprestimo.livro.titulo
+            for reserva in sessao.reservas:
+                reserva.livro.titulo
+            sessao.usuario, sessao.extra, sessao.curso
+
+        assert _contar(ler) == 0
+        esperados = database.Emprestimo.filter(matricula=usuario.matricula)
+        assert sorted(e.isbn for e in sessao.emprestimos) == \
+            sorted(e.isbn for e in esperados)
+        esperadas = database.Reserva.filter(matricula=usuario.matricula)
+        assert sorted(r.isbn for r in sessao.reservas) == \
+            sorted(r.isbn for r in esperadas)
+
+        livro = next(l for l in acervo[database.Livro]
+                     if l.isbn not in {e.isbn for e in sessao.emprestimos})
+        hoje = datetime.date.today()
+        database.Emprestimo(usuario.matricula, livro.isbn, hoje,
+                            hoje + datetime.timedelta(days=15)).insert()
+        assert _contar(lambda: sessao.emprestimos) == 1
+        assert livro.isbn in {e.isbn for e in sessao.emprestimos}
+        assert _contar(lambda: sessao.usuario) == 0
@@ -0,0 +1,91 @@
+"""Testes do Paginador de tabelas do terminal (teca.term)."""
+
+import builtins
+from teca import database
+from teca import term
+
+
+class Fonte(object):
+
+    """Fonte de tuplas que registra as leituras (inicio, quantidade)."""
+
+    def __init__(self, n):
+        self.n = n
+        self.leituras = []
+
+    def __call__(self, inicio, quantidade):
+        self.leituras.append((inicio, quantidade))
+        fim = min(self.n, inicio + quantidade)
+        return [[i, f'linha {i}'] for i in range(inicio, fim)]
+
+
+def test_paginas_lidas_sob_demanda():
+    fonte = Fonte(95)
+    paginador = term.Paginador(['n', 'texto'], fonte, larguras=[3, 10],
+                               tamanho=10, paginas_em_cache=2)
+    assert [l[0] for l in paginador.pagina(0)] == list(range(10))
+    assert fonte.leituras == [(0, 11)]  # uma tupla à frente
+    assert paginador.ultima is None
+    assert paginador.pagina(1)[0][0] == 10
+    assert paginador.pagina(0)[0][0] == 0  # no cache
+    assert paginador.pagina(9)[-1][0] == 94
+    assert paginador.ultima == 9
+    assert len(fonte.leituras) == 3
+    assert paginador.pagina(1)[0][0] == 10  # fora do cache: relida
+    assert fonte.leituras[-1] == (10, 11)
+
+
+def test_larguras_pela_amostra():
+    fonte = Fonte(3)
+    paginador = term.Paginador(['n', 'texto'], fonte)
+    paginador.pagina(0)
+    assert paginador.larguras == [1, 7]
+    assert paginador.ultima == 0
+    assert fonte.leituras == [(0, term.LINHAS_AMOSTRA)]
+    assert paginador._celula('x' * 20, 5) == 'xxxx…'
+    assert paginador._celula(7, 3) == '  7'
+
+
+def test_exibir_sem_terminal(capsys, monkeypatch):
+    monkeypatch.setattr(term, 'LINHAS_POR_BLOCO', 100)
+    fonte = Fonte(250)
+    term.paginar(['n', 'texto'], fonte, larguras=[3, 9], interativo=False)
+    linhas = capsys.readouterr().out.splitlines()
+    assert len(linhas) == 250 + 4
+    assert linhas[3].split('|')[1].strip() == '0'
+    assert linhas[-2].split('|')[2].strip() == 'linha 249'
+    assert all(n <= term.LINHAS_POR_BLOCO for _, n in fonte.leituras)
+
+
+def test_exibir_navegacao(capsys, monkeypatch):
+    fonte = Fonte(45)
+    lidas_antes_de_perguntar = []
+
+    def responder(prompt, respostas=iter(['n', 'n', 'p', 'x', 'q'])):
+        lidas_antes_de_perguntar.append(len(fonte.leituras))
+        return next(respostas)
+
+    monkeypatch.setattr(builtins, 'input', responder)
+    paginador = term.Paginador(['n', 'texto'], fonte, tamanho=20)
+    paginador.exibir(interativo=True)
+    saida = capsys.readouterr().out
+    linhas = saida.splitlines()
+    primeiras = [linhas[i + 1].split('|')[1].strip()
+                 for i, linha in enumerate(linhas) if linha.startswith('|-')]
+    assert primeiras == ['0', '20', '40', '20', '20']
+    assert 'Opção inválida' in saida
+    assert lidas_antes_de_perguntar == [1, 2, 3, 3, 3]
+
+
+def test_imprimir_tabela_oculta_senha(acervo, capsys):
+    term.imprimir_tabela(database.Usuario)
+    linhas = capsys.readouterr().out.splitlines()
+    assert len(linhas) == len(acervo[database.Usuario]) + 4
+    assert all('***SECRET***' in l for l in linhas[3:-1])
+
+
+def test_select_page(acervo):
+    livros = sorted(l.isbn for l in acervo[database.Livro])
+    paginas = [database.Livro.select_page(i, 30) for i in range(0, 90, 30)]
+    assert [l.isbn for p in paginas for l in p] == livros
+    assert len(paginas[-1]) == len(livros) - 60